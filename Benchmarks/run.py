@@ -0,0 +1,112 @@
+'''
+Benchmarks for the toolpath pipeline, run from the add-in folder without Fusion:
+    python -m Benchmarks.run -o results.json
+
+Each synthetic seat from Benchmarks.seats is run through every stage of the pipeline
+and the fastest time of each stage over the repeats is written as JSON, so the results
+of different versions can be compared.  The ordering stage makes the same passes on every
+run, so keep --tour-passes the same between runs.
+'''
+import argparse
+import io
+import json
+import platform
+import sys
+import time
+
+from Modules import fabmo, gcode, toolpath, tour
+from Modules.polyline import chainPolyLines
+
+from . import seats
+
+# The stages in the order they run.
+STAGES = ('stroking', 'chaining', 'simplifying', 'ordering', 'arc_fitting', 'depth_expansion', 'emission', 'multipart_encoding')
+
+def run_seat(curves, settings):
+    '''
+    Run the curves of a seat through the pipeline once.  Returns the time of each stage
+    in seconds and the counts of what was produced.
+    '''
+    times = {}
+    counts = {'curves': len(curves)}
+
+    def stage(name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        times[name] = time.perf_counter() - start
+        return result
+
+    polylines = stage('stroking', lambda: [seats.stroke_curve(curve, settings.stroke_tolerance) for curve in curves])
+    counts['points'] = sum(poly.pointCount() for poly in polylines)
+    polylines = stage('chaining', chainPolyLines, polylines, settings.chain_tolerance)
+    counts['polylines'] = len(polylines)
+    polylines = stage('simplifying', toolpath.simplify_polylines, polylines, settings)
+    counts['simplified_points'] = sum(poly.pointCount() for poly in polylines)
+    path = stage('ordering', toolpath.order_polylines, polylines, settings)
+    moves = stage('arc_fitting', toolpath.toolpath_moves, path, settings)
+    lines = stage('depth_expansion', lambda: list(gcode.iter_program(moves, settings.cutting_depths, settings.retract_height,
+                                                                     settings.feed_rate, settings.depth_strategy, settings.ramp_entry)))
+    counts['lines'] = len(lines)
+    text = stage('emission', gcode.program_to_string, lines)
+    counts['bytes'] = len(text)
+    (contentType, body) = stage('multipart_encoding', lambda: fabmo.MultipartFormdataEncoder().encode([('key', 'benchmark'), ('index', 0)],
+                                                                                                      [('file', 'stool.nc', io.BytesIO(text.encode('utf-8')))]))
+    counts['upload_bytes'] = len(body)
+    counts['rapid_input'] = path.rapid_input
+    counts['rapid_before'] = path.rapid_before
+    counts['rapid_after'] = path.rapid_after
+    return (times, counts)
+
+def run(names, seed=1, repeat=3, settings=None):
+    '''
+    Benchmark the named seats and return the results as a dictionary.
+    '''
+    settings = settings or toolpath.ToolpathSettings()
+    results = {}
+    for name in names:
+        best = {}
+        for attempt in range(repeat):
+            # Create the seat each time since the pipeline changes the polylines.
+            (times, counts) = run_seat(seats.make_seat(name, seed), settings)
+            for (stage, seconds) in times.items():
+                best[stage] = min(seconds, best.get(stage, seconds))
+        results[name] = {'stages': {stage: best[stage] for stage in STAGES}, 'total': sum(best.values()), 'counts': counts}
+
+    return {
+        'seed': seed,
+        'repeat': repeat,
+        'settings': vars(settings),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seats': results,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m Benchmarks.run', description='Benchmark the toolpath pipeline on synthetic seats.')
+    parser.add_argument('seats', nargs='*', help='seats to run, from {} (all of them by default)'.format(', '.join(sorted(seats.SEATS))))
+    parser.add_argument('-o', '--output', help='JSON file to write the results to')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the seats')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs, the fastest time of each stage is kept')
+    parser.add_argument('--tour-passes', type=int, default=tour.MAX_PASSES, help='largest number of passes made to improve the cutting order')
+    args = parser.parse_args(argv)
+    for name in args.seats:
+        if name not in seats.SEATS:
+            parser.error('unknown seat: {}'.format(name))
+
+    names = args.seats or sorted(seats.SEATS)
+    results = run(names, args.seed, args.repeat, toolpath.ToolpathSettings(tour_max_passes=args.tour_passes))
+
+    for name in names:
+        seat = results['seats'][name]
+        print('{:<12} {:8.3f} s  {:>6} points  {:>8} bytes'.format(name, seat['total'], seat['counts']['points'], seat['counts']['bytes']))
+        for stage in STAGES:
+            print('    {:<20} {:8.4f} s'.format(stage, seat['stages'][stage]))
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+'''
+Synthetic seats for the benchmarks.  Each generator follows the geometry of the matching
+design command in StoolDesign.py, using the largest count sliders and a seeded random
+generator so every run creates the same seat.
+
+A seat is a list of curves, which stand in for the sketch curves in Fusion:
+    ('line', (x0, y0), (x1, y1))
+    ('circle', (cx, cy), radius)
+    ('spline', points, closed)      a curve through the points, like a fitted spline
+stroke_curve turns a curve into a polyLine the way CurveEvaluator3D.getStrokes does in Fusion.
+'''
+import math
+import random
+
+from Modules.polyline import polyLine
+
+# The same seat size as the add-in, in centimeters.
+SEAT_WIDTH = 21
+SEAT_HEIGHT = 41
+MIN_SIZE = 1 * 2.54
+
+def mesh_seat(rng, xNum=10, yNum=20, borderSize=1.0):
+    # The Mesh design with random points and the edges maintained.
+    widthSize = (SEAT_WIDTH - (borderSize * 2)) / xNum
+    heightSize = (SEAT_HEIGHT - (borderSize * 2)) / yNum
+    points = [[None] * (xNum + 1) for y in range(yNum + 1)]
+    for yPnt in range(yNum + 1):
+        for xPnt in range(xNum + 1):
+            x = xPnt * widthSize + (rng.random() * (widthSize * (2/3))) - (widthSize * (1/3)) + borderSize
+            y = yPnt * heightSize + (rng.random() * (heightSize * (2/3))) - (heightSize * (1/3)) + borderSize
+            if yPnt == 0:
+                y = borderSize - 0.5
+            elif yPnt == yNum:
+                y = SEAT_HEIGHT - borderSize + 0.5
+            if xPnt == 0:
+                x = borderSize - 0.5
+            elif xPnt == xNum:
+                x = SEAT_WIDTH - borderSize + 0.5
+            points[yPnt][xPnt] = (x, y)
+
+    curves = []
+    for yIndex in range(1, yNum):
+        row = points[yIndex] if yIndex % 2 else list(reversed(points[yIndex]))
+        curves.extend(('line', row[i-1], row[i]) for i in range(1, len(row)))
+    for xIndex in range(1, xNum):
+        column = [points[yIndex][xIndex] for yIndex in range(yNum + 1)]
+        if not xIndex % 2:
+            column.reverse()
+        curves.extend(('line', column[i-1], column[i]) for i in range(1, len(column)))
+    return curves
+
+def circles_seat(rng, numCircles=30, maxSize=0.2, borderWidth=1.0):
+    # The Circles design without overlap, giving up on a circle after 50 tries like the add-in.
+    maxDia = (SEAT_WIDTH * 0.8 * maxSize) + 2
+    circles = []
+    for i in range(numCircles):
+        for tryCount in range(50):
+            newDia = rng.random() * (maxDia - MIN_SIZE) + MIN_SIZE
+            x = (rng.random() * (SEAT_WIDTH - newDia - (borderWidth*2))) + borderWidth + (newDia/2.0)
+            y = (rng.random() * (SEAT_HEIGHT - newDia - (borderWidth*2))) + borderWidth + (newDia/2.0)
+            if all(math.hypot(x - cx, y - cy) > radius + newDia/2 + borderWidth for (kind, (cx, cy), radius) in circles):
+                circles.append(('circle', (x, y), newDia / 2))
+                break
+        else:
+            break
+    return circles
+
+def rectangles_seat(rng, numRectangles=20, borderWidth=1.0):
+    # The Rectangles design without overlap.  The add-in keeps trying forever, this gives up after 1000 tries.
+    rects = []
+    for i in range(numRectangles):
+        for tryCount in range(1000):
+            newWidth = max(rng.random() * (SEAT_WIDTH / 4), MIN_SIZE)
+            newHeight = max(rng.random() * (SEAT_HEIGHT / 2), MIN_SIZE)
+            x = (rng.random() * (SEAT_WIDTH - newWidth - (borderWidth*2))) + borderWidth
+            y = (rng.random() * (SEAT_HEIGHT - newHeight - (borderWidth*2))) + borderWidth
+            rect = (x, y, x + newWidth, y + newHeight)
+            if not any(rect[0] <= other[2] and other[0] <= rect[2] and rect[1] <= other[3] and other[1] <= rect[3] for other in rects):
+                rects.append(rect)
+                break
+
+    curves = []
+    for (x0, y0, x1, y1) in rects:
+        corners = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+        curves.extend(('line', corners[i-1], corners[i]) for i in range(4))
+    return curves
+
+def flower_seat(rng, petalSides=10, petalCount=20, petalSizeRatio=1.0):
+    # The Flower design, with the rest of the sliders picked at random.
+    petalSize = ((SEAT_WIDTH * 0.4 - 2) * petalSizeRatio + 2) / 2.0
+    yPetalCenterOffset = 2 * petalSize * rng.random() - petalSize
+    xPetalCenterOffset = 2 * petalSize * rng.random() - petalSize
+    xOffset = (SEAT_WIDTH - petalSize * 5) * rng.random() + petalSize * 2.5
+    yOffset = (SEAT_HEIGHT - petalSize * 5) * rng.random() + petalSize * 2.5
+
+    curves = []
+    for i in range(petalCount):
+        rotation = i * ((math.pi*2)/petalCount)
+        (cos, sin) = (math.cos(rotation), math.sin(rotation))
+        poly = []
+        for j in range(petalSides):
+            angle = j * ((math.pi*2)/petalSides)
+            x = (petalSize * math.cos(angle)) - petalSize + yPetalCenterOffset
+            y = (petalSize * math.sin(angle)) + xPetalCenterOffset
+            poly.append((x * cos - y * sin + xOffset, x * sin + y * cos + yOffset))
+        curves.extend(('line', poly[j-1], poly[j]) for j in range(petalSides))
+    return curves
+
+def sin_curves_seat(rng, count=5, frequency=10, amplitude=0.4):
+    # Several Sin Curve designs side by side, each a fitted spline.
+    curves = []
+    for k in range(count):
+        yOffset = SEAT_WIDTH * (k + 0.5 + 0.2 * (rng.random() - 0.5)) / count
+        scale = amplitude * (SEAT_WIDTH * 0.5) / count
+        pntsPerFrequency = 4
+        points = []
+        for i in range(frequency * pntsPerFrequency + 1):
+            angle = i * math.pi / (pntsPerFrequency / 2)
+            points.append((math.sin(angle) * scale + yOffset, i * SEAT_HEIGHT / (frequency * pntsPerFrequency)))
+        curves.append(('spline', points, False))
+    return curves
+
+def text_seat(rng, rows=12, columns=10, height=2.5):
+    # Large sketch text.  There aren't any fonts without Fusion, so each character is one or
+    # two closed blobs with about as many control points as a glyph outline.
+    curves = []
+    width = SEAT_WIDTH / columns
+    pitch = SEAT_HEIGHT / rows
+    for row in range(rows):
+        for column in range(columns):
+            (cx, cy) = ((column + 0.5) * width, (row + 0.5) * pitch)
+            for contour in range(rng.choice((1, 1, 2))):
+                radius = height * (0.35 if contour == 0 else 0.15)
+                count = rng.randint(8, 16)
+                points = []
+                for i in range(count):
+                    angle = 2 * math.pi * i / count
+                    r = radius * (0.6 + 0.4 * rng.random())
+                    points.append((cx + r * math.cos(angle) * width / height, cy + r * math.sin(angle)))
+                curves.append(('spline', points, True))
+    return curves
+
+# The seats that are benchmarked, by name.
+SEATS = {
+    'mesh': mesh_seat,
+    'circles': circles_seat,
+    'rectangles': rectangles_seat,
+    'flower': flower_seat,
+    'sin_curves': sin_curves_seat,
+    'text': text_seat,
+}
+
+def make_seat(name, seed):
+    '''
+    Return the curves of a seat, always the same for the same name and seed.
+    '''
+    return SEATS[name](random.Random(seed))
+
+def stroke_curve(curve, tolerance):
+    '''
+    Return a polyLine within tolerance of the curve.
+    '''
+    kind = curve[0]
+    if kind == 'line':
+        return polyLine([curve[1], curve[2]])
+    if kind == 'circle':
+        ((cx, cy), radius) = (curve[1], curve[2])
+        count = _segment_count(radius, 2 * math.pi, tolerance)
+        poly = polyLine([(cx + radius * math.cos(2 * math.pi * i / count), cy + radius * math.sin(2 * math.pi * i / count)) for i in range(count + 1)])
+        poly.arcCenter = (cx, cy)
+        return poly
+    return polyLine(_stroke_spline(curve[1], curve[2], tolerance))
+
+def _segment_count(radius, angle, tolerance):
+    if tolerance >= radius:
+        return 4
+    return max(4, int(math.ceil(angle / (2 * math.acos(1 - tolerance / radius)))))
+
+def _stroke_spline(points, closed, tolerance):
+    # A Catmull-Rom spline through the points, with each span split so the sag stays near the tolerance.
+    count = len(points)
+    if closed:
+        spans = [(points[i-1], points[i], points[(i+1) % count], points[(i+2) % count]) for i in range(count)]
+    else:
+        padded = [points[0]] + list(points) + [points[-1]]
+        spans = [tuple(padded[i:i+4]) for i in range(count - 1)]
+
+    stroked = [spans[0][1]]
+    for (p0, p1, p2, p3) in spans:
+        length = math.hypot(p2[0] - p1[0], p2[1] - p1[1])
+        steps = max(1, int(math.ceil(math.sqrt(length / (8 * tolerance)))))
+        for step in range(1, steps + 1):
+            t = step / steps
+            (t2, t3) = (t * t, t * t * t)
+            stroked.append(tuple(0.5 * ((2 * p1[k]) + (-p0[k] + p2[k]) * t + (2*p0[k] - 5*p1[k] + 4*p2[k] - p3[k]) * t2 +
+                                        (-p0[k] + 3*p1[k] - 3*p2[k] + p3[k]) * t3) for k in range(2)))
+    return stroked
@@ -0,0 +1,191 @@
+'''
+An opt-in profiler for the Fusion API calls made by the add-in.
+Every call into the API is a round trip out of Python, so previews that make thousands
+of small calls get slow as the slider values grow.  The Profiler replaces the adsk module
+and the application objects in the add-in's globals with proxies that time every call,
+property get and property set, and attributes them to the event handler that was running
+and the line of the add-in that made them.  Objects returned by the API are wrapped too,
+and proxies are unwrapped again before they're passed back to the API.
+'''
+import inspect
+import os
+import sys
+import time
+
+class Profiler:
+    '''
+    Collects the call counts and times.  report_file is written with the report after
+    each handler runs and when the profiler is uninstalled.
+    '''
+    def __init__(self, report_file=None, top=30):
+        self.report_file = report_file
+        self.top = top
+        self.handler = '(add-in)'
+        self.sites = {}         # (handler, api, site) -> [calls, seconds]
+        self.handlers = {}      # handler -> [runs, seconds, api calls, api seconds]
+        self._saved = {}
+        self._patched = []
+
+    def install(self, namespace, handler_classes, names=('adsk', '_app', '_ui')):
+        '''
+        Replace the named globals in namespace with proxies and time the notify method of each handler class.
+        '''
+        for name in names:
+            if name in namespace and name not in self._saved:
+                self._saved[name] = namespace[name]
+                namespace[name] = ProfilingProxy(namespace[name], self, name)
+        self._namespace = namespace
+        for cls in handler_classes:
+            notify = cls.__dict__.get('notify')
+            if notify:
+                self._patched.append((cls, notify))
+                cls.notify = self._wrap_handler(cls.__name__, notify)
+
+    def uninstall(self):
+        '''
+        Put back the original globals and handler methods, then write the report.
+        '''
+        for (name, value) in self._saved.items():
+            self._namespace[name] = value
+        for (cls, notify) in self._patched:
+            cls.notify = notify
+        self._saved = {}
+        self._patched = []
+        self.write_report()
+
+    def record(self, api, seconds, depth):
+        # depth is the number of frames between this and the code that called the API.
+        frame = sys._getframe(depth + 1)
+        site = '{}:{}'.format(os.path.basename(frame.f_code.co_filename), frame.f_lineno)
+        entry = self.sites.setdefault((self.handler, api, site), [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        totals = self.handlers.setdefault(self.handler, [0, 0.0, 0, 0.0])
+        totals[2] += 1
+        totals[3] += seconds
+
+    def report(self):
+        '''
+        Return the report as text: the totals for each handler followed by the hottest call sites.
+        '''
+        lines = ['{:<50} {:>6} {:>10} {:>10} {:>10}'.format('Handler', 'Runs', 'Time (s)', 'API calls', 'API (s)')]
+        for (handler, (runs, seconds, calls, api_seconds)) in sorted(self.handlers.items(), key=lambda item: -item[1][3]):
+            lines.append('{:<50} {:>6} {:>10.3f} {:>10} {:>10.3f}'.format(handler, runs, seconds, calls, api_seconds))
+        lines.append('')
+        lines.append('Hottest call sites')
+        lines.append('{:>10} {:>8} {:>10}  {:<40} {:<22} {}'.format('Time (s)', 'Calls', 'Each (ms)', 'API', 'Site', 'Handler'))
+        hottest = sorted(self.sites.items(), key=lambda item: -item[1][1])[:self.top]
+        for ((handler, api, site), (calls, seconds)) in hottest:
+            lines.append('{:>10.3f} {:>8} {:>10.4f}  {:<40} {:<22} {}'.format(seconds, calls, 1000 * seconds / calls, api, site, handler))
+        return '\n'.join(lines)
+
+    def write_report(self):
+        if self.report_file:
+            os.makedirs(os.path.dirname(self.report_file) or '.', exist_ok=True)
+            with open(self.report_file, 'w') as fp:
+                fp.write(self.report() + '\n')
+
+    def _wrap_handler(self, name, notify):
+        profiler = self
+        def profiled_notify(handler, args):
+            previous = profiler.handler
+            profiler.handler = name
+            start = time.perf_counter()
+            try:
+                return notify(handler, args)
+            finally:
+                totals = profiler.handlers.setdefault(name, [0, 0.0, 0, 0.0])
+                totals[0] += 1
+                totals[1] += time.perf_counter() - start
+                profiler.handler = previous
+                profiler.write_report()
+        return profiled_notify
+
+class ProfilingProxy:
+    '''
+    Wraps a module, class or API object so the use of it is timed by a Profiler.
+    '''
+    __slots__ = ('_target', '_profiler', '_name', '_timed')
+
+    def __init__(self, target, profiler, name):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_profiler', profiler)
+        object.__setattr__(self, '_name', name)
+        # Looking things up in modules and classes doesn't leave Python, so only objects are timed.
+        object.__setattr__(self, '_timed', not (inspect.ismodule(target) or isinstance(target, type)))
+
+    def __getattr__(self, name):
+        target = self._target
+        if self._timed:
+            start = time.perf_counter()
+            value = getattr(target, name)
+            if not callable(value):
+                self._profiler.record('get ' + _type_name(target) + '.' + name, time.perf_counter() - start, 1)
+        else:
+            value = getattr(target, name)
+        if callable(value) and not isinstance(value, type):
+            return ProfilingProxy(value, self._profiler, _type_name(target) + '.' + name)
+        return _wrap(value, self._profiler, name)
+
+    def __setattr__(self, name, value):
+        start = time.perf_counter()
+        setattr(self._target, name, _unwrap(value))
+        self._profiler.record('set ' + _type_name(self._target) + '.' + name, time.perf_counter() - start, 1)
+
+    def __call__(self, *args, **kwargs):
+        args = [_unwrap(arg) for arg in args]
+        kwargs = {key: _unwrap(value) for (key, value) in kwargs.items()}
+        start = time.perf_counter()
+        result = self._target(*args, **kwargs)
+        self._profiler.record(self._name, time.perf_counter() - start, 1)
+        return _wrap(result, self._profiler, self._name)
+
+    def __iter__(self):
+        for item in self._target:
+            yield _wrap(item, self._profiler, self._name)
+
+    def __getitem__(self, index):
+        return _wrap(self._target[_unwrap(index)], self._profiler, self._name)
+
+    def __len__(self):
+        return len(self._target)
+
+    def __bool__(self):
+        return bool(self._target)
+
+    def __eq__(self, other):
+        return self._target == _unwrap(other)
+
+    def __ne__(self, other):
+        return self._target != _unwrap(other)
+
+    def __hash__(self):
+        return hash(self._target)
+
+    def __repr__(self):
+        return repr(self._target)
+
+    def __str__(self):
+        return str(self._target)
+
+def _type_name(target):
+    if inspect.ismodule(target) or isinstance(target, type):
+        return target.__name__
+    return type(target).__name__
+
+def _wrap(value, profiler, name):
+    # Only Fusion objects are wrapped, plain Python values are returned as they are.
+    if isinstance(value, (tuple, list)):
+        return type(value)(_wrap(item, profiler, name) for item in value)
+    module = getattr(type(value), '__module__', '') or ''
+    if (module.startswith('adsk') or (inspect.ismodule(value) and value.__name__.startswith('adsk'))
+            or (isinstance(value, type) and value.__module__.startswith('adsk'))):
+        return ProfilingProxy(value, profiler, name)
+    return value
+
+def _unwrap(value):
+    if isinstance(value, ProfilingProxy):
+        return object.__getattribute__(value, '_target')
+    if isinstance(value, (tuple, list)):
+        return type(value)(_unwrap(item) for item in value)
+    return value
@@ -0,0 +1,133 @@
+'''
+Arc fitting for the toolpath pipeline.
+A path is a list of (x, y) points.  The fitted result is a list of moves where the
+first entry is the start point, line moves are (x, y) and arc moves are
+(x, y, i, j, ccw), with (i, j) the arc center relative to the start of the arc.
+'''
+import math
+
+# Arcs larger than this radius (in centimeters) are left as lines.
+MAX_RADIUS = 1000.0
+
+def fit_arcs(points, tolerance, chord_tolerance=None):
+    '''
+    Replace runs of points that lie on a circular arc with arc moves.
+    Every original point is within tolerance of the fitted arc.  The arc can't be farther
+    than chord_tolerance (by default the same as tolerance) from any of the original lines,
+    so polygons whose corners happen to lie on a circle are kept as lines.  For points that
+    were stroked from a curve, chord_tolerance should be the stroking tolerance.
+    '''
+    chord_tolerance = chord_tolerance or tolerance
+    count = len(points)
+    if count < 3:
+        return list(points)
+
+    moves = [points[0]]
+    start = 0
+    while start < count - 1:
+        # Find the longest run from start that fits an arc, growing by doubling
+        # and then narrowing down with a binary search.
+        best = None
+        step = 2
+        end = start + step
+        while end < count:
+            fit = _fit(points, start, end, tolerance, chord_tolerance)
+            if not fit:
+                break
+            best = (end, fit)
+            step *= 2
+            end = start + step
+        if best:
+            (low, high) = (best[0], min(start + step, count - 1) + 1)
+            while high - low > 1:
+                middle = (low + high) // 2
+                fit = _fit(points, start, middle, tolerance, chord_tolerance)
+                if fit:
+                    best = (middle, fit)
+                    low = middle
+                else:
+                    high = middle
+
+        if best:
+            (end, (cx, cy, ccw)) = best
+            (x, y) = points[start]
+            moves.append((points[end][0], points[end][1], cx - x, cy - y, ccw))
+            start = end
+        else:
+            start += 1
+            moves.append(points[start])
+    return moves
+
+def circle_moves(points, center):
+    '''
+    Return the moves for a path that is exactly a circle or an arc about center, such as a stroked
+    sketch circle.  The direction is taken from the first segment of the points.  Full circles are
+    cut as two half circles.
+    '''
+    if len(points) < 2:
+        return list(points)
+    (cx, cy) = center
+    start = points[0]
+    end = points[-1]
+    ccw = (start[0] - cx) * (points[1][1] - start[1]) - (start[1] - cy) * (points[1][0] - start[0]) > 0
+    moves = [start]
+    if math.hypot(end[0] - start[0], end[1] - start[1]) < 1e-9:
+        opposite = (2 * cx - start[0], 2 * cy - start[1])
+        moves.append((opposite[0], opposite[1], cx - start[0], cy - start[1], ccw))
+        moves.append((start[0], start[1], cx - opposite[0], cy - opposite[1], ccw))
+    else:
+        moves.append((end[0], end[1], cx - start[0], cy - start[1], ccw))
+    return moves
+
+def _circle(p1, p2, p3):
+    # Center of the circle through three points, None if they're collinear.
+    (ax, ay) = (p1[0], p1[1])
+    (bx, by) = (p2[0] - ax, p2[1] - ay)
+    (cx, cy) = (p3[0] - ax, p3[1] - ay)
+    d = 2 * (bx * cy - by * cx)
+    if abs(d) < 1e-12:
+        return None
+    b2 = bx * bx + by * by
+    c2 = cx * cx + cy * cy
+    ux = (cy * b2 - by * c2) / d
+    uy = (bx * c2 - cx * b2) / d
+    return (ax + ux, ay + uy)
+
+def _fit(points, start, end, tolerance, chord_tolerance):
+    # Returns (cx, cy, ccw) if points[start:end+1] fit an arc, otherwise None.
+    center = _circle(points[start], points[(start + end) // 2], points[end])
+    if center is None:
+        return None
+    (cx, cy) = center
+    radius = math.hypot(points[start][0] - cx, points[start][1] - cy)
+    if radius > MAX_RADIUS:
+        return None
+
+    # The largest angle a chord can span while staying within tolerance of the arc.
+    if chord_tolerance >= radius:
+        max_step = math.pi
+    else:
+        max_step = 2 * math.acos(1 - chord_tolerance / radius)
+
+    direction = 0
+    swept = 0.0
+    last_angle = math.atan2(points[start][1] - cy, points[start][0] - cx)
+    for i in range(start + 1, end + 1):
+        (x, y) = (points[i][0], points[i][1])
+        if abs(math.hypot(x - cx, y - cy) - radius) > tolerance:
+            return None
+        angle = math.atan2(y - cy, x - cx)
+        delta = (angle - last_angle + math.pi) % (2 * math.pi) - math.pi
+        if delta == 0 or abs(delta) > max_step:
+            return None
+        sign = 1 if delta > 0 else -1
+        if direction and sign != direction:
+            return None
+        direction = sign
+        swept += abs(delta)
+        last_angle = angle
+
+    # A full circle needs more than one arc.
+    if swept >= 2 * math.pi - 1e-6:
+        return None
+    return (cx, cy, direction > 0)
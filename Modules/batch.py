@@ -0,0 +1,137 @@
+'''
+Generates many seats at once, each from a design spec, for production runs.
+The seats are posted in parallel by a pool of processes, each to its own .nc file, and
+a manifest.json lists every seat with its spec and statistics in the order they were given.
+The same specs and settings always give the same files, since every design is seeded and
+the cutting order is improved for a fixed number of passes instead of for a fixed time.
+
+Run it from the add-in folder with a JSON list of specs like the ones saved with the sketches:
+    python -m Modules.batch seats.json -o out -j 4
+or make variants of one design with consecutive seeds:
+    python -m Modules.batch --design circles count=40 border=1 --seed 100 --count 24 -o out
+'''
+import argparse
+import concurrent.futures
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+
+from . import designs, gcode, simulator, toolpath
+
+class Seat:
+    '''
+    A seat to generate: a designs.Design and the name of its files.
+    '''
+    def __init__(self, design, name=None):
+        self.design = design
+        self.name = name
+
+def load_specs(fp):
+    '''
+    Return the seats in a JSON list of specs.  Each spec has the design, seed and params of a
+    designs.Design spec, and optionally a name for its file.
+    '''
+    seats = []
+    for (index, spec) in enumerate(json.load(fp)):
+        if 'design' not in spec or 'seed' not in spec:
+            raise ValueError('Spec {} needs a design and a seed'.format(index + 1))
+        seats.append(Seat(designs.Design(spec['design'], spec['seed'], spec.get('params', {})), spec.get('name')))
+    return seats
+
+def variants(name, params, seed, count):
+    '''
+    Return count seats of the named design with the same values and consecutive seeds.
+    '''
+    return [Seat(designs.Design(name, seed + index, params)) for index in range(count)]
+
+def run_batch(seats, directory, settings=None, workers=None):
+    '''
+    Post the seats to .nc files in directory and write the manifest.  workers is the number
+    of processes, None for one per CPU and 1 to post them in this process.  Returns the
+    manifest as a dictionary.
+    '''
+    settings = settings or toolpath.ToolpathSettings()
+    os.makedirs(directory, exist_ok=True)
+    jobs = [(seat.design.spec(), os.path.join(directory, _file_name(index, seat)), vars(settings)) for (index, seat) in enumerate(seats)]
+    if workers == 1 or len(jobs) <= 1:
+        results = [post_seat(job) for job in jobs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(post_seat, jobs))
+
+    manifest = {'version': designs.SPEC_VERSION, 'settings': vars(settings), 'seats': results}
+    with open(os.path.join(directory, 'manifest.json'), 'w') as fp:
+        json.dump(manifest, fp, indent=2, sort_keys=True)
+    return manifest
+
+def post_seat(job):
+    '''
+    Post one seat and return its manifest entry.  job is (spec, filename, settings) so it
+    can be sent to another process.
+    '''
+    (spec, filename, settings) = job
+    design = designs.Design.from_spec(spec)
+    settings = toolpath.ToolpathSettings(**settings)
+    buffer = io.StringIO()
+    path = toolpath.write_gcode(buffer, design.polylines(settings.stroke_tolerance), settings)
+    text = buffer.getvalue()
+    with open(filename, 'w', newline='') as fp:
+        fp.write(text)
+
+    estimate = simulator.simulate(io.StringIO(text))
+    return {
+        'file': os.path.basename(filename),
+        'spec': json.loads(spec),
+        'sha256': hashlib.sha256(text.encode('utf-8')).hexdigest(),
+        'bytes': len(text),
+        'shapes': len(design.geometry),
+        'polylines': len(path.polylines),
+        'rapid_input': gcode.to_inches(path.rapid_input),
+        'rapid_before': gcode.to_inches(path.rapid_before),
+        'rapid_after': gcode.to_inches(path.rapid_after),
+        'retracts': path.program.retracts,
+        'tour_timed_out': path.tour_timed_out,
+        'estimated_seconds': round(estimate.total_time, 1),
+    }
+
+def _file_name(index, seat):
+    if seat.name:
+        return '{:03d}-{}.nc'.format(index + 1, re.sub(r'[^\w.-]+', '_', seat.name))
+    return '{:03d}-{}-{}.nc'.format(index + 1, seat.design.name, seat.design.seed)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m Modules.batch', description='Generate and post many seats in parallel.')
+    parser.add_argument('inputs', nargs='*', metavar='specs | name=value',
+                        help='JSON file with a list of seat specs, or the values of --design that differ from the dialog defaults')
+    parser.add_argument('--design', help='make variants of this design instead, from {}'.format(', '.join(sorted(designs.GENERATORS))))
+    parser.add_argument('--seed', type=int, default=1, help='seed of the first variant')
+    parser.add_argument('--count', type=int, default=10, help='number of variants')
+    parser.add_argument('-o', '--output', default='seats', help='folder to write the .nc files and manifest.json to')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of processes, one per CPU by default')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.design:
+            if args.design not in designs.GENERATORS:
+                parser.error('--design must be one of {}'.format(', '.join(sorted(designs.GENERATORS))))
+            seats = variants(args.design, designs.parse_params(args.design, args.inputs), args.seed, args.count)
+        elif len(args.inputs) == 1:
+            with open(args.inputs[0]) as fp:
+                seats = load_specs(fp)
+        else:
+            parser.error('give one specs file or --design')
+    except ValueError as error:
+        parser.error(str(error))
+
+    manifest = run_batch(seats, args.output, workers=args.jobs)
+    for seat in manifest['seats']:
+        print('{:<32} {:>5} polylines  {:>8} bytes  {}'.format(seat['file'], seat['polylines'], seat['bytes'],
+                                                              simulator.format_time(seat['estimated_seconds'])))
+    print('{} seats written to {}'.format(len(manifest['seats']), args.output))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
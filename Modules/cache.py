@@ -0,0 +1,166 @@
+'''
+A small on-disk cache for posted g-code, keyed by a hash of everything that went into it.
+Each entry is the g-code in a .nc file along with a .json file of information about it.
+The least recently used entries are removed once there are more than max_entries.
+'''
+import hashlib
+import json
+import os
+
+# Change this whenever the g-code written for the same inputs changes, so old entries aren't used.
+CACHE_VERSION = 5
+
+def make_key(*parts):
+    '''
+    Return the sha256 hex digest of the parts, which can be anything that can be written as JSON.
+    '''
+    digest = hashlib.sha256(str(CACHE_VERSION).encode('ascii'))
+    for part in parts:
+        digest.update(b'\0')
+        digest.update(json.dumps(part, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+    return digest.hexdigest()
+
+class GCodeCache:
+    '''
+    A directory of cached programs.  The directory is created when the first entry is stored.
+    '''
+    def __init__(self, directory, max_entries=20):
+        self.directory = directory
+        self.max_entries = max_entries
+
+    def get(self, key):
+        '''
+        Return (gcode, info) for the key, or None if it isn't in the cache.
+        '''
+        (program, details) = self._paths(key)
+        try:
+            with open(details) as fp:
+                info = json.load(fp)
+            with open(program) as fp:
+                gcode = fp.read()
+        except (OSError, ValueError):
+            return None
+
+        # Mark the entry as recently used.
+        try:
+            os.utime(details, None)
+        except OSError:
+            pass
+        return (gcode, info)
+
+    def put(self, key, gcode, info=None):
+        '''
+        Store the g-code and a dictionary of information about it, then remove old entries.
+        '''
+        entry = self.writer(key)
+        entry.write(gcode)
+        entry.finish(info)
+
+    def writer(self, key, out=None):
+        '''
+        Return an EntryWriter that stores the g-code written to it under the key, and also
+        writes it to the text file object out, so a program can be cached as it's written.
+        '''
+        os.makedirs(self.directory, exist_ok=True)
+        return EntryWriter(self, key, out)
+
+    def clear(self):
+        '''
+        Remove every entry.
+        '''
+        for key in self._keys():
+            self._remove(key)
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return (base + '.nc', base + '.json')
+
+    def _keys(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [name[:-5] for name in names if name.endswith('.json')]
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        keys = self._keys()
+        if len(keys) <= self.max_entries:
+            return
+        used = {}
+        for key in keys:
+            try:
+                used[key] = os.path.getmtime(self._paths(key)[1])
+            except OSError:
+                used[key] = 0
+        keys.sort(key=lambda key: used[key])
+        for key in keys[:len(keys) - self.max_entries]:
+            self._remove(key)
+
+class EntryWriter:
+    '''
+    A text file object for the g-code of a new cache entry.  The g-code goes to a temporary
+    file, and to out if it's given, and finish stores it with its information.  If the
+    temporary file can't be written, the g-code still goes to out, and finish raises the error.
+    '''
+    def __init__(self, cache, key, out=None):
+        self.cache = cache
+        self.out = out
+        (self.program, self.details) = cache._paths(key)
+        self.error = None
+        self.fp = open(self.program + '.tmp', 'w')
+
+    def write(self, text):
+        if self.out is not None:
+            self.out.write(text)
+        if self.error is None:
+            try:
+                self.fp.write(text)
+            except OSError as error:
+                # Like a full disk.  The program is still written out.
+                self.error = error
+                self.discard()
+        return len(text)
+
+    def finish(self, info=None):
+        '''
+        Store the entry, then remove old entries.  Nothing is stored if it fails.
+        '''
+        if self.error is not None:
+            raise self.error
+        # Write to temporary files first so a partly written entry is never read.  The
+        # information is written last since its existence is what marks a complete entry.
+        try:
+            self.fp.close()
+            os.replace(self.program + '.tmp', self.program)
+            with open(self.details + '.tmp', 'w') as fp:
+                json.dump(info or {}, fp)
+            os.replace(self.details + '.tmp', self.details)
+        except:
+            self.discard()
+            for path in (self.program, self.details + '.tmp'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            raise
+        self.cache._evict()
+
+    def discard(self):
+        '''
+        Drop the entry, for when the g-code couldn't be finished.
+        '''
+        try:
+            self.fp.close()
+        except OSError:
+            pass
+        try:
+            os.remove(self.program + '.tmp')
+        except OSError:
+            pass
@@ -0,0 +1,426 @@
+'''
+The geometry of the seat designs, computed without Fusion so it can be cached and reused.
+Each generator takes the values from its dialog and a seed, and always returns the same
+geometry for the same values and seed.  The geometry is a tuple of shapes:
+    ('polyline', points, closed)    connected lines through the points
+    ('rectangle', (x0, y0), (x1, y1))
+    ('circle', (cx, cy), radius)
+    ('spline', points, closed)      a fitted spline through the points
+The geometry can go straight into the toolpath pipeline, so a seat can also be posted
+from the command line without Fusion:
+    python -m Modules.designs circles count=40 border=1 --seed 7 -o seat.nc
+'''
+import argparse
+import functools
+import inspect
+import json
+import math
+import random
+import sys
+import time
+
+from . import instrument, placement, readers
+from .polyline import polyLine
+
+# The number of computed designs that are kept.
+CACHE_SIZE = 32
+
+# Version of the design specs, changed when a generator gives different geometry for the same values.
+SPEC_VERSION = 1
+
+# The size of the seat and the smallest shape, in centimeters.
+SEAT_WIDTH = 21
+SEAT_HEIGHT = 41
+MIN_SIZE = 1 * 2.54
+
+def mesh(seed, x_num=4, y_num=8, width=SEAT_WIDTH, height=SEAT_HEIGHT, border=0.0, is_random=True, maintain_edges=True):
+    '''
+    A grid of x_num by y_num cells with the points moved at random, drawn as rows and columns
+    of connected lines.  With maintain_edges the outside points are moved just past the border.
+    '''
+    rng = random.Random(seed)
+    width_size = (width - (border * 2)) / x_num
+    height_size = (height - (border * 2)) / y_num
+
+    points = [[None] * (x_num + 1) for y in range(y_num + 1)]
+    for y_pnt in range(y_num + 1):
+        for x_pnt in range(x_num + 1):
+            x = x_pnt * width_size
+            y = y_pnt * height_size
+            if is_random:
+                x = x + (rng.random() * (width_size * (2/3))) - (width_size * (1/3)) + border
+                y = y + (rng.random() * (height_size * (2/3))) - (height_size * (1/3)) + border
+            if maintain_edges:
+                if y_pnt == 0:
+                    y = border - 0.5
+                elif y_pnt == y_num:
+                    y = height - border + 0.5
+                if x_pnt == 0:
+                    x = border - 0.5
+                elif x_pnt == x_num:
+                    x = width - border + 0.5
+            points[y_pnt][x_pnt] = (x, y)
+
+    # The rows and columns go back and forth so each starts where the last one ended.
+    shapes = []
+    for y_index in range(1, y_num):
+        row = points[y_index] if y_index % 2 else points[y_index][::-1]
+        shapes.append(('polyline', tuple(row), False))
+    for x_index in range(1, x_num):
+        column = [points[y_index][x_index] for y_index in range(y_num + 1)]
+        if not x_index % 2:
+            column.reverse()
+        shapes.append(('polyline', tuple(column), False))
+    return tuple(shapes)
+
+def flower(seed, petal_sides=5, petal_size=0.25, petal_count=5, center_x=0.5, center_y=0.5, position_x=0.0, position_y=0.0,
+           width=SEAT_WIDTH, height=SEAT_HEIGHT):
+    '''
+    petal_count polygons with petal_sides sides rotated around a point.  The sizes and
+    positions are the slider values as fractions from 0 to 1.  The flower isn't random,
+    so the seed is ignored.
+    '''
+    size = ((width * 0.4 - 2) * petal_size + 2) / 2.0
+    y_petal_offset = 2 * size * center_y - size
+    x_petal_offset = 2 * size * center_x - size
+    x_offset = (width - size * 5) * position_x + size * 2.5
+    y_offset = (height - size * 5) * position_y + size * 2.5
+
+    shapes = []
+    for i in range(petal_count):
+        rotation = i * ((math.pi*2)/petal_count)
+        (cos, sin) = (math.cos(rotation), math.sin(rotation))
+        poly = []
+        for j in range(petal_sides):
+            angle = j * ((math.pi*2)/petal_sides)
+            x = (size * math.cos(angle)) - size + y_petal_offset
+            y = (size * math.sin(angle)) + x_petal_offset
+            poly.append((x * cos - y * sin + x_offset, x * sin + y * cos + y_offset))
+        shapes.append(('polyline', tuple(poly), True))
+    return tuple(shapes)
+
+def circles(seed, count=10, max_diameter=14.6, min_diameter=MIN_SIZE, width=SEAT_WIDTH, height=SEAT_HEIGHT, border=0.0, allow_overlap=False):
+    '''
+    Up to count circles placed at random, see placement.place_circles.
+    '''
+    placed = placement.place_circles(count, min_diameter, max_diameter, width, height, border, allow_overlap, seed)
+    return tuple(('circle', (x, y), radius) for (x, y, radius) in placed)
+
+def rectangles(seed, count=10, min_size=MIN_SIZE, max_width=SEAT_WIDTH / 4, max_height=SEAT_HEIGHT / 2, width=SEAT_WIDTH, height=SEAT_HEIGHT,
+               border=0.0, allow_overlap=False):
+    '''
+    Up to count rectangles placed at random, see placement.place_rectangles.
+    '''
+    placed = placement.place_rectangles(count, min_size, max_width, max_height, width, height, border, allow_overlap, seed)
+    return tuple(('rectangle', (x0, y0), (x1, y1)) for (x0, y0, x1, y1) in placed)
+
+def sin_curve(seed, frequency=4, amplitude=4.2, offset=10.5, width=SEAT_WIDTH, height=SEAT_HEIGHT):
+    '''
+    A sin curve along the length of the seat through 4 points for each period.  amplitude
+    is the height of the curve and offset its center, both across the width of the seat.
+    The curve isn't random, so the seed is ignored.
+    '''
+    points_per_frequency = 4
+    points = []
+    for i in range(frequency * points_per_frequency + 1):
+        angle = i * math.pi / (points_per_frequency / 2)
+        points.append((math.sin(angle) * amplitude + offset, i * height / (frequency * points_per_frequency)))
+    return (('spline', tuple(points), False),)
+
+# The generators by name.
+GENERATORS = {
+    'mesh': mesh,
+    'flower': flower,
+    'circles': circles,
+    'rectangles': rectangles,
+    'sin_curve': sin_curve,
+}
+
+def generate(name, seed, **params):
+    '''
+    Return the geometry of the named design.  The most recent designs are cached by their
+    name, values and seed, so going back to earlier slider values doesn't compute them again.
+    '''
+    return _generate(name, seed, tuple(sorted(params.items())))
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _generate(name, seed, params):
+    return GENERATORS[name](seed, **dict(params))
+
+class Design:
+    '''
+    A design made by one of the generators.  The name, seed and values are everything needed
+    to make it again, and are saved with the sketch as a spec.
+    '''
+    def __init__(self, name, seed, params):
+        if name not in GENERATORS:
+            raise ValueError('Unknown design: {}'.format(name))
+        self.name = name
+        self.seed = seed
+        self.params = _defaults(name)
+        self.params.update(params)
+
+    @property
+    def geometry(self):
+        return generate(self.name, self.seed, **self.params)
+
+    def spec(self):
+        '''
+        Return the design as a JSON string.
+        '''
+        return json.dumps({'version': SPEC_VERSION, 'design': self.name, 'seed': self.seed, 'params': self.params}, sort_keys=True)
+
+    @classmethod
+    def from_spec(cls, text):
+        '''
+        Return the design saved by spec, or None if it was saved by a different version.
+        '''
+        spec = json.loads(text)
+        if spec.get('version') != SPEC_VERSION:
+            return None
+        return cls(spec['design'], spec['seed'], spec['params'])
+
+    def polylines(self, tolerance=0.005):
+        '''
+        Return the geometry as new polylines for the toolpath pipeline.
+        '''
+        return to_polylines(self.geometry, tolerance)
+
+def to_polylines(geometry, tolerance=0.005):
+    '''
+    Return a polyLine for each shape, with curves turned into lines within tolerance.
+    Circles keep their centers so they can be cut as arcs.
+    '''
+    polylines = []
+    for shape in geometry:
+        kind = shape[0]
+        if kind == 'polyline':
+            points = list(shape[1])
+            if shape[2]:
+                points.append(points[0])
+            poly = polyLine(points)
+        elif kind == 'rectangle':
+            ((x0, y0), (x1, y1)) = (shape[1], shape[2])
+            poly = polyLine([(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)])
+        elif kind == 'circle':
+            ((cx, cy), radius) = (shape[1], shape[2])
+            poly = polyLine(readers.stroke_arc(cx, cy, radius, 0.0, 2 * math.pi, tolerance))
+            poly.arcCenter = (cx, cy)
+        elif kind == 'spline':
+            poly = polyLine(stroke_spline(shape[1], shape[2], tolerance))
+        else:
+            raise ValueError('Unknown shape: {}'.format(kind))
+        polylines.append(poly)
+    return polylines
+
+def stroke_spline(points, closed, tolerance):
+    '''
+    Return points along a cubic spline through the points, spaced so the sag of each line stays
+    near tolerance.  The spline is parameterized by chord length like a fitted spline in Fusion,
+    with natural ends when it's open.  It's very close to the sketch spline, but not identical.
+    '''
+    points = list(points)
+    if closed:
+        # Wrap a few points around each end so the spline is smooth where it closes.
+        wrap = min(3, len(points))
+        points = points[len(points) - wrap:] + points + points[:wrap + 1]
+    else:
+        wrap = 0
+    spans = _spline_spans(points)
+    spans = spans[wrap:len(spans) - wrap]
+
+    stroked = [points[wrap]]
+    for (length, x, y) in spans:
+        steps = max(1, int(math.ceil(math.sqrt(length / (8 * tolerance)))))
+        for step in range(1, steps + 1):
+            t = length * step / steps
+            stroked.append((x[0] + t * (x[1] + t * (x[2] + t * x[3])), y[0] + t * (y[1] + t * (y[2] + t * y[3]))))
+    return stroked
+
+def _spline_spans(points):
+    # Returns (length, x coefficients, y coefficients) for each span of a natural cubic spline.
+    lengths = [max(math.hypot(points[i+1][0] - points[i][0], points[i+1][1] - points[i][1]), 1e-12) for i in range(len(points) - 1)]
+    coefficients = [_natural_cubic(lengths, [point[k] for point in points]) for k in range(2)]
+    return [(lengths[i], coefficients[0][i], coefficients[1][i]) for i in range(len(lengths))]
+
+def _natural_cubic(lengths, values):
+    # Solve the tridiagonal system for the second derivatives, with zero at the ends.
+    count = len(values)
+    second = [0.0] * count
+    if count > 2:
+        (diagonal, right) = ([0.0] * count, [0.0] * count)
+        for i in range(1, count - 1):
+            diagonal[i] = 2 * (lengths[i-1] + lengths[i])
+            right[i] = 6 * ((values[i+1] - values[i]) / lengths[i] - (values[i] - values[i-1]) / lengths[i-1])
+        for i in range(2, count - 1):
+            factor = lengths[i-1] / diagonal[i-1]
+            diagonal[i] -= factor * lengths[i-1]
+            right[i] -= factor * right[i-1]
+        for i in range(count - 2, 0, -1):
+            second[i] = (right[i] - lengths[i] * second[i+1]) / diagonal[i]
+
+    spans = []
+    for i in range(count - 1):
+        h = lengths[i]
+        spans.append((values[i], (values[i+1] - values[i]) / h - h * (2 * second[i] + second[i+1]) / 6,
+                      second[i] / 2, (second[i+1] - second[i]) / (6 * h)))
+    return spans
+
+def outline(geometry, digits=5):
+    '''
+    Return a sorted list that describes the sketch curves the geometry is drawn with: the end
+    points of each line, the center and radius of each circle and the ends of each spline.
+    It's compared with sketch_outline to tell whether a sketch was changed after it was drawn.
+    '''
+    curves = []
+    for shape in geometry:
+        kind = shape[0]
+        if kind in ('polyline', 'rectangle'):
+            if kind == 'rectangle':
+                ((x0, y0), (x1, y1)) = (shape[1], shape[2])
+                (points, closed) = ([(x0, y0), (x1, y0), (x1, y1), (x0, y1)], True)
+            else:
+                (points, closed) = (list(shape[1]), shape[2])
+            if closed:
+                points.append(points[0])
+            curves.extend(_curve_key('line', [points[i-1], points[i]], digits) for i in range(1, len(points)))
+        elif kind == 'circle':
+            curves.append(_curve_key('circle', [shape[1], (shape[2], 0.0)], digits))
+        elif kind == 'spline':
+            curves.append(_curve_key('spline', [shape[1][0], shape[1][-1]], digits))
+    return sorted(curves)
+
+def sketch_outline(curves, digits=5):
+    '''
+    Return the outline of the curves of a sketch, each one of:
+        ('line', start, end)
+        ('circle', point1, point2, point3)    three points on the circle
+        ('spline', start, end)
+    '''
+    outlined = []
+    for curve in curves:
+        if curve[0] == 'circle':
+            (center, radius) = _circumcircle(*curve[1:4])
+            outlined.append(_curve_key('circle', [center, (radius, 0.0)], digits))
+        else:
+            outlined.append(_curve_key(curve[0], [curve[1], curve[2]], digits))
+    return sorted(outlined)
+
+def _curve_key(kind, points, digits):
+    points = [(round(point[0], digits) + 0.0, round(point[1], digits) + 0.0) for point in points]
+    if kind != 'circle':
+        points.sort()
+    return (kind, tuple(points))
+
+def _circumcircle(p1, p2, p3):
+    (ax, ay) = (p2[0] - p1[0], p2[1] - p1[1])
+    (bx, by) = (p3[0] - p1[0], p3[1] - p1[1])
+    d = 2 * (ax * by - ay * bx)
+    if d == 0:
+        return (p1, 0.0)
+    ux = (by * (ax * ax + ay * ay) - ay * (bx * bx + by * by)) / d
+    uy = (ax * (bx * bx + by * by) - bx * (ax * ax + ay * ay)) / d
+    return ((p1[0] + ux, p1[1] + uy), math.hypot(ux, uy))
+
+def new_seed():
+    '''
+    Return a random seed for a design.
+    '''
+    return random.randrange(1 << 31)
+
+class PreviewThrottle:
+    '''
+    Limits how often a preview is drawn while a slider is dragged.  ready returns True when
+    at least interval seconds have passed since the last preview that was drawn.  Otherwise the
+    preview should be skipped, and the caller checks due until it returns True, once there
+    haven't been any previews for interval seconds, and then draws the last values.
+    '''
+    def __init__(self, interval=0.15):
+        self.interval = interval
+        self.last = None
+        self.skipped = None
+
+    def ready(self):
+        now = time.perf_counter()
+        if self.last is None or now - self.last >= self.interval:
+            (self.last, self.skipped) = (now, None)
+            return True
+        self.skipped = now
+        return False
+
+    def due(self):
+        '''
+        Return True if a preview was skipped and the slider has stopped since.
+        '''
+        return self.skipped is not None and time.perf_counter() - self.skipped >= self.interval
+
+    def cancel(self):
+        self.skipped = None
+
+def parse_params(name, values):
+    '''
+    Return the values of a generator from name=value strings, converted to the type of its defaults.
+    '''
+    defaults = _defaults(name)
+    params = {}
+    for value in values:
+        (key, sep, text) = value.partition('=')
+        if not sep or key not in defaults:
+            raise ValueError('{} takes {}'.format(name, ', '.join('{}={}'.format(key, default) for (key, default) in defaults.items())))
+        default = defaults[key]
+        if isinstance(default, bool):
+            params[key] = text.lower() in ('1', 'true', 'yes', 'on')
+        elif isinstance(default, int):
+            params[key] = int(text)
+        else:
+            params[key] = float(text)
+    return params
+
+def _defaults(name):
+    return {param.name: param.default for param in inspect.signature(GENERATORS[name]).parameters.values()
+            if param.default is not inspect.Parameter.empty}
+
+def main(argv=None):
+    from . import toolpath, tour
+
+    parser = argparse.ArgumentParser(prog='python -m Modules.designs', description='Post a seat design straight to g-code, without Fusion.')
+    parser.add_argument('design', nargs='?', help='design to post, from {}'.format(', '.join(sorted(GENERATORS))))
+    parser.add_argument('params', nargs='*', help='name=value for each value that differs from the dialog defaults')
+    parser.add_argument('--seed', type=int, default=None, help='random seed, a new one is picked and printed by default')
+    parser.add_argument('--spec', help='JSON file with a design spec saved from a sketch, instead of design and values')
+    parser.add_argument('-o', '--output', default='seat.nc', help='output .nc file')
+    parser.add_argument('--tour-passes', type=int, default=tour.MAX_PASSES, help='largest number of passes made to improve the cutting order')
+    parser.add_argument('--tour-time', type=float, default=tour.TIME_LIMIT,
+                        help='seconds after which improving the cutting order is stopped, only a safety limit')
+    parser.add_argument('--timing', action='store_true', help='print the time taken by each step')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.spec:
+            with open(args.spec) as fp:
+                design = Design.from_spec(fp.read())
+            if design is None:
+                parser.error('{} was saved by a different version'.format(args.spec))
+        elif args.design in GENERATORS:
+            design = Design(args.design, new_seed() if args.seed is None else args.seed, parse_params(args.design, args.params))
+        else:
+            parser.error('design must be one of {}'.format(', '.join(sorted(GENERATORS))))
+    except ValueError as error:
+        parser.error(str(error))
+
+    settings = toolpath.ToolpathSettings(tour_time_budget=args.tour_time, tour_max_passes=args.tour_passes)
+    timer = instrument.PhaseTimer() if args.timing else None
+    with instrument.phase(timer, 'generating'):
+        polylines = design.polylines(settings.stroke_tolerance)
+    with open(args.output, 'w') as out:
+        path = toolpath.write_gcode(out, polylines, settings, timer)
+    print('{}: {} seed {}, {} shapes, {} polylines'.format(args.output, design.name, design.seed, len(design.geometry), len(path.polylines)))
+    print('    spec {}'.format(design.spec()))
+    if path.tour_timed_out:
+        print('    the cutting order was stopped by --tour-time after {} passes and may differ between runs'.format(path.tour_passes))
+    if timer:
+        print('    ' + timer.summary().replace('\n', '\n    '))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,8 +1,26 @@
+import collections.abc
+import concurrent.futures
 import http.client
 import json
-import io, codecs, mimetypes, sys, uuid
+import io, codecs, mimetypes, select, socket, sys, threading, time, uuid
 import webbrowser
 
+from . import instrument
+
+# Seconds allowed to connect to a tool, and to wait for each read of its response.
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 30.0
+
+# Requests that can be sent again when a kept connection turns out to be closed, since
+# they don't change anything on the tool.
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+
+# Size of the pieces uploads are read, encoded and sent in.
+UPLOAD_CHUNK_SIZE = 65536
+
+# Seconds the tools found on the network are used for before they're looked for again.
+DISCOVERY_TTL = 60.0
+
 def find_tools(debug=False):
     '''
     Retreive a list of tools on the network by querying the FabMo Tool Minder on localhost.
@@ -13,7 +31,7 @@ def find_tools(debug=False):
         return [FabMoTool('demo.gofabmo.org', 80, hostname='demo.gofabmo.org')]
 
     try:
-        conn = http.client.HTTPConnection('localhost', 8080)
+        conn = http.client.HTTPConnection('localhost', 8080, timeout=CONNECT_TIMEOUT)
         conn.request('GET', '/where_is_my_tool')
         response = conn.getresponse()
         tools = json.loads(response.read().decode('utf-8'))
@@ -25,15 +43,286 @@ def find_tools(debug=False):
 
     return [FabMoTool.make(tool) for tool in tools]
 
+class ToolCache:
+    '''
+    Remembers the tools found by find_tools so a job can be sent without asking the Tool Minder
+    first.  Once the tools are more than ttl seconds old they're still returned, but looked for
+    again in the background, and start() does that every ttl seconds.  Each time, the tools
+    that don't answer get_status are dropped, and the ones still there keep their connections.
+    The tools are only looked for while the caller waits when none are known, and then a
+    search that's already running, like the first one start() makes, is waited for instead.
+    '''
+    def __init__(self, ttl=DISCOVERY_TTL, debug=False, workers=8):
+        self.ttl = ttl
+        self.debug = debug
+        self.workers = workers
+        self.found = None
+        self.error = None
+        self._tools = []
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def tools(self):
+        '''
+        Return the list of known tools, looking for them right away if there aren't any.
+        '''
+        if not self._tools and self._refreshing.locked():
+            with self._refreshing:
+                pass
+        with self._lock:
+            tools = list(self._tools)
+            stale = self.found is None or time.monotonic() - self.found >= self.ttl
+        if not tools:
+            return self.refresh()
+        if stale:
+            self.refresh_later()
+        return tools
+
+    def refresh(self):
+        '''
+        Look for the tools now and return the ones that answer.  Raises the exception of
+        find_tools when the Tool Minder can't be reached, and the known tools are kept.
+        '''
+        with self._refreshing:
+            try:
+                found = find_tools(self.debug)
+            except Exception as e:
+                self.error = str(e)
+                raise
+            with self._lock:
+                known = {(tool.ip, tool.port): tool for tool in self._tools}
+            tools = [known.pop((tool.ip, tool.port), tool) for tool in found]
+            answering = self._answering(tools)
+            with self._lock:
+                # A refresh that finishes after stop() keeps nothing, so no connections are left open.
+                if self._stopped.is_set():
+                    answering = []
+                else:
+                    self._tools = answering
+                    self.found = time.monotonic()
+                    self.error = None
+            for tool in tools + list(known.values()):
+                if tool not in answering:
+                    tool.close()
+            return list(answering)
+
+    def refresh_later(self):
+        '''
+        Look for the tools on another thread, unless that's already being done.
+        '''
+        if not self._refreshing.locked():
+            threading.Thread(target=self._refresh_quietly, daemon=True).start()
+
+    def drop(self, tool):
+        '''
+        Forget a tool that has stopped answering.  It's added back if discovery finds it again.
+        '''
+        with self._lock:
+            self._tools = [other for other in self._tools if other is not tool]
+        tool.close()
+
+    def start(self):
+        '''
+        Look for the tools every ttl seconds on a background thread, starting now unless
+        they've already been found.
+        '''
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        '''
+        Stop looking for the tools and close the connections to them.  A refresh that's still
+        running is left to finish on its own, and closes what it found.
+        '''
+        with self._lock:
+            self._stopped.set()
+            (tools, self._tools) = (self._tools, [])
+            self.found = None
+        self._thread = None
+        for tool in tools:
+            tool.close()
+
+    def _run(self):
+        if self.found is None:
+            self._refresh_quietly()
+        while not self._stopped.wait(self.ttl):
+            self._refresh_quietly()
+
+    def _refresh_quietly(self):
+        # Errors are kept in error so the next tools() can still use the known tools.
+        try:
+            self.refresh()
+        except Exception:
+            pass
+
+    def _answering(self, tools):
+        # The tools that answer get_status, asked all at the same time.
+        if not tools:
+            return []
+        def answers(tool):
+            try:
+                tool.get_status()
+                return True
+            except Exception:
+                return False
+        with concurrent.futures.ThreadPoolExecutor(min(self.workers, len(tools))) as executor:
+            return [tool for (tool, answered) in zip(tools, executor.map(answers, tools)) if answered]
+
+class ConnectionPool:
+    '''
+    Keeps the connections to a tool open between requests so each one doesn't pay for a new
+    TCP connection.  Connections are made with connect_timeout and then wait at most
+    read_timeout for each read, so a tool that stops answering can't block forever.
+    Kept connections that the tool has closed in the meantime are dropped before they're used.
+    A request on a kept connection that fails anyway is sent again on a new connection if none
+    of it was sent or its method is in IDEMPOTENT_METHODS.  Otherwise the tool may already have
+    acted on it, so the error is raised instead of, for example, submitting a job twice.
+    '''
+    def __init__(self, host, port, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT, max_idle=4):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def request(self, method, path, body=None, headers=None):
+        '''
+        Send a request and return the (status, body) of the response.  body can be bytes, a
+        string or an iterable of bytes.  An iterator can only be sent once, so it always
+        goes on a new connection.  Without a Content-length header an iterable is sent with
+        chunked transfer encoding.
+        '''
+        conn = None
+        if not isinstance(body, collections.abc.Iterator):
+            conn = self._kept_connection()
+        if conn is not None:
+            try:
+                self._write(conn, method, path, body, headers)
+            except (ConnectionResetError, BrokenPipeError):
+                # The tool closed the kept connection while the request was being sent.
+                if conn.sent and method not in IDEMPOTENT_METHODS:
+                    raise
+                conn = None
+            else:
+                try:
+                    return self._read(conn)
+                except (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError):
+                    # The tool closed the kept connection after getting the request.
+                    if method not in IDEMPOTENT_METHODS:
+                        raise
+                    conn = None
+        conn = self._connect()
+        self._write(conn, method, path, body, headers)
+        return self._read(conn)
+
+    def close(self):
+        with self._lock:
+            (idle, self._idle) = (self._idle, [])
+        for conn in idle:
+            conn.close()
+
+    def _kept_connection(self):
+        # An open kept connection, or None.  A kept connection has nothing to read, so one
+        # that's readable has been closed by the tool.
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                conn = self._idle.pop()
+            if not select.select([conn.sock], [], [], 0)[0]:
+                return conn
+            conn.close()
+
+    def _connect(self):
+        conn = _PooledConnection(self.host, self.port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.read_timeout)
+        # Send each request right away instead of waiting to fill a packet.
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conn
+
+    def _write(self, conn, method, path, body, headers):
+        try:
+            conn.request(method, path, body, headers or {})
+        except:
+            conn.close()
+            raise
+
+    def _read(self, conn):
+        try:
+            response = conn.getresponse()
+            data = response.read()
+        except:
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            with self._lock:
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+        return (response.status, data)
+
+class _PooledConnection(http.client.HTTPConnection):
+    # Counts the bytes handed to the socket for the current request, so it's known whether
+    # any of a request that failed was sent.
+    sent = 0
+
+    def putrequest(self, *args, **kwargs):
+        self.sent = 0
+        return http.client.HTTPConnection.putrequest(self, *args, **kwargs)
+
+    def send(self, data):
+        if self.sock is None or not isinstance(data, (bytes, bytearray)):
+            # How much of anything else is sent before an error isn't known.
+            self.sent += 1
+            return http.client.HTTPConnection.send(self, data)
+        view = memoryview(data)
+        while view:
+            count = self.sock.send(view)
+            self.sent += count
+            view = view[count:]
+
 class FabMoTool:
     '''
     Represents a specific tool on the network.
+    Requests share a pool of kept-alive connections, see ConnectionPool for the timeouts.
     '''
 
-    def __init__(self, ip, port, hostname=''):
+    def __init__(self, ip, port, hostname='', connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
         self.ip = ip
         self.port = port
         self.hostname = hostname
+        self.pool = ConnectionPool(ip, port, connect_timeout, read_timeout)
+
+    def close(self):
+        '''
+        Close the connections kept open to the tool.
+        '''
+        self.pool.close()
+
+    def request(self, method, path, body=None, headers=None):
+        '''
+        Send a request to the tool and return the JSON response.  An exception is raised when
+        the tool can't be reached, doesn't answer in time or reports an error.
+        '''
+        try:
+            (status, data) = self.pool.request(method, path, body, headers)
+        except socket.timeout:
+            raise Exception('The tool at {}:{} did not answer in time.'.format(self.ip, self.port))
+        response_data = json.loads(data.decode('utf-8'))
+        if response_data['status'] == 'error':
+            raise Exception(response_data['message'])
+        return response_data
 
     def show_dashboard(self):
         webbrowser.open('http://' + self.ip + ':' + str(self.port) + '/')
@@ -41,13 +330,15 @@ class FabMoTool:
     def show_job_manager(self):
         webbrowser.open('http://' + self.ip + ':' + str(self.port) + '/#/app/job-manager')
 
-    def submit_job(self, codes, filename=None, name=None, description=None):
+    def submit_job(self, codes, filename=None, name=None, description=None, timer=None):
         '''
         Submit a job to the tool's job queue.
-        codes is a string containing G-Code or OpenSBP code
+        codes is a string containing G-Code or OpenSBP code, or a file object or an iterable of
+        strings to read it from, so large programs are uploaded without copying them
         filename should correspond to the type of code submitted, ending with .nc or .g for g-code and .sbp for opensbp code
         name should be a short descriptive name of the job
         description can be a longer description of the job, perhaps describing the conditions of the design input
+        timer is an optional instrument.PhaseTimer that records the time of each request
         '''
         filename = filename or 'job.nc'
         name = name or filename
@@ -56,7 +347,6 @@ class FabMoTool:
         # Metadata request
         # POSTs job-level information (the names and descriptions of all files for the upload)
         # (For now, we're only posting one file)
-        conn = http.client.HTTPConnection(self.ip, self.port)
         headers = {"Content-type":"application/json", "Accept":"text/plain"}
         metadata = {
             'files' : [
@@ -68,20 +358,19 @@ class FabMoTool:
             'meta' : {}
         }
         json_payload = json.dumps(metadata)
-        conn.request("POST", "/job", json_payload, headers)
-        response = conn.getresponse()
-        response_text = response.read().decode('utf-8')
-        response_data = json.loads(response_text)['data']
+        with instrument.phase(timer, 'job request'):
+            response_data = self.request("POST", "/job", json_payload, headers)['data']
 
         # Payload request
-        # POSTs the actual job content
-        content_type, body = MultipartFormdataEncoder().encode([('key', response_data['key']), ('index',0)], [('file', filename, io.BytesIO(codes.encode('utf-8')))])
+        # POSTs the actual job content, encoded and sent a piece at a time
+        with instrument.phase(timer, 'multipart encoding'):
+            content_type, content_length, body = MultipartFormdataEncoder().stream([('key', response_data['key']), ('index',0)], [('file', filename, codes)])
         headers = {"Content-type":content_type, "Accept":"text/plain"}
-        conn.request("POST", "/job", body, headers)
-        response = conn.getresponse()
-        response_text = response.read().decode('utf-8')
-        response_data = json.loads(response_text)
-        conn.close()
+        if content_length is not None:
+            headers['Content-length'] = str(content_length)
+            instrument.count(timer, 'upload bytes', content_length)
+        with instrument.phase(timer, 'file upload'):
+            response_data = self.request("POST", "/job", body, headers)
 
         # Throw an exception if the server rejected our request
         if(response_data['status']) != 'success':
@@ -89,18 +378,13 @@ class FabMoTool:
         return response_data['data']['data']['jobs'][0]
 
     def get_status(self):
-        conn = http.client.HTTPConnection(self.ip, self.port)
-        try:
-            conn.request("GET", "/status", '', {})
-            response = conn.getresponse()
-            response_text = response.read().decode('utf-8')
-            response_data = json.loads(response_text)
-            if response_data['status'] == 'error':
-                raise Exception(response_data['message'])
-        finally:
-            conn.close()
-        return response_data['data']['status']
+        return self.request("GET", "/status")['data']['status']
 
+    def get_job(self, job_id):
+        '''
+        Return the record of a job submitted to the tool.  Its state is 'pending' until the tool starts running it.
+        '''
+        return self.request("GET", "/job/{}".format(job_id))['data']['job']
 
     @classmethod
     def make(cls, obj):
@@ -121,38 +405,125 @@ class MultipartFormdataEncoder(object):
             s = s.decode('utf-8')
         return s
 
-    def iter(self, fields, files):
+    def iter(self, fields, files, chunk_size=UPLOAD_CHUNK_SIZE):
         """
         fields is a sequence of (name, value) elements for regular form fields.
         files is a sequence of (name, filename, file-type) elements for data to be uploaded as files
         Yield body's chunk as bytes
         """
+        for chunk in self._iter_parts(fields, files, chunk_size, close=True):
+            yield (chunk, len(chunk))
+
+    def encode(self, fields, files):
+        body = io.BytesIO()
+        for chunk, chunk_len in self.iter(fields, files):
+            body.write(chunk)
+        return self.content_type, body.getvalue()
+
+    def stream(self, fields, files, chunk_size=UPLOAD_CHUNK_SIZE):
+        """
+        Like encode, but without building the body.  Each file can be a file object, bytes, a
+        string or an iterable of strings or bytes, and is read and encoded chunk_size at a time.
+        Returns (content type, content length, body), where body is an iterable of bytes.
+        The length is None when a file is an iterator, whose size isn't known until it's been
+        read, and then the body should be sent with chunked transfer encoding.  Otherwise the
+        body can be iterated again, for example to resend it.
+        """
+        length = 0
+        for (key, filename, fd) in files:
+            size = _source_size(fd, chunk_size)
+            if size is None:
+                return (self.content_type, None, self._iter_parts(fields, files, chunk_size))
+            length += size
+        for chunk in self._iter_parts(fields, [(key, filename, b'') for (key, filename, fd) in files], chunk_size):
+            length += len(chunk)
+        return (self.content_type, length, _MultipartBody(self, fields, files, chunk_size))
+
+    def _iter_parts(self, fields, files, chunk_size, close=False):
         encoder = codecs.getencoder('utf-8')
         for (key, value) in fields:
             key = self.u(key)
-            yield encoder('--{}\r\n'.format(self.boundary))
-            yield encoder(self.u('Content-Disposition: form-data; name="{}"\r\n').format(key))
-            yield encoder('\r\n')
+            yield encoder('--{}\r\n'.format(self.boundary))[0]
+            yield encoder(self.u('Content-Disposition: form-data; name="{}"\r\n').format(key))[0]
+            yield encoder('\r\n')[0]
             if isinstance(value, int) or isinstance(value, float):
                 value = str(value)
-            yield encoder(self.u(value))
-            yield encoder('\r\n')
+            yield encoder(self.u(value))[0]
+            yield encoder('\r\n')[0]
         for (key, filename, fd) in files:
             key = self.u(key)
             filename = self.u(filename)
-            yield encoder('--{}\r\n'.format(self.boundary))
-            yield encoder(self.u('Content-Disposition: form-data; name="{}"; filename="{}"\r\n').format(key, filename))
-            yield encoder('Content-Type: {}\r\n'.format(mimetypes.guess_type(filename)[0] or 'application/octet-stream'))
-            yield encoder('\r\n')
-            with fd:
-                buff = fd.read()
-                yield (buff, len(buff))
-            yield encoder('\r\n')
-        yield encoder('--{}--\r\n'.format(self.boundary))
+            yield encoder('--{}\r\n'.format(self.boundary))[0]
+            yield encoder(self.u('Content-Disposition: form-data; name="{}"; filename="{}"\r\n').format(key, filename))[0]
+            yield encoder('Content-Type: {}\r\n'.format(mimetypes.guess_type(filename)[0] or 'application/octet-stream'))[0]
+            yield encoder('\r\n')[0]
+            for chunk in _iter_source(fd, chunk_size):
+                yield chunk
+            if close and hasattr(fd, 'close'):
+                fd.close()
+            yield encoder('\r\n')[0]
+        yield encoder('--{}--\r\n'.format(self.boundary))[0]
 
-    def encode(self, fields, files):
-        body = io.BytesIO()
-        for chunk, chunk_len in self.iter(fields, files):
-            body.write(chunk)
-        return self.content_type, body.getvalue()
+class _MultipartBody(object):
+    # The body of a streamed upload, read again each time it's iterated.
+    def __init__(self, encoder, fields, files, chunk_size):
+        self.encoder = encoder
+        self.fields = fields
+        self.files = files
+        self.chunk_size = chunk_size
+        self.starts = [fd.tell() if hasattr(fd, 'seek') else None for (key, filename, fd) in files]
+
+    def __iter__(self):
+        for ((key, filename, fd), start) in zip(self.files, self.starts):
+            if start is not None:
+                fd.seek(start)
+        return self.encoder._iter_parts(self.fields, self.files, self.chunk_size)
+
+def _iter_source(source, chunk_size):
+    # Yield the contents of a file part as UTF-8 bytes, chunk_size characters at a time.
+    if isinstance(source, bytes):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start+chunk_size]
+    elif isinstance(source, str):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start+chunk_size].encode('utf-8')
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk if isinstance(chunk, bytes) else chunk.encode('utf-8')
+    else:
+        # Join small pieces, like lines, so each chunk sent is about chunk_size.
+        (pending, size) = ([], 0)
+        for chunk in source:
+            pending.append(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+            size += len(pending[-1])
+            if size >= chunk_size:
+                yield b''.join(pending)
+                (pending, size) = ([], 0)
+        if pending:
+            yield b''.join(pending)
 
+def _source_size(source, chunk_size):
+    # The number of bytes in a file part, or None if it's an iterator that can only be read once.
+    if isinstance(source, bytes):
+        return len(source)
+    if isinstance(source, str):
+        if source.isascii():
+            return len(source)
+        return sum(len(chunk) for chunk in _iter_source(source, chunk_size))
+    if hasattr(source, 'read'):
+        if not (hasattr(source, 'seekable') and source.seekable()):
+            return None
+        start = source.tell()
+        if isinstance(source, io.TextIOBase):
+            # Text has to be encoded to know its size.
+            size = sum(len(chunk) for chunk in _iter_source(source, chunk_size))
+        else:
+            size = source.seek(0, io.SEEK_END) - start
+        source.seek(start)
+        return size
+    if isinstance(source, collections.abc.Iterator):
+        return None
+    return sum(len(chunk) for chunk in _iter_source(source, chunk_size))
@@ -0,0 +1,325 @@
+'''
+An asyncio client for FabMo tools, with the same operations as Modules.fabmo.
+One event loop can watch many tools and submit to several of them at once without a thread
+for each: every request waits on its socket instead of blocking, so the status of all of the
+tools can be gathered at the same time.  The results are the same dictionaries FabMoTool
+returns, and the connections, timeouts and errors work the same way.
+
+    tools = await fabmo_async.find_tools()
+    statuses = await fabmo_async.get_statuses(tools)
+    job = await tools[0].submit_job(codes, 'stool.nc')
+    job = await tools[0].wait_for_job(job['_id'])
+'''
+import asyncio
+import collections.abc
+import json
+
+from . import fabmo, instrument
+
+# The states of a job that has left the tool's queue for good.
+FINISHED_STATES = ('finished', 'failed', 'cancelled')
+
+# Where the FabMo Tool Minder answers.
+TOOL_MINDER = ('localhost', 8080)
+
+async def find_tools(debug=False):
+    '''
+    Retreive a list of tools on the network by querying the FabMo Tool Minder on localhost,
+    like fabmo.find_tools.
+    '''
+    if(debug):
+        return [AsyncFabMoTool('demo.gofabmo.org', 80, hostname='demo.gofabmo.org')]
+
+    pool = AsyncConnectionPool(TOOL_MINDER[0], TOOL_MINDER[1], read_timeout=fabmo.CONNECT_TIMEOUT)
+    try:
+        (status, data) = await pool.request('GET', '/where_is_my_tool')
+        tools = json.loads(data.decode('utf-8'))
+    except ConnectionRefusedError as e:
+        raise ConnectionRefusedError('Could not find any tools on the network.  The FabMo Tool Minder service does not appear to be running.')
+    except Exception as e:
+        raise Exception('Could not find any tools on the network: ' + (str(e) or type(e).__name__))
+    finally:
+        await pool.close()
+
+    return [AsyncFabMoTool.make(tool) for tool in tools]
+
+async def get_statuses(tools):
+    '''
+    Get the status of all of the tools at the same time.  Returns a list with the status of
+    each tool, or the exception raised when it didn't answer.
+    '''
+    return await asyncio.gather(*[tool.get_status() for tool in tools], return_exceptions=True)
+
+class AsyncConnectionPool:
+    '''
+    The asyncio version of fabmo.ConnectionPool.  Connections are kept open between requests,
+    made with connect_timeout and wait at most read_timeout for each read.  asyncio.TimeoutError
+    is raised when the tool doesn't answer in time.  Like fabmo.ConnectionPool, a request that
+    fails on a kept connection is only sent again if it never reached the tool or its method
+    is in fabmo.IDEMPOTENT_METHODS.
+    '''
+    def __init__(self, host, port, connect_timeout=fabmo.CONNECT_TIMEOUT, read_timeout=fabmo.READ_TIMEOUT, max_idle=4):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_idle = max_idle
+        self._idle = []
+
+    async def request(self, method, path, body=None, headers=None):
+        '''
+        Send a request and return the (status, body) of the response.  body can be bytes, a
+        string or an iterable of bytes, which is sent with chunked transfer encoding unless
+        there's a Content-length header.  An iterable is read on the default executor, so
+        reading a file doesn't hold up the event loop.
+        '''
+        headers = headers or {}
+        conn = None
+        if not isinstance(body, collections.abc.Iterator):
+            conn = await self._kept_connection()
+        if conn is not None:
+            try:
+                await self._write(conn, method, path, body, headers)
+            except (ConnectionResetError, BrokenPipeError):
+                # The tool closed the kept connection before the request reached it.
+                conn = None
+            else:
+                try:
+                    return await self._read(conn, method, headers)
+                except (asyncio.IncompleteReadError, ConnectionResetError):
+                    # The tool closed the kept connection after getting the request.
+                    if method not in fabmo.IDEMPOTENT_METHODS:
+                        raise
+                    conn = None
+        conn = await self._connect()
+        await self._write(conn, method, path, body, headers)
+        return await self._read(conn, method, headers)
+
+    async def close(self):
+        (idle, self._idle) = (self._idle, [])
+        for conn in idle:
+            await _close(conn)
+
+    async def _kept_connection(self):
+        # An open kept connection, or None.  The stream sees the end of a connection the tool closed.
+        while self._idle:
+            conn = self._idle.pop()
+            if not conn[0].at_eof() and not conn[1].is_closing():
+                return conn
+            await _close(conn)
+        return None
+
+    async def _connect(self):
+        return await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.connect_timeout)
+
+    async def _write(self, conn, method, path, body, headers):
+        try:
+            await self._write_request(conn[1], method, path, body, headers)
+        except:
+            await _close(conn)
+            raise
+
+    async def _read(self, conn, method, headers):
+        try:
+            (status, response_headers, data) = await self._read_response(conn[0], method, headers)
+        except:
+            await _close(conn)
+            raise
+        if response_headers.get('connection', '').lower() == 'close' or len(self._idle) >= self.max_idle:
+            await _close(conn)
+        else:
+            self._idle.append(conn)
+        return (status, data)
+
+    async def _write_request(self, writer, method, path, body, headers):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        lines = ['{} {} HTTP/1.1'.format(method, path), 'Host: {}:{}'.format(self.host, self.port)]
+        names = set(name.lower() for name in headers)
+        chunked = body is not None and not isinstance(body, bytes) and 'content-length' not in names
+        if isinstance(body, bytes) and 'content-length' not in names:
+            lines.append('Content-Length: {}'.format(len(body)))
+        elif body is None and method in ('POST', 'PUT'):
+            lines.append('Content-Length: 0')
+        if chunked:
+            lines.append('Transfer-Encoding: chunked')
+        lines.extend('{}: {}'.format(name, value) for (name, value) in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+        if isinstance(body, bytes):
+            writer.write(body)
+        elif body is not None:
+            loop = asyncio.get_running_loop()
+            chunks = iter(body)
+            while True:
+                chunk = await loop.run_in_executor(None, next, chunks, None)
+                if chunk is None:
+                    break
+                if not chunk:
+                    continue
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk) if chunked else chunk)
+                await writer.drain()
+            if chunked:
+                writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def _read_response(self, reader, method, headers):
+        # Wait at most read_timeout for each part of the response.
+        status_line = await self._wait(reader.readuntil(b'\r\n'))
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = (await self._wait(reader.readuntil(b'\r\n'))).decode('latin-1').strip()
+            if not line:
+                break
+            (name, value) = line.split(':', 1)
+            response_headers[name.strip().lower()] = value.strip()
+
+        closing = response_headers.get('connection', '').lower() == 'close' or \
+                  any(name.lower() == 'connection' and value.lower() == 'close' for (name, value) in headers.items())
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            data = b''
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            parts = []
+            while True:
+                size = int((await self._wait(reader.readuntil(b'\r\n'))).split(b';')[0], 16)
+                if size == 0:
+                    # Skip any trailers.
+                    while (await self._wait(reader.readuntil(b'\r\n'))) != b'\r\n':
+                        pass
+                    break
+                parts.append(await self._wait(reader.readexactly(size)))
+                await self._wait(reader.readexactly(2))
+            data = b''.join(parts)
+        elif 'content-length' in response_headers:
+            data = await self._wait(reader.readexactly(int(response_headers['content-length'])))
+        elif closing:
+            # The body ends when the connection is closed.
+            data = await self._wait(reader.read())
+        else:
+            data = b''
+        if closing:
+            response_headers['connection'] = 'close'
+        return (status, response_headers, data)
+
+    async def _wait(self, read):
+        return await asyncio.wait_for(read, self.read_timeout)
+
+async def _close(conn):
+    writer = conn[1]
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except (ConnectionError, OSError):
+        pass
+
+class AsyncFabMoTool:
+    '''
+    The asyncio version of fabmo.FabMoTool.  Every method that talks to the tool is a coroutine.
+    '''
+
+    def __init__(self, ip, port, hostname='', connect_timeout=fabmo.CONNECT_TIMEOUT, read_timeout=fabmo.READ_TIMEOUT):
+        self.ip = ip
+        self.port = port
+        self.hostname = hostname
+        self.pool = AsyncConnectionPool(ip, port, connect_timeout, read_timeout)
+
+    async def close(self):
+        '''
+        Close the connections kept open to the tool.
+        '''
+        await self.pool.close()
+
+    async def request(self, method, path, body=None, headers=None):
+        '''
+        Send a request to the tool and return the JSON response.  An exception is raised when
+        the tool can't be reached, doesn't answer in time or reports an error.
+        '''
+        try:
+            (status, data) = await self.pool.request(method, path, body, headers)
+        except asyncio.TimeoutError:
+            raise Exception('The tool at {}:{} did not answer in time.'.format(self.ip, self.port))
+        response_data = json.loads(data.decode('utf-8'))
+        if response_data['status'] == 'error':
+            raise Exception(response_data['message'])
+        return response_data
+
+    def show_dashboard(self):
+        fabmo.FabMoTool.show_dashboard(self)
+
+    def show_job_manager(self):
+        fabmo.FabMoTool.show_job_manager(self)
+
+    async def submit_job(self, codes, filename=None, name=None, description=None, timer=None):
+        '''
+        Submit a job to the tool's job queue and return its record, see fabmo.FabMoTool.submit_job.
+        codes is read on the default executor, so it can be a file without blocking the event loop.
+        '''
+        filename = filename or 'job.nc'
+        name = name or filename
+        description = description or ''
+
+        # Metadata request
+        headers = {"Content-type":"application/json", "Accept":"text/plain"}
+        metadata = {
+            'files' : [
+                {
+                    'filename' :filename,
+                    'name' : name,
+                    'description' : description}
+            ],
+            'meta' : {}
+        }
+        with instrument.phase(timer, 'job request'):
+            response_data = (await self.request("POST", "/job", json.dumps(metadata), headers))['data']
+
+        # Payload request
+        # Working out the length can mean reading codes, so it's done on the default executor.
+        with instrument.phase(timer, 'multipart encoding'):
+            encoder = fabmo.MultipartFormdataEncoder()
+            content_type, content_length, body = await asyncio.get_running_loop().run_in_executor(
+                None, encoder.stream, [('key', response_data['key']), ('index',0)], [('file', filename, codes)])
+        headers = {"Content-type":content_type, "Accept":"text/plain"}
+        if content_length is not None:
+            headers['Content-length'] = str(content_length)
+            instrument.count(timer, 'upload bytes', content_length)
+        with instrument.phase(timer, 'file upload'):
+            response_data = await self.request("POST", "/job", body, headers)
+
+        # Throw an exception if the server rejected our request
+        if(response_data['status']) != 'success':
+            raise Exception(response_data['message'])
+        return response_data['data']['data']['jobs'][0]
+
+    async def get_status(self):
+        return (await self.request("GET", "/status"))['data']['status']
+
+    async def get_job(self, job_id):
+        '''
+        Return the record of a job submitted to the tool.
+        '''
+        return (await self.request("GET", "/job/{}".format(job_id)))['data']['job']
+
+    async def wait_for_job(self, job_id, interval=1.0, timeout=None):
+        '''
+        Poll a job every interval seconds until it's finished, failed or been cancelled, and
+        return its last record.  asyncio.TimeoutError is raised if that takes more than timeout seconds.
+        '''
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+
+        async def poll():
+            while True:
+                job = await self.get_job(job_id)
+                if job.get('state') in FINISHED_STATES:
+                    return job
+                await asyncio.sleep(interval)
+                # Before Python 3.12, wait_for can miss the timeout when it cancels a request
+                # just as it finishes, so the loop checks the deadline itself too.
+                if deadline is not None and loop.time() >= deadline:
+                    raise asyncio.TimeoutError()
+        return await asyncio.wait_for(poll(), timeout)
+
+    @classmethod
+    def make(cls, obj):
+        return AsyncFabMoTool(obj['network'][0]['ip_address'], obj['server_port'], obj['hostname'])
@@ -0,0 +1,259 @@
+'''
+Spreads seat jobs across several FabMo tools.
+Each tool gets its own queue of jobs, balanced by the estimated run time of the jobs
+already queued for it.  The status of every tool is polled at the same time, and the next
+job in a tool's queue is only submitted once the tool is idle and has taken the last job
+it was sent off its FabMo queue, so a job never waits behind another one on a busy machine while a different
+machine is free.  The jobs queued for a tool that stops answering, or that fails to take a
+job, are moved to the others.
+
+It can be run from the add-in folder to cut a batch of seats made by Modules.batch:
+    python -m Modules.fleet out/manifest.json
+'''
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+from . import fabmo, simulator
+
+# The states reported by FabMo in which a tool can take a new job.
+IDLE_STATES = ('idle',)
+
+class SeatJob:
+    '''
+    A program to submit to a tool.  estimated_seconds is used to balance the queues.
+    '''
+    def __init__(self, codes, filename='stool.nc', name=None, description=None, estimated_seconds=0.0):
+        self.codes = codes
+        self.filename = filename
+        self.name = name
+        self.description = description
+        self.estimated_seconds = estimated_seconds
+
+class ToolQueue:
+    '''
+    The jobs waiting for a tool, the ones submitted to it and its last status.
+    state is the FabMo state, or None if the tool didn't answer.  waiting is the record of
+    the last job submitted while it's still pending on the tool.  rejected is the error of
+    the last submission when it failed.
+    '''
+    def __init__(self, tool):
+        self.tool = tool
+        self.name = tool_name(tool)
+        self.jobs = []
+        self.submitted = []
+        self.state = None
+        self.error = None
+        self.waiting = None
+        self.rejected = None
+
+    def queued_seconds(self):
+        return sum(job.estimated_seconds for job in self.jobs)
+
+    def is_idle(self):
+        return self.state in IDLE_STATES
+
+    def is_available(self):
+        return self.is_idle() and self.waiting is None
+
+    def lost(self, error):
+        # Mark the tool as not answering until it answers a poll again.
+        self.state = None
+        self.error = str(error)
+
+    def submit(self, job):
+        # Submit the job to the tool and return its record, noting whether the tool took it.
+        try:
+            self.waiting = self.tool.submit_job(job.codes, job.filename, job.name, job.description)
+        except Exception as e:
+            self.lost(e)
+            self.rejected = str(e)
+            raise
+        self.rejected = None
+        self.submitted.append(job)
+        return self.waiting
+
+    def poll(self):
+        # Returns the tool's status, and clears waiting once the last job has left the tool's queue.
+        status = self.tool.get_status()
+        if self.waiting is not None and self.tool.get_job(self.waiting['_id']).get('state') != 'pending':
+            self.waiting = None
+        return status
+
+class Fleet:
+    '''
+    A scheduler for a set of FabMoTools.
+    '''
+    def __init__(self, tools, workers=8):
+        self.queues = [ToolQueue(tool) for tool in tools]
+        self.workers = workers
+
+    def poll(self):
+        '''
+        Get the status of all of the tools at the same time and update their states.
+        Returns the queues of the tools that didn't answer.
+        '''
+        if not self.queues:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(min(self.workers, len(self.queues))) as executor:
+            futures = [executor.submit(queue.poll) for queue in self.queues]
+        lost = []
+        for (queue, future) in zip(self.queues, futures):
+            try:
+                queue.state = future.result().get('state')
+                queue.error = None
+            except Exception as e:
+                queue.lost(e)
+                lost.append(queue)
+        return lost
+
+    def assign(self, job):
+        '''
+        Add a job to the queue of the tool that will finish its queued work first,
+        preferring tools that answered the last poll.  Returns the ToolQueue.
+        '''
+        if not self.queues:
+            raise Exception('There are no tools to submit the job to.')
+        answering = [queue for queue in self.queues if queue.error is None] or self.queues
+        queue = min(answering, key=lambda queue: (not queue.is_available(), queue.queued_seconds(), len(queue.submitted)))
+        queue.jobs.append(job)
+        return queue
+
+    def dispatch(self):
+        '''
+        Poll the tools and submit the next queued job to each tool that's available.  The jobs
+        of tools that didn't answer are moved to the others.  Returns a list of
+        (ToolQueue, SeatJob, job record) for the jobs that were submitted.
+        '''
+        self.move_jobs(self.poll())
+
+        # A free tool with nothing queued takes the last job of the busy tool with the most work.
+        for queue in self.queues:
+            if not queue.jobs and queue.is_available():
+                busy = [other for other in self.queues if other.jobs and not other.is_available()]
+                if busy:
+                    queue.jobs.append(max(busy, key=lambda other: other.queued_seconds()).jobs.pop())
+
+        # A job stays queued until the tool has taken it, and moves on if the tool fails.
+        submitted = []
+        failed = []
+        for queue in self.queues:
+            if queue.jobs and queue.is_available():
+                job = queue.jobs[0]
+                try:
+                    record = queue.submit(job)
+                except Exception:
+                    failed.append(queue)
+                    continue
+                queue.jobs.pop(0)
+                submitted.append((queue, job, record))
+        self.move_jobs(failed)
+        return submitted
+
+    def move_jobs(self, lost):
+        '''
+        Assign the jobs queued for the tools that stopped answering to the others, unless
+        none of the tools are answering.
+        '''
+        if lost and len(lost) < len(self.queues):
+            for queue in lost:
+                (jobs, queue.jobs) = (queue.jobs, [])
+                for job in jobs:
+                    self.assign(job)
+
+    def submit(self, job):
+        '''
+        Submit a job right away to the least busy tool, for a single seat.  An available tool
+        is used when there is one, and the next best tool when a tool fails to take the job.
+        Returns the ToolQueue it was submitted to, and raises the last error if every tool failed.
+        '''
+        self.poll()
+        while True:
+            queue = self.assign(job)
+            queue.jobs.remove(job)
+            try:
+                queue.submit(job)
+            except Exception:
+                # Try the next tool, until none of them are left.
+                if all(other.error is not None for other in self.queues):
+                    raise
+                continue
+            return queue
+
+    def pending(self):
+        return sum(len(queue.jobs) for queue in self.queues)
+
+    def run(self, jobs, interval=5.0, report=None):
+        '''
+        Queue the jobs and dispatch them until they've all been submitted, polling every
+        interval seconds.  report is called with the summary after each poll.  Raises an
+        exception when none of the tools answer, or the last submission to each of them failed.
+        '''
+        for job in sorted(jobs, key=lambda job: -job.estimated_seconds):
+            self.assign(job)
+        while True:
+            self.dispatch()
+            if report:
+                report(self.summary())
+            if not self.pending():
+                return
+            if all(queue.rejected for queue in self.queues):
+                raise Exception('None of the tools would take the jobs: ' + self.queues[-1].rejected)
+            if all(queue.error for queue in self.queues):
+                raise Exception('None of the tools are answering.')
+            time.sleep(interval)
+
+    def summary(self):
+        '''
+        Return a line for each tool with its state and how much work is queued for it.
+        '''
+        lines = []
+        for queue in self.queues:
+            state = queue.state or 'not answering'
+            if queue.waiting is not None and queue.is_idle():
+                state = 'job waiting'
+            lines.append('{:<24} {:<14} {:>3} queued ({}), {:>3} submitted'.format(queue.name, state, len(queue.jobs),
+                                                                                simulator.format_time(queue.queued_seconds()),
+                                                                                len(queue.submitted)))
+        return '\n'.join(lines)
+
+def tool_name(tool):
+    return tool.hostname or '{}:{}'.format(tool.ip, tool.port)
+
+def manifest_jobs(filename):
+    '''
+    Return a SeatJob for each seat in a manifest written by Modules.batch.
+    '''
+    with open(filename) as fp:
+        manifest = json.load(fp)
+    folder = os.path.dirname(filename)
+    jobs = []
+    for seat in manifest['seats']:
+        with open(os.path.join(folder, seat['file'])) as fp:
+            codes = fp.read()
+        description = '{} seed {}'.format(seat['spec']['design'], seat['spec']['seed'])
+        jobs.append(SeatJob(codes, seat['file'], os.path.splitext(seat['file'])[0], description, seat.get('estimated_seconds', 0.0)))
+    return jobs
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m Modules.fleet', description='Spread a batch of seats across the FabMo tools on the network.')
+    parser.add_argument('manifest', help='manifest.json written by python -m Modules.batch')
+    parser.add_argument('--interval', type=float, default=5.0, help='seconds between polls of the tools')
+    args = parser.parse_args(argv)
+
+    jobs = manifest_jobs(args.manifest)
+    tools = fabmo.find_tools()
+    if not tools:
+        print('No tools were found on the network.')
+        return 1
+
+    fleet = Fleet(tools)
+    fleet.run(jobs, args.interval, lambda summary: print(summary + '\n'))
+    print('{} jobs submitted to {} tools.'.format(len(jobs), len(tools)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
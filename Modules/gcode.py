@@ -0,0 +1,272 @@
+import io
+import math
+import re
+
+from . import interpreter
+
+_TOKEN = re.compile(r'([a-zA-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))')
+
+def to_inches(centimeters):
+    '''
+    Format a centimeter value as inches the way it's written in the g-code.
+    '''
+    return '{0:.4f}'.format(centimeters / 2.54)
+
+def iter_header(retract_height, feed_rate=120):
+    '''
+    Yield the lines that start a program.
+    '''
+    yield 'g20\n'                                       # set to inches
+    yield 'g1 f' + str(feed_rate) + '\n'                # set the feed rate.
+    yield 'g0 z' + to_inches(retract_height) + '\n'     # lift to safe Z
+    yield 'm4\n'                                        # spindle on
+    yield 'g4 p2\n'                                     # a pause to allow spindle to spin up
+
+def iter_footer():
+    '''
+    Yield the lines that end a program.
+    '''
+    yield 'm5\n'            # turn off spindle
+    yield 'g0 x24 y0\n'     # Go to home.
+    yield 'm30\n'           # End of Program
+
+# The orders in which a program can cut the depths.  'layer' cuts the whole design at
+# each depth before going deeper, 'contour' cuts each path at every depth before moving on.
+DEPTH_STRATEGIES = ('layer', 'contour')
+
+def iter_program(paths, cutting_depths, retract_height, feed_rate=120, depth_strategy='layer', ramp=False):
+    '''
+    Yield the lines of a program that cuts each path at every cutting depth.
+    paths is a sequence of paths in cutting order, each a sequence of moves in centimeters.  The first
+    move is the start point, line moves are (x, y) and arc moves are (x, y, i, j, ccw), where (i, j) is
+    the center relative to the start of the arc.
+    cutting_depths is the list of depths (in centimeters, negative is into the material) to cut at
+    depth_strategy is one of DEPTH_STRATEGIES.  With 'layer' the design is cut once per depth.  With
+    'contour' closed paths step down in place and open paths are cut back and forth, so each path
+    only needs one rapid and one retract.
+    ramp makes closed paths go down to each depth along the path (a helix for circles) instead of
+    plunging, when the depth strategy is 'contour'.
+    The words of each move are formatted once and reused for every depth.
+    '''
+    if depth_strategy not in DEPTH_STRATEGIES:
+        raise ValueError('Unknown depth strategy: {}'.format(depth_strategy))
+
+    for line in iter_header(retract_height, feed_rate):
+        yield line
+
+    retract = 'g0 z' + to_inches(retract_height) + '\n'
+    if depth_strategy == 'layer':
+        words = [_format_path(path) for path in paths]
+
+        # Do a pass for each cutting depth.
+        for depth in cutting_depths:
+            plunge = 'g1 z' + to_inches(depth) + '\n'
+            for path in words:
+                if not path:
+                    continue
+                # Move to start of the path and then drop down.
+                yield 'g0 ' + path[0]
+                yield plunge
+                yield 'g1 ' + path[0]
+                for i in range(1, len(path)):
+                    yield path[i]
+
+                # Retract to safe Z
+                yield retract
+    else:
+        for path in paths:
+            if not path:
+                continue
+            for line in _iter_contour(path, cutting_depths, ramp):
+                yield line
+            yield retract
+
+    for line in iter_footer():
+        yield line
+
+def iter_compact(lines, verify=False):
+    '''
+    Yield the lines with the words that don't change the modal state removed.  Repeated motion
+    G words and unchanged axis values are dropped and line moves that go nowhere are skipped.
+    Arc moves always keep their x, y, i and j words.  Lines with anything other than motion
+    words, like spindle and dwell commands, are passed through unchanged.
+    When verify is True each line is checked with the reference interpreter and a ValueError
+    is raised if the compacted line doesn't move the machine the same way.
+    '''
+    mode = None
+    feed = None
+    absolute = True
+    position = {'x': None, 'y': None, 'z': None}
+    if verify:
+        original = interpreter.Interpreter()
+        compacted = interpreter.Interpreter()
+
+    for line in lines:
+        tokens = [(letter.lower(), text) for (letter, text) in _TOKEN.findall(line)]
+        codes = [float(text) for (letter, text) in tokens if letter == 'g']
+        line_mode = None
+        output = line
+        if absolute and tokens and all(letter in 'gxyzijf' for (letter, text) in tokens) and len(codes) <= 1 and all(code in interpreter.MOTION_CODES for code in codes):
+            if codes:
+                line_mode = int(codes[0])
+            new_mode = mode if line_mode is None else line_mode
+            axes = [(letter, text) for (letter, text) in tokens if letter in 'xyz']
+            words = []
+            if line_mode is not None and line_mode != mode:
+                words.append('g' + str(line_mode))
+            if new_mode in (2, 3) and axes:
+                words.extend(letter + text for (letter, text) in tokens if letter in 'xyij')
+                words.extend(letter + text for (letter, text) in axes if letter == 'z' and float(text) != position['z'])
+            else:
+                words.extend(letter + text for (letter, text) in axes if float(text) != position[letter])
+            for (letter, text) in tokens:
+                if letter == 'f' and float(text) != feed:
+                    words.append('f' + text)
+            output = ' '.join(words) + '\n' if words else None
+        else:
+            for (letter, text) in tokens:
+                if letter == 'g' and float(text) in interpreter.MOTION_CODES:
+                    line_mode = int(float(text))
+                elif letter == 'g' and float(text) in (90, 91):
+                    absolute = float(text) == 90
+
+        # Track the modal state the machine will be in after the line.
+        if line_mode is not None:
+            mode = line_mode
+        for (letter, text) in tokens:
+            if letter in position:
+                position[letter] = float(text) if absolute else None
+            elif letter == 'f':
+                feed = float(text)
+
+        if verify:
+            expected = [action for action in original.execute(line) if not _is_zero_length(action)]
+            actual = [action for action in compacted.execute(output or '') if not _is_zero_length(action)]
+            if [action.key() for action in expected] != [action.key() for action in actual]:
+                raise ValueError('Compacting line {} changed the motion: {!r} -> {!r}'.format(original.line_number, line, output))
+
+        if output:
+            yield output
+
+def iter_chunks(lines, chunk_size=65536):
+    '''
+    Group lines into strings of roughly chunk_size characters.
+    '''
+    pending = []
+    size = 0
+    for line in lines:
+        pending.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield ''.join(pending)
+            pending = []
+            size = 0
+    if pending:
+        yield ''.join(pending)
+
+def write_program(fp, lines, chunk_size=65536):
+    '''
+    Write lines to a text file object in chunks.  Returns the number of characters written.
+    '''
+    written = 0
+    for chunk in iter_chunks(lines, chunk_size):
+        fp.write(chunk)
+        written += len(chunk)
+    return written
+
+def program_to_string(lines):
+    '''
+    Collect lines into a single string.
+    '''
+    buffer = io.StringIO()
+    write_program(buffer, lines)
+    return buffer.getvalue()
+
+def _is_zero_length(action):
+    return isinstance(action, interpreter.Move) and action.is_zero_length()
+
+def _iter_contour(path, cutting_depths, ramp):
+    # Cut a single path at every depth, starting with a rapid to the start of the path.
+    words = _format_path(path)
+    closed = len(words) > 1 and _is_closed(path)
+    if closed or len(words) == 1:
+        backward = words
+    else:
+        backward = _format_path(_reverse_moves(path))
+
+    yield 'g0 ' + words[0]
+    top = 0.0
+    for (index, depth) in enumerate(cutting_depths):
+        if closed and ramp:
+            if index == 0:
+                yield 'g1 z' + to_inches(top) + '\n'
+            for line in _iter_ramp(path, words, top, depth):
+                yield line
+        else:
+            yield 'g1 z' + to_inches(depth) + '\n'
+            if index == 0:
+                yield 'g1 ' + words[0]
+            # Open paths are cut back and forth so there's no travel between depths.
+            current = backward if index % 2 else words
+            for i in range(1, len(current)):
+                yield current[i]
+        top = depth
+
+    # Ramping leaves a slope behind, so finish with a pass at the final depth.
+    if closed and ramp and cutting_depths:
+        for i in range(1, len(words)):
+            yield words[i]
+
+def _iter_ramp(path, words, top, bottom):
+    # The moves of a closed path with z going from top to bottom in proportion to the length.
+    lengths = [_move_length(path[i-1], path[i]) for i in range(1, len(path))]
+    total = sum(lengths)
+    if total == 0:
+        yield 'g1 z' + to_inches(bottom) + '\n'
+        return
+    travelled = 0.0
+    for i in range(1, len(words)):
+        travelled += lengths[i-1]
+        z = bottom if i == len(words) - 1 else top + (bottom - top) * travelled / total
+        yield words[i][:-1] + ' z' + to_inches(z) + '\n'
+
+def _is_closed(path):
+    # Compared as formatted, since that's where the machine will end up.
+    return to_inches(path[0][0]) == to_inches(path[-1][0]) and to_inches(path[0][1]) == to_inches(path[-1][1])
+
+def _move_length(start, move):
+    if len(move) == 2:
+        return math.hypot(move[0] - start[0], move[1] - start[1])
+    (cx, cy) = (start[0] + move[2], start[1] + move[3])
+    radius = math.hypot(move[2], move[3])
+    sweep = math.atan2(move[1] - cy, move[0] - cx) - math.atan2(start[1] - cy, start[0] - cx)
+    if not move[4]:
+        sweep = -sweep
+    sweep %= 2 * math.pi
+    return radius * (sweep or 2 * math.pi)
+
+def _reverse_moves(path):
+    # The same path cut from the other end.  Arcs keep their center and change direction.
+    moves = [path[-1]]
+    for i in range(len(path) - 1, 0, -1):
+        (move, previous) = (path[i], path[i-1])
+        if len(move) == 2:
+            moves.append((previous[0], previous[1]))
+        else:
+            (cx, cy) = (previous[0] + move[2], previous[1] + move[3])
+            moves.append((previous[0], previous[1], cx - move[0], cy - move[1], not move[4]))
+    return moves
+
+def _format_path(path):
+    # The start point is formatted without a motion word since it's used for
+    # both the rapid and the feed move.
+    words = []
+    for move in path:
+        xy = 'x' + to_inches(move[0]) + ' y' + to_inches(move[1])
+        if not words:
+            words.append(xy + '\n')
+        elif len(move) == 2:
+            words.append('g1 ' + xy + '\n')
+        else:
+            words.append(('g3 ' if move[4] else 'g2 ') + xy + ' i' + to_inches(move[2]) + ' j' + to_inches(move[3]) + '\n')
+    return words
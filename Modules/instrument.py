@@ -0,0 +1,78 @@
+'''
+Lightweight instrumentation for finding where the time goes when a seat is posted.
+A PhaseTimer records the wall time of named phases along with counts such as the number
+of points, polylines and bytes produced.  The functions phase and count take a timer that
+can be None, so code can be instrumented without checking whether timing is turned on.
+'''
+import contextlib
+import json
+import time
+
+class PhaseTimer:
+    '''
+    Wall times and counts for the phases of a run.  Phases are reported in the order they
+    first ran, and a phase that runs more than once is added up.
+    '''
+    def __init__(self):
+        self.phases = {}
+        self.counts = {}
+        self.started = time.time()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        '''
+        Time the code in a with block as the named phase.
+        '''
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - start
+            (seconds, calls) = self.phases.get(name, (0.0, 0))
+            self.phases[name] = (seconds + elapsed, calls + 1)
+
+    def count(self, name, value=1):
+        '''
+        Add value to the named count.
+        '''
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def as_dict(self):
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'phases': {name: {'seconds': seconds, 'calls': calls} for (name, (seconds, calls)) in self.phases.items()},
+            'counts': dict(self.counts),
+        }
+
+    def summary(self):
+        '''
+        Return the phases and counts as lines of text.
+        '''
+        lines = ['{}: {:.3f} s{}'.format(name, seconds, ' ({} calls)'.format(calls) if calls > 1 else '')
+                 for (name, (seconds, calls)) in self.phases.items()]
+        lines.extend('{}: {}'.format(name, value) for (name, value) in self.counts.items())
+        return '\n'.join(lines)
+
+    def write_log(self, filename, **extra):
+        '''
+        Append the results to a log file as a single line of JSON, along with any extra values.
+        '''
+        record = self.as_dict()
+        record.update(extra)
+        with open(filename, 'a') as fp:
+            fp.write(json.dumps(record, sort_keys=True) + '\n')
+
+def phase(timer, name):
+    '''
+    Return a context manager that times the named phase, or does nothing if timer is None.
+    '''
+    if timer is None:
+        return contextlib.nullcontext()
+    return timer.phase(name)
+
+def count(timer, name, value=1):
+    '''
+    Add value to the named count of the timer, if there is one.
+    '''
+    if timer is not None:
+        timer.count(name, value)
@@ -0,0 +1,224 @@
+'''
+A small reference interpreter for the g-code written by the toolpath pipeline.
+It tracks the modal state (motion mode, units, distance mode, position and feed rate)
+and reports what the machine does for each line, so different programs can be
+compared by the motion they produce rather than by their text.
+'''
+import math
+import re
+
+_WORD = re.compile(r'([a-zA-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))')
+_COMMENT = re.compile(r'\([^)]*\)|;.*')
+
+# The G codes that select a motion mode.
+MOTION_CODES = (0, 1, 2, 3)
+
+def parse_words(line):
+    '''
+    Return the (letter, value) words of a line, with comments removed.  Letters are lowercase.
+    '''
+    return [(letter.lower(), float(value)) for (letter, value) in _WORD.findall(_COMMENT.sub(' ', line))]
+
+class Move:
+    '''
+    A single motion of the machine.
+    mode is 0 for rapid, 1 for linear feed, 2 for clockwise and 3 for counterclockwise arcs
+    start and end are (x, y, z) positions in the program units
+    center is the (x, y) arc center for arcs, otherwise None
+    feed is the feed rate in effect (None for rapids)
+    '''
+    __slots__ = ('mode', 'start', 'end', 'center', 'feed', 'line')
+
+    def __init__(self, mode, start, end, center, feed, line):
+        self.mode = mode
+        self.start = start
+        self.end = end
+        self.center = center
+        self.feed = feed
+        self.line = line
+
+    def is_zero_length(self):
+        return self.mode in (0, 1) and self.start == self.end
+
+    def key(self):
+        return (self.mode, self.end, self.center, self.feed)
+
+    def length(self):
+        '''
+        The distance travelled, leaving out any axis whose start position is unknown.
+        '''
+        deltas = [end - start for (start, end) in zip(self.start, self.end) if start is not None and end is not None]
+        if self.center is None or len(deltas) < 2:
+            return math.sqrt(sum(delta * delta for delta in deltas))
+        (cx, cy) = self.center
+        radius = math.hypot(self.start[0] - cx, self.start[1] - cy)
+        sweep = math.atan2(self.end[1] - cy, self.end[0] - cx) - math.atan2(self.start[1] - cy, self.start[0] - cx)
+        if self.mode == 2:
+            sweep = -sweep
+        sweep %= 2 * math.pi
+        planar = radius * (sweep or 2 * math.pi)
+        dz = deltas[2] if len(deltas) > 2 else 0.0
+        return math.hypot(planar, dz)
+
+    def __repr__(self):
+        return 'Move(g{} {} -> {}{})'.format(self.mode, self.start, self.end, ' center ' + str(self.center) if self.center else '')
+
+class Command:
+    '''
+    A non-motion action, such as a spindle, dwell or unit change.  code is the text of the word, like 'm4' or 'g4'.
+    '''
+    __slots__ = ('code', 'parameters', 'line')
+
+    def __init__(self, code, parameters, line):
+        self.code = code
+        self.parameters = parameters
+        self.line = line
+
+    def key(self):
+        return (self.code, self.parameters)
+
+    def __repr__(self):
+        return 'Command({} {})'.format(self.code, self.parameters)
+
+class Interpreter:
+    '''
+    Interprets g-code a line at a time.  Positions start out unknown (None) until a move sets them.
+    '''
+    def __init__(self):
+        self.mode = None
+        self.units = None
+        self.absolute = True
+        self.position = [None, None, None]
+        self.feed = None
+        self.line_number = 0
+
+    def execute(self, line):
+        '''
+        Interpret one line and return the list of Moves and Commands it produces.
+        '''
+        self.line_number += 1
+        words = parse_words(line)
+        results = []
+        axes = {}
+        offsets = {}
+        parameters = []
+        mode = None
+        for (letter, value) in words:
+            if letter == 'g':
+                code = int(value) if value == int(value) else value
+                if code in MOTION_CODES:
+                    mode = code
+                elif code in (20, 21):
+                    self.units = code
+                    results.append(Command('g' + str(code), (), self.line_number))
+                elif code == 90:
+                    self.absolute = True
+                elif code == 91:
+                    self.absolute = False
+                else:
+                    results.append(Command('g' + str(code), parameters, self.line_number))
+            elif letter == 'm':
+                results.append(Command('m' + str(int(value)), (), self.line_number))
+            elif letter in 'xyz':
+                axes[letter] = value
+            elif letter in 'ij':
+                offsets[letter] = value
+            elif letter == 'f':
+                self.feed = value
+            else:
+                parameters.append((letter, value))
+
+        # Parameters such as a dwell time belong to the non-motion G code on the line.
+        for command in results:
+            if command.code not in ('g20', 'g21') and command.code.startswith('g'):
+                command.parameters = tuple(parameters)
+
+        if mode is not None:
+            self.mode = mode
+        if axes:
+            if self.mode is None:
+                raise ValueError('Line {}: axis words without a motion mode'.format(self.line_number))
+            start = tuple(self.position)
+            for (index, letter) in enumerate('xyz'):
+                if letter in axes:
+                    if self.absolute:
+                        self.position[index] = axes[letter]
+                    elif self.position[index] is not None:
+                        self.position[index] += axes[letter]
+                    else:
+                        raise ValueError('Line {}: incremental move from an unknown position'.format(self.line_number))
+            center = None
+            if self.mode in (2, 3):
+                if start[0] is None or start[1] is None:
+                    raise ValueError('Line {}: arc from an unknown position'.format(self.line_number))
+                center = (round(start[0] + offsets.get('i', 0.0), 9), round(start[1] + offsets.get('j', 0.0), 9))
+            results.append(Move(self.mode, start, tuple(self.position), center, None if self.mode == 0 else self.feed, self.line_number))
+        return results
+
+    def run(self, lines):
+        '''
+        Yield the Moves and Commands of every line.
+        '''
+        for line in lines:
+            for result in self.execute(line):
+                yield result
+
+class ProgramStats:
+    '''
+    Totals for the motion of a program, with lengths in the program units.
+    A retract is a rapid that raises z and a plunge is a feed move straight down.
+    '''
+    def __init__(self):
+        self.cut_length = 0.0
+        self.rapid_length = 0.0
+        self.retracts = 0
+        self.plunges = 0
+        self.moves = 0
+
+    def add(self, move):
+        self.moves += 1
+        (start_z, end_z) = (move.start[2], move.end[2])
+        if move.mode == 0:
+            self.rapid_length += move.length()
+            if start_z is not None and end_z > start_z:
+                self.retracts += 1
+        else:
+            self.cut_length += move.length()
+            if start_z is not None and end_z < start_z and move.start[:2] == move.end[:2]:
+                self.plunges += 1
+
+def measure(lines, stats):
+    '''
+    Yield the lines unchanged while adding up their motion in the ProgramStats stats.
+    Moves that go nowhere aren't counted.
+    '''
+    machine = Interpreter()
+    for line in lines:
+        for result in machine.execute(line):
+            if isinstance(result, Move) and not result.is_zero_length():
+                stats.add(result)
+        yield line
+
+def actions(lines, skip_zero_length=True):
+    '''
+    Yield the comparison keys of what a program does, optionally leaving out moves that go nowhere.
+    '''
+    for result in Interpreter().run(lines):
+        if skip_zero_length and isinstance(result, Move) and result.is_zero_length():
+            continue
+        yield (type(result).__name__,) + result.key()
+
+def same_motion(lines1, lines2):
+    '''
+    Return True if two programs make the machine do the same thing.
+    '''
+    sentinel = object()
+    iter1 = actions(lines1)
+    iter2 = actions(lines2)
+    while True:
+        action1 = next(iter1, sentinel)
+        action2 = next(iter2, sentinel)
+        if action1 != action2:
+            return False
+        if action1 is sentinel:
+            return True
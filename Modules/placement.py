@@ -0,0 +1,184 @@
+'''
+Random placement of shapes on a seat for the design commands.
+Placed shapes are kept in a uniform grid so a candidate is only checked against the
+shapes in the cells around it, which keeps each check O(1) no matter how many shapes
+have been placed.  The same seed always gives the same placement.
+'''
+import math
+import random
+
+# The number of failed candidates around a placed circle before it's considered surrounded.
+FRONTIER_ATTEMPTS = 20
+
+def place_circles(count, min_diameter, max_diameter, width, height, border=0.0, allow_overlap=False, seed=None, attempts=50):
+    '''
+    Return a list of up to count (x, y, radius) circles inside a width by height seat.
+    Diameters are picked uniformly between min_diameter and max_diameter.  Circles stay border
+    away from the edges of the seat and, unless allow_overlap is set, more than border away
+    from each other.
+    Circles are first placed at uniformly random positions.  When that fails attempts times in
+    a row the seat is getting crowded, so candidates are taken just outside the circles already
+    placed (like Poisson-disk sampling) until every circle is surrounded.  A candidate that
+    doesn't fit at its size is shrunk to fit the free space around it, down to min_diameter.
+    '''
+    rng = random.Random(seed)
+    max_diameter = max(max_diameter, min_diameter)
+    min_radius = min_diameter / 2.0
+    grid = _CircleGrid(max_diameter + border, border)
+    circles = []
+    frontier = []
+    failures = []
+    if min(width, height) - border * 2 < min_diameter:
+        return circles
+
+    while len(circles) < count:
+        placed = None
+        for attempt in range(attempts):
+            diameter = rng.random() * (max_diameter - min_diameter) + min_diameter
+            radius = diameter / 2.0
+            x = (rng.random() * (width - diameter - (border*2))) + border + radius
+            y = (rng.random() * (height - diameter - (border*2))) + border + radius
+            if allow_overlap:
+                placed = (x, y, radius)
+                break
+            placed = grid.fit(x, y, radius, min_radius)
+            if placed:
+                break
+
+        # Try next to the circles that still have room around them.
+        while placed is None and frontier:
+            index = rng.randrange(len(frontier))
+            (cx, cy, cr) = circles[frontier[index]]
+            radius = (rng.random() * (max_diameter - min_diameter) + min_diameter) / 2.0
+            angle = rng.random() * 2 * math.pi
+            distance = cr + border + radius * (1 + rng.random())
+            (x, y) = (cx + distance * math.cos(angle), cy + distance * math.sin(angle))
+
+            # Keep the circle inside the seat by shrinking it if needed.
+            radius = min(radius, x - border, width - border - x, y - border, height - border - y)
+            if radius >= min_radius:
+                placed = grid.fit(x, y, radius, min_radius)
+            if placed is None:
+                failures[frontier[index]] += 1
+                if failures[frontier[index]] >= FRONTIER_ATTEMPTS:
+                    frontier[index] = frontier[-1]
+                    frontier.pop()
+
+        if placed is None:
+            break
+        if not allow_overlap:
+            grid.add(placed)
+            frontier.append(len(circles))
+            failures.append(0)
+        circles.append(placed)
+
+    return circles
+
+class _CircleGrid:
+    # Placed circles by grid cell.  A circle can only conflict with circles whose centers
+    # are closer than cell_size, so only the neighboring cells need to be checked.
+    def __init__(self, cell_size, spacing):
+        self.cell_size = cell_size
+        self.spacing = spacing
+        self.cells = {}
+
+    def cell(self, x, y):
+        return (int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size)))
+
+    def add(self, circle):
+        self.cells.setdefault(self.cell(circle[0], circle[1]), []).append(circle)
+
+    def fit(self, x, y, radius, min_radius):
+        # Returns the circle at (x, y), shrunk if needed, or None if there's less than min_radius of room.
+        free = radius
+        (column, row) = self.cell(x, y)
+        for cell_column in range(column - 1, column + 2):
+            for cell_row in range(row - 1, row + 2):
+                for (cx, cy, cr) in self.cells.get((cell_column, cell_row), ()):
+                    free = min(free, math.hypot(x - cx, y - cy) - cr - self.spacing)
+        # Leave a little room so shrunk circles never touch their neighbors.
+        if free < radius:
+            free *= 1 - 1e-9
+        if free >= min_radius:
+            return (x, y, free)
+        return None
+
+def place_rectangles(count, min_size, max_width, max_height, width, height, border=0.0, allow_overlap=False, seed=None,
+                     attempts=100, spacing=0.0):
+    '''
+    Return a list of up to count (x0, y0, x1, y1) rectangles inside a width by height seat.
+    Each side is picked uniformly up to max_width or max_height, but not less than min_size.
+    Rectangles stay border away from the edges of the seat and, unless allow_overlap is set,
+    don't touch each other (or stay more than spacing apart).
+    A candidate that overlaps other rectangles is cut back to the free space in front of its
+    corner when that leaves at least min_size in each direction.  Placing stops when a rectangle
+    can't be placed in attempts tries, so it always finishes in count * attempts tries.
+    '''
+    rng = random.Random(seed)
+    grid = _RectangleGrid(max(min(max_width, max_height), min_size) + spacing)
+    rectangles = []
+    (room_width, room_height) = (width - border * 2, height - border * 2)
+    if min(room_width, room_height) < min_size:
+        return rectangles
+    for i in range(count):
+        placed = None
+        for attempt in range(attempts):
+            new_width = min(max(rng.random() * max_width, min_size), room_width)
+            new_height = min(max(rng.random() * max_height, min_size), room_height)
+            x = (rng.random() * (width - new_width - (border*2))) + border
+            y = (rng.random() * (height - new_height - (border*2))) + border
+            candidate = (x, y, x + new_width, y + new_height)
+            if allow_overlap:
+                placed = candidate
+                break
+            placed = grid.fit(candidate, min_size, spacing)
+            if placed:
+                break
+
+        if placed is None:
+            break
+        if not allow_overlap:
+            grid.add(placed)
+        rectangles.append(placed)
+
+    return rectangles
+
+class _RectangleGrid:
+    # Placed rectangles, listed in every grid cell they cover.
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def cells_of(self, rect, margin=0.0):
+        size = self.cell_size
+        for column in range(int(math.floor((rect[0] - margin) / size)), int(math.floor((rect[2] + margin) / size)) + 1):
+            for row in range(int(math.floor((rect[1] - margin) / size)), int(math.floor((rect[3] + margin) / size)) + 1):
+                yield (column, row)
+
+    def add(self, rect):
+        for cell in self.cells_of(rect):
+            self.cells.setdefault(cell, []).append(rect)
+
+    def fit(self, rect, min_size, spacing):
+        # Returns the rectangle, cut back to avoid the others, or None if it doesn't fit.
+        (x0, y0, x1, y1) = rect
+        nearby = set()
+        for cell in self.cells_of(rect, spacing):
+            nearby.update(self.cells.get(cell, ()))
+
+        # Closest first, so the cuts leave as much of the rectangle as possible.
+        for (ox0, oy0, ox1, oy1) in sorted(nearby, key=lambda other: max(other[0] - x0, other[1] - y0)):
+            if ox0 - spacing > x1 or x0 > ox1 + spacing or oy0 - spacing > y1 or y0 > oy1 + spacing:
+                continue
+            # Cut the right or the top side back, whichever leaves the larger rectangle.
+            options = []
+            right = ox0 - spacing - 1e-9
+            if right - x0 >= min_size:
+                options.append(((right - x0) * (y1 - y0), (x0, y0, right, y1)))
+            top = oy0 - spacing - 1e-9
+            if top - y0 >= min_size:
+                options.append(((x1 - x0) * (top - y0), (x0, y0, x1, top)))
+            if not options:
+                return None
+            (x0, y0, x1, y1) = max(options)[1]
+        return (x0, y0, x1, y1)
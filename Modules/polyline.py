@@ -0,0 +1,335 @@
+from array import array
+import math
+
+# Distance at which two points are considered the same point, in centimeters.
+pointTolerance = 1e-8
+
+class polyLine():
+    '''
+    A connected series of points stored as interleaved x, y, z values.
+    Points added to the front are kept in a separate array in reverse order so
+    adding to either end is amortized O(1), and reversing only flips a flag.
+    The physical order of the points is reversed(head) + tail, and the logical
+    order is the reverse of that when isReversed is set.
+    arcCenter is the (x, y) center when the points were stroked from a single
+    circle or circular arc, so it can be cut as an arc.
+    '''
+    __slots__ = ('head', 'tail', 'isReversed', 'isClosed', 'arcCenter')
+
+    def __init__(self, points = None):
+        '''
+        points is a sequence of (x, y) or (x, y, z) tuples
+        '''
+        self.head = array('d')
+        self.tail = array('d')
+        self.isReversed = False
+        self.isClosed = False
+        self.arcCenter = None
+        if points:
+            for point in points:
+                self.tail.append(point[0])
+                self.tail.append(point[1])
+                self.tail.append(point[2] if len(point) > 2 else 0.0)
+            self.checkClosed()
+
+    @classmethod
+    def fromPoint3Ds(cls, points):
+        '''
+        Create a polyline from objects with x, y and z attributes, such as adsk.core.Point3D.
+        '''
+        poly = cls()
+        tail = poly.tail
+        for point in points:
+            tail.append(point.x)
+            tail.append(point.y)
+            tail.append(point.z)
+        poly.checkClosed()
+        return poly
+
+    @classmethod
+    def fromCoordinates(cls, coordinates):
+        '''
+        Create a polyline from a flat sequence of x, y, z values.
+        '''
+        poly = cls()
+        poly.tail = array('d', coordinates)
+        poly.checkClosed()
+        return poly
+
+    def copy(self):
+        '''
+        Return an independent copy of the polyline.
+        '''
+        poly = polyLine()
+        poly.head = array('d', self.head)
+        poly.tail = array('d', self.tail)
+        poly.isReversed = self.isReversed
+        poly.isClosed = self.isClosed
+        poly.arcCenter = self.arcCenter
+        return poly
+
+    def pointCount(self):
+        return (len(self.head) + len(self.tail)) // 3
+
+    def point(self, index):
+        '''
+        Return the point at the logical index as an (x, y, z) tuple.
+        '''
+        count = self.pointCount()
+        if index < 0:
+            index += count
+        if self.isReversed:
+            index = count - 1 - index
+        headCount = len(self.head) // 3
+        if index < headCount:
+            offset = (headCount - 1 - index) * 3
+            return (self.head[offset], self.head[offset+1], self.head[offset+2])
+        offset = (index - headCount) * 3
+        return (self.tail[offset], self.tail[offset+1], self.tail[offset+2])
+
+    def startPoint(self):
+        if self.pointCount() == 0:
+            return None
+        else:
+            return self.point(0)
+
+    def endPoint(self):
+        if self.pointCount() == 0:
+            return None
+        else:
+            return self.point(-1)
+
+    def coordinates(self):
+        '''
+        Return the points in logical order as a flat array of x, y, z values.
+        '''
+        physical = _reversedPoints(self.head)
+        physical.extend(self.tail)
+        if self.isReversed:
+            return _reversedPoints(physical)
+        return physical
+
+    def points(self):
+        '''
+        Return the points in order as a list of (x, y, z) tuples.
+        '''
+        coords = self.coordinates()
+        return list(zip(coords[0::3], coords[1::3], coords[2::3]))
+
+    def xyPoints(self):
+        '''
+        Return the points in order as a list of (x, y) tuples.
+        '''
+        coords = self.coordinates()
+        return list(zip(coords[0::3], coords[1::3]))
+
+    def asString(self):
+        result = ''
+        for point in self.points():
+            result += str(point[0]) + ', ' + str(point[1]) + ', ' + str(point[2]) + '\n'
+        return result
+
+    def reverse(self):
+        self.isReversed = not self.isReversed
+
+    def append(self, point):
+        self.extend(array('d', (point[0], point[1], point[2] if len(point) > 2 else 0.0)), False)
+
+    def prepend(self, point):
+        self.extend(array('d', (point[0], point[1], point[2] if len(point) > 2 else 0.0)), True)
+
+    def extend(self, coordinates, atStart):
+        '''
+        Add a flat array of x, y, z values, in logical order, to the start or end of the polyline.
+        '''
+        if atStart == self.isReversed:
+            # The points go after the physical end.
+            if self.isReversed:
+                coordinates = _reversedPoints(coordinates)
+            self.tail.extend(coordinates)
+        else:
+            # The points go before the physical start, which is stored reversed.
+            if not self.isReversed:
+                coordinates = _reversedPoints(coordinates)
+            self.head.extend(coordinates)
+
+    # Changes the start of a closed polyline to the point at the specified index.
+    def rotate(self, index):
+        if self.isClosed and index > 0:
+            coords = self.coordinates()
+            self.head = array('d')
+            self.tail = coords[index*3:-3]
+            self.tail.extend(coords[:index*3+3])
+            self.isReversed = False
+
+    def checkClosed(self, tolerance = None):
+        if self.pointCount() > 1:
+            self.isClosed = pointDistance(self.startPoint(), self.endPoint()) <= (pointTolerance if tolerance is None else tolerance)
+        return self.isClosed
+
+    def connects(self, poly, tolerance = None):
+        if not self.isClosed:
+            tolerance = pointTolerance if tolerance is None else tolerance
+            for thisPoint in (self.startPoint(), self.endPoint()):
+                for otherPoint in (poly.startPoint(), poly.endPoint()):
+                    if pointDistance(thisPoint, otherPoint) <= tolerance:
+                        return True
+        return False
+
+    def connect(self, poly, tolerance = None):
+        isConnected = False
+        if not self.isClosed:
+            tolerance = pointTolerance if tolerance is None else tolerance
+            thisStart = self.startPoint()
+            thisEnd = self.endPoint()
+
+            otherStart = poly.startPoint()
+            otherEnd = poly.endPoint()
+
+            if pointDistance(thisStart, otherStart) <= tolerance:
+                isConnected = self.joinAt(poly, True, True, tolerance)
+            elif pointDistance(thisStart, otherEnd) <= tolerance:
+                isConnected = self.joinAt(poly, True, False, tolerance)
+            elif pointDistance(thisEnd, otherStart) <= tolerance:
+                isConnected = self.joinAt(poly, False, True, tolerance)
+            elif pointDistance(thisEnd, otherEnd) <= tolerance:
+                isConnected = self.joinAt(poly, False, False, tolerance)
+
+        return isConnected
+
+    # Joins another polyline to this one.  atThisStart indicates if the
+    # shared point is the start or end of this polyline and atOtherStart
+    # indicates if it's the start or end of the other polyline.  The
+    # shared point is only kept once.
+    def joinAt(self, poly, atThisStart, atOtherStart, tolerance = None):
+        coords = poly.coordinates()
+        if atThisStart:
+            if atOtherStart:
+                # Reverse the other polyline and add it to the front of the existing polyline.
+                coords = _reversedPoints(coords[3:])
+            else:
+                # Add the other polyline to the front of this one maintaining
+                # the same point order of the other polyline.
+                coords = coords[:-3]
+        else:
+            if atOtherStart:
+                coords = coords[3:]
+            else:
+                coords = _reversedPoints(coords[:-3])
+        self.extend(coords, atThisStart)
+        self.arcCenter = None
+
+        # Check to see if the polyline is closed.
+        self.checkClosed(tolerance)
+        return True
+
+
+# Spatial hash of the open ends of polylines, used to find the polyline that
+# connects to a given point without comparing against every polyline.  Points
+# are quantized to a grid whose cells are the size of the snap tolerance, so
+# any end within the tolerance is in the same or a neighboring cell.
+class endpointIndex():
+    def __init__(self, tolerance):
+        self.tolerance = tolerance
+        self.cells = {}
+
+    def cellKey(self, point):
+        return (int(math.floor(point[0] / self.tolerance)), int(math.floor(point[1] / self.tolerance)))
+
+    def add(self, order, poly):
+        for isStart in (True, False):
+            point = poly.startPoint() if isStart else poly.endPoint()
+            self.cells.setdefault(self.cellKey(point), []).append((order, poly, isStart))
+
+    def remove(self, poly):
+        for point in (poly.startPoint(), poly.endPoint()):
+            key = self.cellKey(point)
+            entries = self.cells.get(key)
+            if entries:
+                entries[:] = [entry for entry in entries if entry[1] is not poly]
+                if not entries:
+                    del self.cells[key]
+
+    # Returns a list of (order, poly, isStart) for every indexed end within
+    # tolerance of the point.
+    def find(self, point):
+        (cellX, cellY) = self.cellKey(point)
+        found = []
+        for i in range(cellX-1, cellX+2):
+            for j in range(cellY-1, cellY+2):
+                entries = self.cells.get((i,j))
+                if entries:
+                    for entry in entries:
+                        end = entry[1].startPoint() if entry[2] else entry[1].endPoint()
+                        if pointDistance(end, point) <= self.tolerance:
+                            found.append(entry)
+        return found
+
+
+# Connects polylines that share end points, giving the same polylines as
+# comparing every pair with polyLine.connect.  Each polyline is first joined
+# to the earliest open polyline it connects to, or kept as a new one.  Then
+# each polyline in turn takes in every later-listed polyline that connects to
+# its current ends, and that is repeated until nothing more connects.  The
+# polylines passed in may be modified and the returned list only contains the
+# connected results.
+def chainPolyLines(polyLines, tolerance = pointTolerance):
+    # Ends of the open polylines, which are the only ones that take in others.
+    index = endpointIndex(tolerance)
+    chains = []
+    for poly in polyLines:
+        if poly.pointCount() == 0:
+            continue
+
+        found = index.find(poly.startPoint()) + index.find(poly.endPoint())
+        if found:
+            (order, match, isStart) = min(found, key=lambda entry: entry[0])
+            index.remove(match)
+            match.connect(poly, tolerance)
+            if not match.isClosed:
+                index.add(order, match)
+        else:
+            if not poly.isClosed:
+                index.add(len(chains), poly)
+            chains.append(poly)
+
+    # Ends of every polyline, since a closed polyline can still be taken in.
+    index = endpointIndex(tolerance)
+    for (order, poly) in enumerate(chains):
+        index.add(order, poly)
+    connected = True
+    while connected:
+        connected = False
+        for (order, poly) in enumerate(chains):
+            if not poly:
+                continue
+            after = -1
+            while not poly.isClosed:
+                # The next polyline in the list that touches either end of this one.
+                found = [entry for entry in index.find(poly.startPoint()) + index.find(poly.endPoint())
+                         if entry[0] > after and entry[1] is not poly]
+                if not found:
+                    break
+                (after, match, isStart) = min(found, key=lambda entry: entry[0])
+                index.remove(match)
+                index.remove(poly)
+                poly.connect(match, tolerance)
+                index.add(order, poly)
+                chains[after] = None
+                connected = True
+
+    return [poly for poly in chains if poly]
+
+
+def pointDistance(point1, point2):
+    return math.sqrt((point1[0] - point2[0])**2 + (point1[1] - point2[1])**2 + (point1[2] - point2[2])**2)
+
+
+def _reversedPoints(coordinates):
+    # Reverse the order of the points in a flat x, y, z array, keeping each point's values in order.
+    result = array('d', coordinates)
+    if len(coordinates) > 0:
+        result[0::3] = coordinates[-3::-3]
+        result[1::3] = coordinates[-2::-3]
+        result[2::3] = coordinates[-1::-3]
+    return result
@@ -0,0 +1,497 @@
+'''
+Readers that load polylines for the toolpath pipeline from JSON, SVG and DXF files.
+Curves are broken into lines within a tolerance and all coordinates are returned in centimeters.
+'''
+import json
+import math
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+
+from .polyline import polyLine
+
+# Number of centimeters in each supported unit.
+UNITS = {'cm': 1.0, 'mm': 0.1, 'in': 2.54}
+
+# DXF $INSUNITS codes for the supported units.
+DXF_UNITS = {1: 'in', 4: 'mm', 5: 'cm'}
+
+def read_polylines(filename, units=None, tolerance=0.005):
+    '''
+    Read the polylines from a .json, .svg or .dxf file.
+    units is the unit of the coordinates in the file ('cm', 'mm' or 'in').  JSON files default to cm,
+    or the "units" value in the file, SVG files default to mm and DXF files use their $INSUNITS header or mm.
+    tolerance is the maximum distance in centimeters between a curve and the lines that replace it
+    '''
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.json':
+        with open(filename) as fp:
+            return read_json(fp, units)
+    elif extension == '.svg':
+        with open(filename, 'rb') as fp:
+            return read_svg(fp, units, tolerance)
+    elif extension == '.dxf':
+        with open(filename, errors='replace') as fp:
+            return read_dxf(fp, units, tolerance)
+    raise ValueError('Unsupported file type: ' + filename)
+
+def read_json(fp, units=None):
+    '''
+    Read polylines from JSON that is either a list of polylines or an object with a "polylines" list
+    and an optional "units" value.  Each polyline is a list of [x, y] or [x, y, z] points.
+    '''
+    data = json.load(fp)
+    if isinstance(data, dict):
+        units = units or data.get('units')
+        data = data['polylines']
+    scale = _scale(units or 'cm')
+    return [polyLine([[value * scale for value in point] for point in points]) for points in data if len(points) > 0]
+
+def read_svg(fp, units=None, tolerance=0.005):
+    '''
+    Read the line, polyline, polygon, rect, circle, ellipse and path elements of an SVG document.
+    Transforms on the elements and their groups are applied.  Coordinates are used as they are,
+    without flipping the y axis.
+    '''
+    scale = _scale(units or 'mm')
+    tolerance = tolerance / scale
+    shapes = []
+    root = ElementTree.parse(fp).getroot()
+    _read_svg_element(root, _IDENTITY, tolerance, shapes)
+    polylines = []
+    for (points, center) in shapes:
+        if len(points) > 1:
+            poly = polyLine([(x * scale, y * scale) for (x, y) in points])
+            if center:
+                poly.arcCenter = (center[0] * scale, center[1] * scale)
+            polylines.append(poly)
+    return polylines
+
+def read_dxf(fp, units=None, tolerance=0.005):
+    '''
+    Read the LINE, LWPOLYLINE, POLYLINE, CIRCLE, ARC and SPLINE entities of an ASCII DXF file.
+    '''
+    pairs = _dxf_pairs(fp)
+    if units is None:
+        units = DXF_UNITS.get(_dxf_header_value(pairs, '$INSUNITS'), 'mm')
+    scale = _scale(units)
+    tolerance = tolerance / scale
+
+    polylines = []
+    for (kind, entity, vertices) in _dxf_entities(pairs):
+        points = _dxf_entity_points(kind, entity, vertices, tolerance)
+        if points and len(points) > 1:
+            poly = polyLine([(x * scale, y * scale) for (x, y) in points])
+            if kind in ('CIRCLE', 'ARC'):
+                poly.arcCenter = (_dxf_float(entity, 10) * scale, _dxf_float(entity, 20) * scale)
+            polylines.append(poly)
+    return polylines
+
+def stroke_arc(cx, cy, radius, start_angle, sweep, tolerance):
+    '''
+    Return points along a circular arc, spaced so no chord is farther than tolerance from the arc.
+    Angles are in radians and a negative sweep goes clockwise.
+    '''
+    if radius <= tolerance:
+        step = math.pi / 2
+    else:
+        step = 2 * math.acos(1 - tolerance / radius)
+    count = max(int(math.ceil(abs(sweep) / step)), 1)
+    return [(cx + radius * math.cos(start_angle + sweep * i / count), cy + radius * math.sin(start_angle + sweep * i / count))
+            for i in range(count + 1)]
+
+def _scale(units):
+    if units not in UNITS:
+        raise ValueError('Unsupported units: ' + str(units))
+    return UNITS[units]
+
+#******************* SVG ******************************************************
+
+_IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+_NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+
+def _multiply(m1, m2):
+    (a1, b1, c1, d1, e1, f1) = m1
+    (a2, b2, c2, d2, e2, f2) = m2
+    return (a1*a2 + c1*b2, b1*a2 + d1*b2, a1*c2 + c1*d2, b1*c2 + d1*d2, a1*e2 + c1*f2 + e1, b1*e2 + d1*f2 + f1)
+
+def _apply(matrix, point):
+    (a, b, c, d, e, f) = matrix
+    return (a*point[0] + c*point[1] + e, b*point[0] + d*point[1] + f)
+
+def _parse_transform(text):
+    matrix = _IDENTITY
+    for (name, args) in re.findall(r'(\w+)\s*\(([^)]*)\)', text or ''):
+        values = [float(v) for v in re.findall(_NUMBER, args)]
+        if name == 'matrix' and len(values) == 6:
+            step = tuple(values)
+        elif name == 'translate':
+            step = (1.0, 0.0, 0.0, 1.0, values[0], values[1] if len(values) > 1 else 0.0)
+        elif name == 'scale':
+            step = (values[0], 0.0, 0.0, values[1] if len(values) > 1 else values[0], 0.0, 0.0)
+        elif name == 'rotate':
+            angle = math.radians(values[0])
+            step = (math.cos(angle), math.sin(angle), -math.sin(angle), math.cos(angle), 0.0, 0.0)
+            if len(values) == 3:
+                step = _multiply(_multiply((1.0, 0.0, 0.0, 1.0, values[1], values[2]), step), (1.0, 0.0, 0.0, 1.0, -values[1], -values[2]))
+        elif name == 'skewX':
+            step = (1.0, 0.0, math.tan(math.radians(values[0])), 1.0, 0.0, 0.0)
+        elif name == 'skewY':
+            step = (1.0, math.tan(math.radians(values[0])), 0.0, 1.0, 0.0, 0.0)
+        else:
+            continue
+        matrix = _multiply(matrix, step)
+    return matrix
+
+def _length(element, name):
+    value = re.match(_NUMBER, element.get(name, '0').strip())
+    return float(value.group(0)) if value else 0.0
+
+def _read_svg_element(element, matrix, tolerance, found):
+    matrix = _multiply(matrix, _parse_transform(element.get('transform')))
+    tag = element.tag.split('}')[-1]
+
+    # Flattening is done before the transform so scale the tolerance to match.
+    scale = math.sqrt(abs(matrix[0]*matrix[3] - matrix[1]*matrix[2])) or 1.0
+    local_tolerance = tolerance / scale
+
+    shapes = []
+    center = None
+    if tag == 'line':
+        shapes.append([(_length(element, 'x1'), _length(element, 'y1')), (_length(element, 'x2'), _length(element, 'y2'))])
+    elif tag in ('polyline', 'polygon'):
+        values = [float(v) for v in re.findall(_NUMBER, element.get('points', ''))]
+        points = list(zip(values[0::2], values[1::2]))
+        if tag == 'polygon' and points:
+            points.append(points[0])
+        shapes.append(points)
+    elif tag == 'rect':
+        (x, y, w, h) = (_length(element, 'x'), _length(element, 'y'), _length(element, 'width'), _length(element, 'height'))
+        shapes.append([(x, y), (x + w, y), (x + w, y + h), (x, y + h), (x, y)])
+    elif tag == 'circle':
+        (cx, cy, r) = (_length(element, 'cx'), _length(element, 'cy'), _length(element, 'r'))
+        shapes.append(stroke_arc(cx, cy, r, 0.0, 2 * math.pi, local_tolerance))
+        # The circle is still a circle if the transform doesn't stretch or skew it.
+        if abs(matrix[0] - matrix[3]) < 1e-9 and abs(matrix[1] + matrix[2]) < 1e-9:
+            center = _apply(matrix, (cx, cy))
+    elif tag == 'ellipse':
+        (cx, cy, rx, ry) = (_length(element, 'cx'), _length(element, 'cy'), _length(element, 'rx'), _length(element, 'ry'))
+        points = stroke_arc(0.0, 0.0, max(rx, ry), 0.0, 2 * math.pi, local_tolerance)
+        if max(rx, ry) > 0:
+            shapes.append([(cx + x * rx / max(rx, ry), cy + y * ry / max(rx, ry)) for (x, y) in points])
+    elif tag == 'path':
+        shapes.extend(_svg_path(element.get('d', ''), local_tolerance))
+
+    for points in shapes:
+        found.append(([_apply(matrix, point) for point in points], center))
+
+    for child in element:
+        _read_svg_element(child, matrix, tolerance, found)
+
+def _svg_path(data, tolerance):
+    tokens = re.findall(r'[MmLlHhVvCcSsQqTtAaZz]|' + _NUMBER, data)
+    paths = []
+    points = []
+    current = (0.0, 0.0)
+    start = (0.0, 0.0)
+    control = None
+    command = None
+    index = 0
+
+    def numbers(count):
+        values = [float(v) for v in tokens[index:index+count]]
+        return values, index + count
+
+    while index < len(tokens):
+        if re.match('[A-Za-z]', tokens[index]):
+            command = tokens[index]
+            index += 1
+            if command in 'Zz':
+                if points:
+                    points.append(start)
+                    paths.append(points)
+                points = []
+                current = start
+                control = None
+                continue
+        elif command is None:
+            break
+
+        relative = command.islower()
+        upper = command.upper()
+        origin = current if relative else (0.0, 0.0)
+        if upper == 'M':
+            (values, index) = numbers(2)
+            if points:
+                paths.append(points)
+            current = (origin[0] + values[0], origin[1] + values[1])
+            start = current
+            points = [current]
+            # Additional coordinate pairs after a move are lines.
+            command = 'l' if relative else 'L'
+            control = None
+            continue
+        if not points:
+            points = [current]
+        if upper == 'L':
+            (values, index) = numbers(2)
+            current = (origin[0] + values[0], origin[1] + values[1])
+            points.append(current)
+            control = None
+        elif upper == 'H':
+            (values, index) = numbers(1)
+            current = ((current[0] if relative else 0.0) + values[0], current[1])
+            points.append(current)
+            control = None
+        elif upper == 'V':
+            (values, index) = numbers(1)
+            current = (current[0], (current[1] if relative else 0.0) + values[0])
+            points.append(current)
+            control = None
+        elif upper in 'CS':
+            if upper == 'C':
+                (values, index) = numbers(6)
+                p1 = (origin[0] + values[0], origin[1] + values[1])
+                rest = values[2:]
+            else:
+                (values, index) = numbers(4)
+                p1 = (2 * current[0] - control[0], 2 * current[1] - control[1]) if control and control[2] == 'C' else current
+                rest = values
+            p2 = (origin[0] + rest[0], origin[1] + rest[1])
+            p3 = (origin[0] + rest[2], origin[1] + rest[3])
+            points.extend(_flatten_cubic(current, p1, p2, p3, tolerance)[1:])
+            control = (p2[0], p2[1], 'C')
+            current = p3
+        elif upper in 'QT':
+            if upper == 'Q':
+                (values, index) = numbers(4)
+                p1 = (origin[0] + values[0], origin[1] + values[1])
+                rest = values[2:]
+            else:
+                (values, index) = numbers(2)
+                p1 = (2 * current[0] - control[0], 2 * current[1] - control[1]) if control and control[2] == 'Q' else current
+                rest = values
+            p2 = (origin[0] + rest[0], origin[1] + rest[1])
+            points.extend(_flatten_quadratic(current, p1, p2, tolerance)[1:])
+            control = (p1[0], p1[1], 'Q')
+            current = p2
+        elif upper == 'A':
+            (values, index) = numbers(7)
+            end = (origin[0] + values[5], origin[1] + values[6])
+            points.extend(_svg_arc(current, values[0], values[1], values[2], values[3] != 0, values[4] != 0, end, tolerance)[1:])
+            current = end
+            control = None
+        else:
+            index += 1
+
+    if len(points) > 1:
+        paths.append(points)
+    return paths
+
+def _flatten_cubic(p0, p1, p2, p3, tolerance):
+    # The deviation of n uniform segments is at most 6 * max(second difference) / (8 * n^2).
+    second = max(math.hypot(p0[0] - 2*p1[0] + p2[0], p0[1] - 2*p1[1] + p2[1]),
+                 math.hypot(p1[0] - 2*p2[0] + p3[0], p1[1] - 2*p2[1] + p3[1]))
+    count = max(int(math.ceil(math.sqrt(6 * second / (8 * tolerance)))), 1)
+    points = []
+    for i in range(count + 1):
+        t = i / count
+        s = 1 - t
+        points.append((s*s*s*p0[0] + 3*s*s*t*p1[0] + 3*s*t*t*p2[0] + t*t*t*p3[0],
+                       s*s*s*p0[1] + 3*s*s*t*p1[1] + 3*s*t*t*p2[1] + t*t*t*p3[1]))
+    return points
+
+def _flatten_quadratic(p0, p1, p2, tolerance):
+    second = math.hypot(p0[0] - 2*p1[0] + p2[0], p0[1] - 2*p1[1] + p2[1])
+    count = max(int(math.ceil(math.sqrt(2 * second / (8 * tolerance)))), 1)
+    points = []
+    for i in range(count + 1):
+        t = i / count
+        s = 1 - t
+        points.append((s*s*p0[0] + 2*s*t*p1[0] + t*t*p2[0], s*s*p0[1] + 2*s*t*p1[1] + t*t*p2[1]))
+    return points
+
+def _svg_arc(p1, rx, ry, rotation, large_arc, sweep, p2, tolerance):
+    # Endpoint to center conversion from the SVG specification, appendix F.6.5.
+    rx = abs(rx)
+    ry = abs(ry)
+    if rx == 0 or ry == 0 or p1 == p2:
+        return [p1, p2]
+    phi = math.radians(rotation)
+    (cos_phi, sin_phi) = (math.cos(phi), math.sin(phi))
+    dx = (p1[0] - p2[0]) / 2
+    dy = (p1[1] - p2[1]) / 2
+    x1 = cos_phi * dx + sin_phi * dy
+    y1 = -sin_phi * dx + cos_phi * dy
+    radii = (x1 * x1) / (rx * rx) + (y1 * y1) / (ry * ry)
+    if radii > 1:
+        rx *= math.sqrt(radii)
+        ry *= math.sqrt(radii)
+    numerator = rx*rx*ry*ry - rx*rx*y1*y1 - ry*ry*x1*x1
+    factor = math.sqrt(max(numerator, 0) / (rx*rx*y1*y1 + ry*ry*x1*x1))
+    if large_arc == sweep:
+        factor = -factor
+    cx1 = factor * rx * y1 / ry
+    cy1 = -factor * ry * x1 / rx
+    cx = cos_phi * cx1 - sin_phi * cy1 + (p1[0] + p2[0]) / 2
+    cy = sin_phi * cx1 + cos_phi * cy1 + (p1[1] + p2[1]) / 2
+    start = math.atan2((y1 - cy1) / ry, (x1 - cx1) / rx)
+    end = math.atan2((-y1 - cy1) / ry, (-x1 - cx1) / rx)
+    delta = end - start
+    if sweep and delta < 0:
+        delta += 2 * math.pi
+    elif not sweep and delta > 0:
+        delta -= 2 * math.pi
+
+    points = []
+    for (x, y) in stroke_arc(0.0, 0.0, max(rx, ry), start, delta, tolerance):
+        (x, y) = (x * rx / max(rx, ry), y * ry / max(rx, ry))
+        points.append((cos_phi * x - sin_phi * y + cx, sin_phi * x + cos_phi * y + cy))
+    points[-1] = p2
+    return points
+
+#******************* DXF ******************************************************
+
+def _dxf_pairs(fp):
+    lines = fp.read().splitlines()
+    pairs = []
+    for i in range(0, len(lines) - 1, 2):
+        try:
+            pairs.append((int(lines[i].strip()), lines[i+1].strip()))
+        except ValueError:
+            raise ValueError('Not an ASCII DXF file (bad group code on line {})'.format(i + 1))
+    return pairs
+
+def _dxf_header_value(pairs, name):
+    for i in range(len(pairs) - 1):
+        if pairs[i] == (9, name):
+            try:
+                return int(pairs[i+1][1])
+            except ValueError:
+                return None
+    return None
+
+def _dxf_entities(pairs):
+    # Yield (type, [(code, value)], vertices) for each entity in the ENTITIES section.
+    in_entities = False
+    entity = None
+    vertices = []
+    polyline = None
+    for (code, value) in pairs:
+        if code == 0:
+            if entity:
+                if entity[0] == 'POLYLINE':
+                    polyline = entity
+                    vertices = []
+                elif entity[0] == 'VERTEX' and polyline:
+                    vertices.append(entity[1])
+                else:
+                    yield (entity[0], entity[1], [])
+                entity = None
+            if value == 'SEQEND' and polyline:
+                yield ('POLYLINE', polyline[1], vertices)
+                polyline = None
+                continue
+            if value == 'ENDSEC':
+                in_entities = False
+            elif in_entities:
+                entity = (value, [])
+        elif code == 2 and value == 'ENTITIES':
+            in_entities = True
+        elif entity:
+            entity[1].append((code, value))
+
+def _dxf_float(entity, code, default=0.0):
+    for (c, value) in entity:
+        if c == code:
+            return float(value)
+    return default
+
+def _dxf_floats(entity, code):
+    return [float(value) for (c, value) in entity if c == code]
+
+def _dxf_bulge_points(vertices, closed, tolerance):
+    # vertices is a list of (x, y, bulge).
+    if closed and vertices:
+        vertices = vertices + [vertices[0]]
+    points = [vertices[0][:2]] if vertices else []
+    for i in range(len(vertices) - 1):
+        (x1, y1, bulge) = vertices[i]
+        (x2, y2) = vertices[i+1][:2]
+        if bulge == 0:
+            points.append((x2, y2))
+            continue
+        # The bulge is the tangent of a quarter of the arc's included angle and
+        # is positive for counterclockwise arcs.
+        sweep = 4 * math.atan(bulge)
+        chord = math.hypot(x2 - x1, y2 - y1)
+        radius = chord * (1 + bulge * bulge) / (4 * abs(bulge))
+        offset = (chord / 2) * (1 - bulge * bulge) / (2 * bulge)
+        center = ((x1 + x2) / 2 - (y2 - y1) / chord * offset, (y1 + y2) / 2 + (x2 - x1) / chord * offset)
+        start = math.atan2(y1 - center[1], x1 - center[0])
+        arc = stroke_arc(center[0], center[1], radius, start, sweep, tolerance)
+        arc[-1] = (x2, y2)
+        points.extend(arc[1:])
+    return points
+
+def _dxf_entity_points(kind, entity, vertices, tolerance):
+    if kind == 'LINE':
+        return [(_dxf_float(entity, 10), _dxf_float(entity, 20)), (_dxf_float(entity, 11), _dxf_float(entity, 21))]
+    elif kind == 'LWPOLYLINE':
+        points = []
+        for (code, value) in entity:
+            if code == 10:
+                points.append([float(value), 0.0, 0.0])
+            elif code == 20 and points:
+                points[-1][1] = float(value)
+            elif code == 42 and points:
+                points[-1][2] = float(value)
+        closed = int(_dxf_float(entity, 70)) & 1
+        return _dxf_bulge_points([tuple(p) for p in points], closed, tolerance)
+    elif kind == 'POLYLINE':
+        points = [(_dxf_float(v, 10), _dxf_float(v, 20), _dxf_float(v, 42)) for v in vertices]
+        closed = int(_dxf_float(entity, 70)) & 1
+        return _dxf_bulge_points(points, closed, tolerance)
+    elif kind == 'CIRCLE':
+        return stroke_arc(_dxf_float(entity, 10), _dxf_float(entity, 20), _dxf_float(entity, 40), 0.0, 2 * math.pi, tolerance)
+    elif kind == 'ARC':
+        start = math.radians(_dxf_float(entity, 50))
+        end = math.radians(_dxf_float(entity, 51))
+        sweep = (end - start) % (2 * math.pi) or 2 * math.pi
+        return stroke_arc(_dxf_float(entity, 10), _dxf_float(entity, 20), _dxf_float(entity, 40), start, sweep, tolerance)
+    elif kind == 'SPLINE':
+        return _dxf_spline(entity, tolerance)
+    return None
+
+def _dxf_spline(entity, tolerance):
+    degree = int(_dxf_float(entity, 71, 3))
+    knots = _dxf_floats(entity, 40)
+    controls = list(zip(_dxf_floats(entity, 10), _dxf_floats(entity, 20)))
+    weights = _dxf_floats(entity, 41)
+    if len(weights) != len(controls):
+        weights = [1.0] * len(controls)
+    if len(controls) <= degree or len(knots) != len(controls) + degree + 1:
+        # Fall back to the fit points, if there are any.
+        fit = list(zip(_dxf_floats(entity, 11), _dxf_floats(entity, 21)))
+        return fit or controls
+
+    # Sample densely enough that the control polygon length divided by the
+    # count is on the order of the tolerance.
+    length = sum(math.hypot(b[0] - a[0], b[1] - a[1]) for (a, b) in zip(controls, controls[1:]))
+    count = max(int(math.ceil(math.sqrt(length / tolerance))) * len(controls), len(controls) * 4)
+    (low, high) = (knots[degree], knots[len(controls)])
+    return [_de_boor(degree, knots, controls, weights, low + (high - low) * i / count) for i in range(count + 1)]
+
+def _de_boor(degree, knots, controls, weights, t):
+    span = degree
+    while span < len(controls) - 1 and knots[span + 1] <= t:
+        span += 1
+    points = [(controls[j][0] * weights[j], controls[j][1] * weights[j], weights[j]) for j in range(span - degree, span + 1)]
+    for r in range(1, degree + 1):
+        for j in range(degree, r - 1, -1):
+            i = j + span - degree
+            denominator = knots[i + degree - r + 1] - knots[i]
+            alpha = (t - knots[i]) / denominator if denominator else 0.0
+            points[j] = tuple((1 - alpha) * a + alpha * b for (a, b) in zip(points[j-1], points[j]))
+    (x, y, w) = points[degree]
+    return (x / w, y / w)
@@ -0,0 +1,134 @@
+'''
+Polyline simplification for the toolpath pipeline.
+Vertices that are closer than the tolerance to the line through their neighbors
+are removed with the Douglas-Peucker algorithm.  NumPy is used when it's available
+to compute the distances of a whole span at once, otherwise plain Python is used.
+'''
+from array import array
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .polyline import polyLine
+
+def simplify_polyline(poly, tolerance):
+    '''
+    Return a new polyLine with duplicate points removed and Douglas-Peucker simplification applied.
+    tolerance is the maximum distance between the original points and the simplified polyline.
+    Closed polylines stay closed and keep their start point.
+    '''
+    coords = poly.coordinates()
+    xs = coords[0::3]
+    ys = coords[1::3]
+    keep = simplify_indices(xs, ys, tolerance, poly.isClosed)
+    result = array('d')
+    for index in keep:
+        result.extend(coords[index*3:index*3+3])
+    simplified = polyLine.fromCoordinates(result)
+    simplified.isClosed = poly.isClosed
+    simplified.arcCenter = poly.arcCenter
+    return simplified
+
+def simplify_indices(xs, ys, tolerance, closed=False):
+    '''
+    Return the indices of the points to keep.
+    xs and ys are sequences of the point coordinates
+    '''
+    keep = dedupe_indices(xs, ys, tolerance)
+    if len(keep) <= 2:
+        return keep
+    xs = [xs[i] for i in keep]
+    ys = [ys[i] for i in keep]
+
+    if closed:
+        # Split the loop at the point farthest from the start so neither half is degenerate.
+        last = len(xs) - 1
+        far = max(range(1, last), key=lambda i: (xs[i] - xs[0])**2 + (ys[i] - ys[0])**2)
+        kept = _douglas_peucker(xs, ys, 0, far, tolerance) + _douglas_peucker(xs, ys, far, last, tolerance)[1:]
+    else:
+        kept = _douglas_peucker(xs, ys, 0, len(xs) - 1, tolerance)
+    return [keep[i] for i in kept]
+
+def dedupe_indices(xs, ys, tolerance):
+    '''
+    Return the indices of the points that aren't within tolerance of the previously kept point.
+    The last point is always kept.
+    '''
+    count = len(xs)
+    if count == 0:
+        return []
+    keep = [0]
+    for i in range(1, count):
+        last = keep[-1]
+        if math.hypot(xs[i] - xs[last], ys[i] - ys[last]) > tolerance:
+            keep.append(i)
+    if keep[-1] != count - 1:
+        if len(keep) > 1:
+            keep[-1] = count - 1
+        else:
+            keep.append(count - 1)
+    return keep
+
+def _douglas_peucker(xs, ys, first, last, tolerance):
+    # Returns the kept indices between first and last, inclusive.
+    if numpy is not None and last - first > 64:
+        return _douglas_peucker_numpy(numpy.asarray(xs, dtype=float), numpy.asarray(ys, dtype=float), first, last, tolerance)
+
+    marked = [False] * (last - first + 1)
+    marked[0] = marked[-1] = True
+    stack = [(first, last)]
+    while stack:
+        (start, end) = stack.pop()
+        if end - start < 2:
+            continue
+        (index, distance) = _farthest(xs, ys, start, end)
+        if distance > tolerance:
+            marked[index - first] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return [first + i for i, m in enumerate(marked) if m]
+
+def _farthest(xs, ys, start, end):
+    (ax, ay, bx, by) = (xs[start], ys[start], xs[end], ys[end])
+    dx = bx - ax
+    dy = by - ay
+    length = dx * dx + dy * dy
+    best = (start, -1.0)
+    for i in range(start + 1, end):
+        if length == 0:
+            distance = math.hypot(xs[i] - ax, ys[i] - ay)
+        else:
+            t = max(0.0, min(1.0, ((xs[i] - ax) * dx + (ys[i] - ay) * dy) / length))
+            distance = math.hypot(xs[i] - (ax + t * dx), ys[i] - (ay + t * dy))
+        if distance > best[1]:
+            best = (i, distance)
+    return best
+
+def _douglas_peucker_numpy(xs, ys, first, last, tolerance):
+    marked = numpy.zeros(last - first + 1, dtype=bool)
+    marked[0] = marked[-1] = True
+    stack = [(first, last)]
+    while stack:
+        (start, end) = stack.pop()
+        if end - start < 2:
+            continue
+        px = xs[start+1:end]
+        py = ys[start+1:end]
+        dx = xs[end] - xs[start]
+        dy = ys[end] - ys[start]
+        length = dx * dx + dy * dy
+        if length == 0:
+            distances = numpy.hypot(px - xs[start], py - ys[start])
+        else:
+            t = numpy.clip(((px - xs[start]) * dx + (py - ys[start]) * dy) / length, 0.0, 1.0)
+            distances = numpy.hypot(px - (xs[start] + t * dx), py - (ys[start] + t * dy))
+        index = int(numpy.argmax(distances))
+        if distances[index] > tolerance:
+            index += start + 1
+            marked[index - first] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return [first + int(i) for i in numpy.flatnonzero(marked)]
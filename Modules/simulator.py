@@ -0,0 +1,204 @@
+'''
+Estimates how long a g-code program will take to run.
+The program is run through the reference interpreter and each move gets a trapezoidal
+speed profile limited by the acceleration of the machine.  The speed through the corner
+between two moves is limited with the junction deviation model used by most motion
+controllers, and the machine stops for spindle commands and dwells.
+Rates are in inches per minute and the acceleration is in inches per second squared.
+
+It can be run from the add-in folder to compare programs:
+    python -m Modules.simulator seat.nc other.nc
+'''
+from array import array
+import argparse
+import math
+import sys
+
+from . import interpreter
+
+class MachineLimits:
+    '''
+    The motion limits of the machine.  The defaults are rough values for a small router and
+    should be measured for a real machine.
+    rapid_rate is the speed of g0 moves, in inches per minute
+    acceleration is in inches per second squared
+    junction_deviation is the distance (in inches) the path is allowed to deviate at a corner,
+    which sets how fast the machine can go through it
+    default_feed is the feed rate used when the program doesn't set one
+    '''
+    def __init__(self, rapid_rate=180.0, acceleration=10.0, junction_deviation=0.001, default_feed=60.0):
+        self.rapid_rate = rapid_rate
+        self.acceleration = acceleration
+        self.junction_deviation = junction_deviation
+        self.default_feed = default_feed
+
+class Simulation:
+    '''
+    The result of simulating a program.  stats is the interpreter.ProgramStats of the program and
+    the times are in seconds.
+    '''
+    def __init__(self, stats, cut_time=0.0, rapid_time=0.0, dwell_time=0.0):
+        self.stats = stats
+        self.cut_time = cut_time
+        self.rapid_time = rapid_time
+        self.dwell_time = dwell_time
+
+    @property
+    def total_time(self):
+        return self.cut_time + self.rapid_time + self.dwell_time
+
+def simulate(lines, limits=None):
+    '''
+    Simulate the g-code lines and return a Simulation.  The lines are interpreted once and the
+    speed profile is planned with a backward and a forward pass, so the time is linear in the
+    length of the program.
+    '''
+    limits = limits or MachineLimits()
+    machine = interpreter.Interpreter()
+    stats = interpreter.ProgramStats()
+    dwell_time = 0.0
+
+    # One entry per move, kept in flat arrays since programs can have millions of moves.
+    lengths = array('d')
+    speeds = array('d')         # The speed the move is cut at, in inches per second.
+    junctions = array('d')      # The largest speed the move can be entered at.
+    rapid = array('b')
+
+    last_exit = None            # Direction at the end of the previous move, None after a stop.
+    for result in machine.run(lines):
+        if isinstance(result, interpreter.Command):
+            last_exit = None
+            if result.code == 'g4':
+                dwell_time += dict(result.parameters).get('p', 0.0)
+            continue
+        if result.is_zero_length():
+            continue
+        stats.add(result)
+        scale = 1 / 25.4 if machine.units == 21 else 1.0
+        length = result.length() * scale
+        if length == 0:
+            continue
+
+        if result.mode == 0:
+            speed = limits.rapid_rate / 60
+        else:
+            speed = (result.feed * scale if result.feed else limits.default_feed) / 60
+        (entry, exit, radius) = _directions(result)
+        if radius:
+            # Keep the centripetal acceleration of arcs within the limit.
+            speed = min(speed, math.sqrt(limits.acceleration * radius * scale))
+
+        lengths.append(length)
+        speeds.append(speed)
+        junctions.append(0.0 if last_exit is None else _junction_speed(last_exit, entry, limits))
+        rapid.append(result.mode == 0)
+        last_exit = exit
+
+    # Backward pass: each move must be able to slow down to the entry speed of the next one.
+    count = len(lengths)
+    acceleration = limits.acceleration
+    entries = array('d', junctions)
+    next_entry = 0.0
+    for i in range(count - 1, -1, -1):
+        entries[i] = min(entries[i], speeds[i], math.sqrt(next_entry * next_entry + 2 * acceleration * lengths[i]))
+        if i > 0:
+            entries[i] = min(entries[i], speeds[i-1])
+        next_entry = entries[i]
+
+    # Forward pass: each move can only speed up so much, then add up the time of each profile.
+    cut_time = 0.0
+    rapid_time = 0.0
+    for i in range(count):
+        entry = entries[i]
+        exit = entries[i+1] if i + 1 < count else 0.0
+        exit = min(exit, math.sqrt(entry * entry + 2 * acceleration * lengths[i]))
+        if i + 1 < count:
+            entries[i+1] = exit
+        time = _profile_time(lengths[i], entry, exit, speeds[i], acceleration)
+        if rapid[i]:
+            rapid_time += time
+        else:
+            cut_time += time
+
+    return Simulation(stats, cut_time, rapid_time, dwell_time)
+
+def simulate_file(filename, limits=None):
+    '''
+    Simulate the g-code in a file and return a Simulation.
+    '''
+    with open(filename) as fp:
+        return simulate(fp, limits)
+
+def format_time(seconds):
+    '''
+    Format a time in seconds as h:mm:ss.
+    '''
+    seconds = int(round(seconds))
+    return '{}:{:02d}:{:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+def _profile_time(length, entry, exit, speed, acceleration):
+    # The time of a trapezoidal (or triangular) speed profile.
+    accelerate = (speed * speed - entry * entry) / (2 * acceleration)
+    decelerate = (speed * speed - exit * exit) / (2 * acceleration)
+    if accelerate + decelerate <= length:
+        return (speed - entry) / acceleration + (speed - exit) / acceleration + (length - accelerate - decelerate) / speed
+    peak = math.sqrt((2 * acceleration * length + entry * entry + exit * exit) / 2)
+    return (peak - entry) / acceleration + (peak - exit) / acceleration
+
+def _junction_speed(exit, entry, limits):
+    # The junction deviation model: the speed at which the machine could go around a circle
+    # that is tangent to both moves and junction_deviation from the corner.
+    cos_theta = -(exit[0] * entry[0] + exit[1] * entry[1] + exit[2] * entry[2])
+    if cos_theta > 0.999999:
+        return 0.0
+    if cos_theta < -0.999999:
+        return float('inf')
+    sin_half = math.sqrt(0.5 * (1 - cos_theta))
+    return math.sqrt(limits.acceleration * limits.junction_deviation * sin_half / (1 - sin_half))
+
+def _directions(move):
+    # Returns the unit directions at the start and end of a move, and the radius for arcs.
+    # An axis whose start is unknown is treated as not moving.
+    end = [0.0 if value is None else value for value in move.end]
+    start = [end[index] if value is None else value for (index, value) in enumerate(move.start)]
+    if move.center is None:
+        direction = _unit(end[0] - start[0], end[1] - start[1], end[2] - start[2])
+        return (direction, direction, None)
+
+    (cx, cy) = move.center
+    radius = math.hypot(start[0] - cx, start[1] - cy)
+    planar = move.length()
+    dz = end[2] - start[2]
+    planar = math.sqrt(max(planar * planar - dz * dz, 0.0))
+    sign = 1 if move.mode == 3 else -1
+    rise = dz / planar if planar else 0.0
+    entry = _unit(-sign * (start[1] - cy), sign * (start[0] - cx), rise * radius)
+    exit = _unit(-sign * (end[1] - cy), sign * (end[0] - cx), rise * radius)
+    return (entry, exit, radius)
+
+def _unit(x, y, z):
+    length = math.sqrt(x * x + y * y + z * z)
+    if length == 0:
+        return (0.0, 0.0, 0.0)
+    return (x / length, y / length, z / length)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m Modules.simulator', description='Estimate the run time of g-code programs.')
+    parser.add_argument('inputs', nargs='+', help='g-code files')
+    parser.add_argument('--rapid', type=float, default=180.0, help='rapid rate in inches per minute')
+    parser.add_argument('--acceleration', type=float, default=10.0, help='acceleration in inches per second squared')
+    parser.add_argument('--junction-deviation', type=float, default=0.001, help='junction deviation in inches')
+    args = parser.parse_args(argv)
+
+    limits = MachineLimits(rapid_rate=args.rapid, acceleration=args.acceleration, junction_deviation=args.junction_deviation)
+    for filename in args.inputs:
+        result = simulate_file(filename, limits)
+        stats = result.stats
+        print('{}: {} (cutting {}, rapids {}, dwell {})'.format(filename, format_time(result.total_time), format_time(result.cut_time),
+                                                              format_time(result.rapid_time), format_time(result.dwell_time)))
+        print('    cut {:.2f} in., rapid {:.2f} in., {} plunges, {} retracts, {} moves'.format(stats.cut_length, stats.rapid_length,
+                                                                                              stats.plunges, stats.retracts, stats.moves))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
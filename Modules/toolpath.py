@@ -0,0 +1,205 @@
+'''
+The toolpath pipeline used by Cut Seat, independent of Fusion.
+Polylines are chained, ordered and written out as g-code at each cutting depth.
+All lengths are in centimeters.
+
+It can also be run from the add-in folder to post designs from the command line:
+    python -m Modules.toolpath seat.svg -o seat.nc
+'''
+import argparse
+import os
+import sys
+
+from . import arcfit, gcode, instrument, interpreter, readers, simplify, tour
+from .polyline import chainPolyLines
+
+class ToolpathSettings:
+    '''
+    The machine and pipeline settings used to create a toolpath.
+    tour_max_passes limits the passes made to improve the cutting order, and tour_time_budget is the
+    number of seconds after which they're stopped anyway (see tour.optimize_tour).  Only the passes
+    decide the order, so the same polylines give the same g-code on any machine unless the time
+    budget is hit, which Toolpath.tour_timed_out reports.
+    simplify_tolerance is the largest distance a vertex can be moved by simplification, None to disable it.
+    It defaults to the resolution of the g-code output (0.0001 in).
+    arc_tolerance is the largest distance between the points and the arcs fitted to them, None to only cut lines.
+    depth_strategy is one of gcode.DEPTH_STRATEGIES, and ramp_entry ramps down closed paths with the 'contour' strategy.
+    compact removes the words that repeat the modal state from the g-code, and verify_compact checks
+    the result with the reference interpreter.
+    '''
+    def __init__(self, cutting_depths=(-0.09, -0.1), retract_height=0.5, feed_rate=120,
+                 stroke_tolerance=0.005, chain_tolerance=0.00001, tour_time_budget=tour.TIME_LIMIT, origin=(0.0, 0.0),
+                 simplify_tolerance=0.000254, arc_tolerance=0.00254, depth_strategy='layer', ramp_entry=False,
+                 compact=False, verify_compact=False, tour_max_passes=tour.MAX_PASSES):
+        self.cutting_depths = list(cutting_depths)
+        self.retract_height = retract_height
+        self.feed_rate = feed_rate
+        self.stroke_tolerance = stroke_tolerance
+        self.chain_tolerance = chain_tolerance
+        self.tour_time_budget = tour_time_budget
+        self.origin = origin
+        self.simplify_tolerance = simplify_tolerance
+        self.arc_tolerance = arc_tolerance
+        self.depth_strategy = depth_strategy
+        self.ramp_entry = ramp_entry
+        self.compact = compact
+        self.verify_compact = verify_compact
+        self.tour_max_passes = tour_max_passes
+
+class Toolpath:
+    '''
+    Polylines in cutting order, along with statistics about how they were ordered.
+    rapid_input, rapid_before and rapid_after are the rapid travel of the polylines in the order
+    they were given, in the nearest-neighbor order and in the improved order, see tour.Tour.
+    program is the interpreter.ProgramStats of the g-code once it's been written (in inches).
+    tour_passes is the number of passes made to improve the order, and tour_timed_out is True
+    when the time budget stopped them, so the order may differ between runs.
+    '''
+    def __init__(self, polylines, rapid_before=0.0, rapid_after=0.0, tour_passes=0, tour_timed_out=False, rapid_input=None):
+        self.polylines = polylines
+        self.rapid_input = rapid_before if rapid_input is None else rapid_input
+        self.rapid_before = rapid_before
+        self.rapid_after = rapid_after
+        self.tour_passes = tour_passes
+        self.tour_timed_out = tour_timed_out
+        self.program = None
+
+def compile_toolpath(polylines, settings=None, timer=None):
+    '''
+    Chain the polylines into the longest possible connected polylines, simplify them and order them for cutting.
+    The polylines passed in may be modified.  Returns a Toolpath.
+    timer is an optional instrument.PhaseTimer that records the time of each step.
+    '''
+    settings = settings or ToolpathSettings()
+    instrument.count(timer, 'input polylines', len(polylines))
+    with instrument.phase(timer, 'chaining'):
+        polylines = chainPolyLines(polylines, settings.chain_tolerance)
+    instrument.count(timer, 'chained polylines', len(polylines))
+    with instrument.phase(timer, 'simplifying'):
+        polylines = simplify_polylines(polylines, settings)
+    instrument.count(timer, 'points', sum(poly.pointCount() for poly in polylines))
+    with instrument.phase(timer, 'ordering'):
+        toolpath = order_polylines(polylines, settings)
+    instrument.count(timer, 'tour passes', toolpath.tour_passes)
+    if toolpath.tour_timed_out:
+        instrument.count(timer, 'tour time budget hit')
+    return toolpath
+
+def simplify_polylines(polylines, settings=None):
+    '''
+    Return the polylines with the nearly collinear and duplicate vertices removed.
+    '''
+    settings = settings or ToolpathSettings()
+    if not settings.simplify_tolerance:
+        return polylines
+    return [simplify.simplify_polyline(poly, settings.simplify_tolerance) for poly in polylines]
+
+def order_polylines(polylines, settings=None):
+    '''
+    Reorder, reverse and rotate the polylines to create the shortest rapid travel.  Returns a Toolpath.
+    '''
+    settings = settings or ToolpathSettings()
+    paths = [poly.xyPoints() for poly in polylines]
+    cut_order = tour.optimize_tour(paths, [poly.isClosed for poly in polylines], settings.origin, settings.tour_time_budget,
+                                   max_passes=settings.tour_max_passes)
+    ordered = []
+    for (index, reverse, entry) in zip(cut_order.order, cut_order.reversed, cut_order.entries):
+        poly = polylines[index]
+        if poly.isClosed:
+            poly.rotate(entry)
+        elif reverse:
+            poly.reverse()
+        ordered.append(poly)
+
+    return Toolpath(ordered, cut_order.rapid_before, cut_order.rapid_after, cut_order.passes, cut_order.timed_out, cut_order.rapid_input)
+
+def iter_gcode(toolpath, settings=None):
+    '''
+    Yield the g-code lines that cut a toolpath.
+    '''
+    settings = settings or ToolpathSettings()
+    lines = gcode.iter_program(toolpath_moves(toolpath, settings), settings.cutting_depths, settings.retract_height,
+                               settings.feed_rate, settings.depth_strategy, settings.ramp_entry)
+    if settings.compact:
+        lines = gcode.iter_compact(lines, settings.verify_compact)
+    return lines
+
+def toolpath_moves(toolpath, settings=None):
+    '''
+    Return the moves of each polyline of a toolpath, with arcs fitted when the settings allow it.
+    '''
+    settings = settings or ToolpathSettings()
+    paths = []
+    for poly in toolpath.polylines:
+        points = poly.xyPoints()
+        if not settings.arc_tolerance:
+            paths.append(points)
+        elif poly.arcCenter:
+            paths.append(arcfit.circle_moves(points, poly.arcCenter))
+        else:
+            # The points are only within the stroke tolerance of the curve they came from.
+            paths.append(arcfit.fit_arcs(points, settings.arc_tolerance, max(settings.arc_tolerance, settings.stroke_tolerance)))
+    return paths
+
+def write_gcode(out, polylines, settings=None, timer=None):
+    '''
+    Compile the polylines and write the g-code to the text file object out.
+    Returns the Toolpath, with the statistics of the program that was written.
+    '''
+    toolpath = compile_toolpath(polylines, settings, timer)
+    toolpath.program = interpreter.ProgramStats()
+    with instrument.phase(timer, 'writing g-code'):
+        written = gcode.write_program(out, interpreter.measure(iter_gcode(toolpath, settings), toolpath.program))
+    instrument.count(timer, 'g-code bytes', written)
+    return toolpath
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m Modules.toolpath', description='Create seat cutting g-code from polylines in JSON, SVG or DXF files.')
+    parser.add_argument('inputs', nargs='+', help='.json, .svg or .dxf files to post')
+    parser.add_argument('-o', '--output', help='output .nc file (only when posting a single input, defaults to the input name with .nc)')
+    parser.add_argument('--units', choices=sorted(readers.UNITS), help='units of the input coordinates (defaults to cm for JSON and mm for SVG and DXF)')
+    parser.add_argument('--depths', default='-0.09,-0.1', help='comma separated cutting depths in cm')
+    parser.add_argument('--retract', type=float, default=0.5, help='retract height in cm')
+    parser.add_argument('--feed', type=int, default=120, help='cutting feed rate')
+    parser.add_argument('--stroke-tolerance', type=float, default=0.005, help='tolerance in cm used to turn curves into lines')
+    parser.add_argument('--simplify', type=float, default=0.000254, help='simplification tolerance in cm, 0 to disable')
+    parser.add_argument('--arc-tolerance', type=float, default=0.00254, help='arc fitting tolerance in cm, 0 to only cut lines')
+    parser.add_argument('--depth-strategy', choices=gcode.DEPTH_STRATEGIES, default='layer',
+                        help='cut the whole design at each depth (layer) or each path at every depth (contour)')
+    parser.add_argument('--ramp', action='store_true', help='ramp down closed paths instead of plunging (contour only)')
+    parser.add_argument('--compact', action='store_true', help='leave out the words that repeat the modal state')
+    parser.add_argument('--verify', action='store_true', help='check the compacted g-code moves the machine the same way')
+    parser.add_argument('--tour-passes', type=int, default=tour.MAX_PASSES, help='largest number of passes made to improve the cutting order')
+    parser.add_argument('--tour-time', type=float, default=tour.TIME_LIMIT,
+                        help='seconds after which improving the cutting order is stopped, only a safety limit')
+    parser.add_argument('--timing', action='store_true', help='print the time taken by each step')
+    args = parser.parse_args(argv)
+
+    if args.output and len(args.inputs) > 1:
+        parser.error('--output can only be used with a single input')
+
+    settings = ToolpathSettings(cutting_depths=[float(depth) for depth in args.depths.split(',')],
+                                retract_height=args.retract, feed_rate=args.feed,
+                                stroke_tolerance=args.stroke_tolerance, tour_time_budget=args.tour_time, tour_max_passes=args.tour_passes,
+                                simplify_tolerance=args.simplify, arc_tolerance=args.arc_tolerance,
+                                depth_strategy=args.depth_strategy, ramp_entry=args.ramp, compact=args.compact, verify_compact=args.verify)
+
+    for filename in args.inputs:
+        timer = instrument.PhaseTimer() if args.timing else None
+        with instrument.phase(timer, 'reading'):
+            polylines = readers.read_polylines(filename, units=args.units, tolerance=settings.stroke_tolerance)
+        output = args.output or os.path.splitext(filename)[0] + '.nc'
+        with open(output, 'w') as out:
+            toolpath = write_gcode(out, polylines, settings, timer)
+        print('{}: {} polylines, rapid travel {} in. as drawn, {} in. nearest-neighbor -> {} in.'.format(output, len(toolpath.polylines),
+              gcode.to_inches(toolpath.rapid_input), gcode.to_inches(toolpath.rapid_before), gcode.to_inches(toolpath.rapid_after)))
+        print('    program rapids {:.4f} in., {} retracts, {} plunges'.format(toolpath.program.rapid_length, toolpath.program.retracts,
+                                                                            toolpath.program.plunges))
+        if toolpath.tour_timed_out:
+            print('    the cutting order was stopped by --tour-time after {} passes and may differ between runs'.format(toolpath.tour_passes))
+        if timer:
+            print('    ' + timer.summary().replace('\n', '\n    '))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,371 @@
+import math
+import time
+
+# Passes of 2-opt/Or-opt moves made over the tour at most.  Passes stop as soon as one
+# doesn't improve the tour, and the same paths always get the same number of passes.
+MAX_PASSES = 50
+
+# Seconds after which improving the tour is stopped even if passes are left.  It only
+# guards against a runaway, so the order doesn't depend on the speed of the machine.
+TIME_LIMIT = 30.0
+
+def optimize_tour(paths, closed, origin=(0.0, 0.0), time_budget=TIME_LIMIT, neighbors=8, max_passes=MAX_PASSES):
+    '''
+    Find a cutting order for a set of paths that keeps the rapid (non-cutting) travel short.
+    paths is a sequence of paths, each a sequence of (x, y) vertices
+    closed is a sequence of booleans indicating which paths are closed loops (first vertex equal to the last)
+    origin is the (x, y) position of the tool before the first path is cut
+    time_budget is the number of seconds after which the 2-opt/Or-opt improvement is stopped
+    neighbors is the number of nearby paths considered for each improvement move
+    max_passes is the largest number of improvement passes over the tour
+
+    A nearest-neighbor tour is built first using a grid of the path end points, then improved
+    with passes of 2-opt and Or-opt moves until a pass improves nothing or max_passes have been
+    made, so the same paths always give the same order.  The time budget is only a safety limit,
+    and Tour.timed_out tells when it stopped the improvement early.  Open paths
+    may be cut in either direction.  Closed loops are entered at the vertex nearest the previous
+    exit and are later rotated to the vertex that gives the shortest travel in and out of them.
+    Returns a Tour.
+    '''
+    tour = _TourState(paths, closed, origin)
+    rapid_input = tour.length()
+    rapid_before = rapid_input
+    (passes, timed_out) = (0, False)
+    if len(paths) > 0:
+        tour.nearest_neighbor()
+        rapid_before = tour.length()
+        deadline = time.perf_counter() + time_budget
+        if len(paths) > 2:
+            (passes, timed_out) = tour.improve(deadline, neighbors, max_passes)
+        tour.rotate_loops()
+    return Tour(tour.order, [tour.flipped[node] for node in tour.order], [tour.entry[node] for node in tour.order], rapid_before, tour.length(),
+                passes, timed_out, rapid_input)
+
+class Tour:
+    '''
+    The result of optimize_tour.
+    order is the list of path indices in cutting order
+    reversed[i] is True if the path at order[i] should be cut from its last vertex to its first
+    entries[i] is the vertex the path at order[i] should be entered at, always 0 for open paths
+    (for reversed open paths, the vertex index refers to the original vertex order)
+    rapid_before and rapid_after are the rapid travel distances of the nearest-neighbor tour the
+    improvement starts from and of the optimized order, and rapid_input is that of the paths in
+    the order they were given
+    passes is the number of improvement passes made, and timed_out is True if the time budget
+    stopped them before the tour stopped improving or max_passes were made
+    '''
+    def __init__(self, order, reversed, entries, rapid_before, rapid_after, passes=0, timed_out=False, rapid_input=None):
+        self.order = order
+        self.reversed = reversed
+        self.entries = entries
+        self.rapid_input = rapid_before if rapid_input is None else rapid_input
+        self.rapid_before = rapid_before
+        self.rapid_after = rapid_after
+        self.passes = passes
+        self.timed_out = timed_out
+
+    def __repr__(self):
+        return 'Tour({} paths, rapid {:.4f} -> {:.4f})'.format(len(self.order), self.rapid_before, self.rapid_after)
+
+class PointGrid:
+    '''
+    Uniform grid of tagged points supporting removal and nearest-point queries.
+    '''
+    def __init__(self, points, cell_count=None):
+        '''
+        points is a sequence of (x, y, tag) tuples
+        '''
+        self.cells = {}
+        self.count = 0
+        if len(points) == 0:
+            self.cell_size = 1.0
+            self.min_x = self.min_y = 0.0
+            self.span = 0
+            return
+
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        self.min_x = min(xs)
+        self.min_y = min(ys)
+        extent = max(max(xs) - self.min_x, max(ys) - self.min_y)
+        cell_count = cell_count or len(points)
+        self.cell_size = max(extent / max(math.sqrt(cell_count), 1.0), 1e-9)
+        self.span = int(extent / self.cell_size) + 1
+        for point in points:
+            self.add(point)
+
+    def key(self, x, y):
+        return (int((x - self.min_x) // self.cell_size), int((y - self.min_y) // self.cell_size))
+
+    def add(self, point):
+        self.cells.setdefault(self.key(point[0], point[1]), []).append(point)
+        self.count += 1
+
+    def remove_tag(self, x, y, tag):
+        key = self.key(x, y)
+        cell = self.cells.get(key)
+        if cell:
+            before = len(cell)
+            cell[:] = [p for p in cell if p[2] != tag]
+            self.count -= before - len(cell)
+            if not cell:
+                del self.cells[key]
+
+    def nearest(self, x, y, count=1, accept=None):
+        '''
+        Return up to count (distance, point) pairs closest to (x, y), closest first.
+        accept is an optional filter called with each candidate point
+        '''
+        (cx, cy) = self.key(x, y)
+        found = []
+        ring = 0
+        # Search rings of cells around the query until the closest remaining
+        # cell is farther away than the worst point we're keeping.
+        max_ring = self.span + abs(cx) + abs(cy) + 1
+        while ring <= max_ring:
+            if len(found) >= count and (ring - 1) * self.cell_size > found[count-1][0]:
+                break
+            if (2 * ring + 1) ** 2 > 4 * len(self.cells):
+                # The ring covers more cells than are occupied so just check them all.
+                found = []
+                for cell in self.cells.values():
+                    for point in cell:
+                        if not accept or accept(point):
+                            found.append((math.hypot(point[0] - x, point[1] - y), point))
+                found.sort(key=lambda item: item[0])
+                return found[:count]
+            for i in range(cx - ring, cx + ring + 1):
+                for j in (range(cy - ring, cy + ring + 1) if i in (cx - ring, cx + ring) else (cy - ring, cy + ring)):
+                    cell = self.cells.get((i, j))
+                    if cell:
+                        for point in cell:
+                            if accept and not accept(point):
+                                continue
+                            found.append((math.hypot(point[0] - x, point[1] - y), point))
+            if found:
+                found.sort(key=lambda item: item[0])
+                del found[count:]
+            ring += 1
+        return found
+
+class _TourState:
+    def __init__(self, paths, closed, origin):
+        self.paths = paths
+        self.closed = [bool(c) for c in closed]
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.order = list(range(len(paths)))
+        self.flipped = [False] * len(paths)
+        self.entry = [0] * len(paths)
+
+    def entry_point(self, node):
+        path = self.paths[node]
+        if self.closed[node]:
+            return path[self.entry[node]]
+        return path[-1] if self.flipped[node] else path[0]
+
+    def exit_point(self, node):
+        path = self.paths[node]
+        if self.closed[node]:
+            return path[self.entry[node]]
+        return path[0] if self.flipped[node] else path[-1]
+
+    def length(self):
+        total = 0.0
+        last = self.origin
+        for node in self.order:
+            point = self.entry_point(node)
+            total += math.hypot(point[0] - last[0], point[1] - last[1])
+            last = self.exit_point(node)
+        return total
+
+    def candidates(self):
+        # Every point a path can be entered at, tagged with the path index and vertex.
+        points = []
+        for node, path in enumerate(self.paths):
+            if self.closed[node]:
+                # The last vertex of a closed loop repeats the first.
+                for index in range(max(len(path) - 1, 1)):
+                    points.append((path[index][0], path[index][1], node, index))
+            else:
+                points.append((path[0][0], path[0][1], node, 0))
+                if len(path) > 1:
+                    points.append((path[-1][0], path[-1][1], node, len(path) - 1))
+        return points
+
+    def nearest_neighbor(self):
+        points = self.candidates()
+        grid = PointGrid(points)
+        by_node = {}
+        for point in points:
+            by_node.setdefault(point[2], []).append(point)
+
+        order = []
+        last = self.origin
+        while grid.count > 0:
+            found = grid.nearest(last[0], last[1])
+            if not found:
+                break
+            (dist, (x, y, node, index)) = found[0]
+            if self.closed[node]:
+                self.entry[node] = index
+            else:
+                self.flipped[node] = index != 0
+            order.append(node)
+            last = self.exit_point(node)
+            for point in by_node[node]:
+                grid.remove_tag(point[0], point[1], point[2])
+
+        self.order = order
+
+    def improve(self, deadline, neighbors, max_passes):
+        # Returns the number of passes made and whether the deadline was hit.
+        # Tag each point with its path so the grid can report nearby paths.
+        points = [(p[0], p[1], p[2]) for p in self.candidates()]
+        grid = PointGrid(points)
+        count = len(self.order)
+        near = {}
+
+        def nearby(point):
+            # Nearest distinct paths to a point.
+            key = (point[0], point[1])
+            if key not in near:
+                seen = []
+                for (dist, p) in grid.nearest(point[0], point[1], neighbors * 3):
+                    if p[2] not in seen:
+                        seen.append(p[2])
+                        if len(seen) >= neighbors:
+                            break
+                near[key] = seen
+            return near[key]
+
+        improved = True
+        passes = 0
+        while improved and passes < max_passes:
+            if time.perf_counter() > deadline:
+                return (passes, True)
+            improved = False
+            passes += 1
+            pos = [0] * len(self.paths)
+            for i, node in enumerate(self.order):
+                pos[node] = i
+
+            # 2-opt: reverse the run of paths from position i to j.
+            for i in range(count):
+                if time.perf_counter() > deadline:
+                    return (passes, True)
+                prev = self.exit_point(self.order[i-1]) if i > 0 else self.origin
+                first_entry = self.entry_point(self.order[i])
+                for other in nearby(prev):
+                    j = pos[other]
+                    if j < i:
+                        continue
+                    last_exit = self.exit_point(self.order[j])
+                    delta = _dist(prev, last_exit) - _dist(prev, first_entry)
+                    if j + 1 < count:
+                        following = self.entry_point(self.order[j+1])
+                        delta += _dist(first_entry, following) - _dist(last_exit, following)
+                    if delta < -1e-9:
+                        self.reverse_run(i, j, pos)
+                        improved = True
+                        prev = self.exit_point(self.order[i-1]) if i > 0 else self.origin
+                        first_entry = self.entry_point(self.order[i])
+
+            # Or-opt: move a run of 1 to 3 paths to follow a nearby path.
+            for length in (1, 2, 3):
+                i = 0
+                while i + length <= count:
+                    if time.perf_counter() > deadline:
+                        return (passes, True)
+                    if self.move_run(i, length, pos, nearby):
+                        improved = True
+                    i += 1
+        return (passes, False)
+
+    def reverse_run(self, i, j, pos):
+        run = self.order[i:j+1]
+        run.reverse()
+        self.order[i:j+1] = run
+        for k in range(i, j + 1):
+            node = self.order[k]
+            pos[node] = k
+            if not self.closed[node]:
+                self.flipped[node] = not self.flipped[node]
+
+    def move_run(self, i, length, pos, nearby):
+        order = self.order
+        count = len(order)
+        j = i + length - 1
+        run_entry = self.entry_point(order[i])
+        run_exit = self.exit_point(order[j])
+        prev = self.exit_point(order[i-1]) if i > 0 else self.origin
+        following = self.entry_point(order[j+1]) if j + 1 < count else None
+
+        # Travel saved by taking the run out of its current place.
+        removed = _dist(prev, run_entry)
+        if following is not None:
+            removed += _dist(run_exit, following) - _dist(prev, following)
+
+        # The run can follow a nearby path, or go first when it isn't already (k is -1).
+        best = None
+        for point, forward in ((run_entry, True), (run_exit, False)):
+            for k in [pos[other] for other in nearby(point)] + ([-1] if i > 0 else []):
+                if i <= k <= j or k == i - 1:
+                    continue
+                after = self.exit_point(order[k]) if k >= 0 else self.origin
+                beyond = self.entry_point(order[k+1]) if k + 1 < count else None
+                (start, end) = (run_entry, run_exit) if forward else (run_exit, run_entry)
+                added = _dist(after, start)
+                if beyond is not None:
+                    added += _dist(end, beyond) - _dist(after, beyond)
+                delta = added - removed
+                if delta < -1e-9 and (best is None or delta < best[0]):
+                    best = (delta, k, forward)
+
+        if best is None:
+            return False
+
+        (delta, k, forward) = best
+        run = order[i:j+1]
+        if not forward:
+            run.reverse()
+            for node in run:
+                if not self.closed[node]:
+                    self.flipped[node] = not self.flipped[node]
+        rest = order[:i] + order[j+1:]
+        target = rest.index(order[k]) + 1 if k >= 0 else 0
+        self.order = rest[:target] + run + rest[target:]
+        for index, node in enumerate(self.order):
+            pos[node] = index
+        return True
+
+    def rotate_loops(self):
+        # Enter each closed loop at the vertex that minimizes the travel in and out of it.  Moving
+        # the entry of a loop changes the best entry of a loop just before it, so this is repeated
+        # until no entry moves.  Each move shortens the tour, so that always happens.
+        moved = True
+        while moved:
+            moved = False
+            last = self.origin
+            for index, node in enumerate(self.order):
+                if self.closed[node]:
+                    following = self.entry_point(self.order[index+1]) if index + 1 < len(self.order) else None
+                    path = self.paths[node]
+
+                    def cost(vertex):
+                        travel = _dist(last, path[vertex])
+                        if following is not None:
+                            travel += _dist(path[vertex], following)
+                        return travel
+
+                    best = (cost(self.entry[node]), self.entry[node])
+                    for vertex in range(max(len(path) - 1, 1)):
+                        travel = cost(vertex)
+                        if travel < best[0] - 1e-9:
+                            best = (travel, vertex)
+                    if best[1] != self.entry[node]:
+                        self.entry[node] = best[1]
+                        moved = True
+                last = self.exit_point(node)
+
+def _dist(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
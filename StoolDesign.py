@@ -2,7 +2,7 @@
 #Description-
 
 import adsk.core, adsk.fusion, adsk.cam, traceback
-import math, random
+import io, math, random
 
 _app = adsk.core.Application.get()
 _ui  = _app.userInterface
@@ -13,9 +13,31 @@ _handlers = []
 _seatWidth = 21
 _seatHeight = 41
 _minSize = 1 * 2.54 
+_maxCircles = 300        # Upper limit of the circles design's number slider.
+_maxRectangles = 300     # Upper limit of the rectangles design's number slider.
 _strokeTol = 0.005 
+_chainTol = 0.00001     # Distance at which curve end points are considered connected.
 _retractHeight = 0.5
 _cuttingDepths = [-0.09, -0.1]
+_tourMaxPasses = 50      # Passes made at most to improve the cutting order, which stop once a pass doesn't improve it.
+_tourTimeBudget = 30.0   # Seconds after which improving the cutting order is stopped anyway, reported when hit.
+_simplifyTol = 0.000254  # Simplification tolerance, the resolution of the g-code (0.0001 in.)
+_arcTol = 0.00254        # Tolerance for fitting arcs to curves (0.001 in.)
+_depthStrategy = 'layer' # 'layer' cuts the design at each depth, 'contour' cuts each curve at every depth.
+_rampEntry = False       # Ramp down closed curves instead of plunging, with the 'contour' strategy.
+_compactGCode = False    # Leave out the g-code words that repeat the modal state.
+_sketchPolyLines = {}    # Stroked and chained polylines of each cut sketch, by entity token.
+_gCodeCacheSize = 20     # Number of posted programs kept so an unchanged seat isn't processed again, 0 to disable.
+_timingLogFile = ''      # File to append the phase timings of each Cut Seat to as JSON lines, '' to disable.
+_profileAdsk = False     # Count and time the Fusion API calls made by each command handler.
+_profiler = None
+_designSeeds = {}        # Seed of the open design dialogs by command id, new when a dialog opens or Randomize is pressed.
+_previewInterval = 0.15  # Seconds between the previews drawn while a slider is dragged, 0 to draw them all.
+_previewThrottle = None
+_previewEventId = 'adsk-StoolDesignPreview'
+_pendingPreview = None   # Command whose preview was skipped and is redrawn by the custom event.
+_toolDiscoveryTTL = 60.0 # Seconds the tools found on the network are used for, 0 to look for them at every Cut Seat.
+_toolCache = None        # The tools on the network, looked for in the background once Cut Seat is first opened.
 
 
 class CutSeatCommandExecuteHandler(adsk.core.CommandEventHandler):
@@ -25,8 +47,18 @@ class CutSeatCommandExecuteHandler(adsk.core.CommandEventHandler):
         try:
             eventArgs = adsk.core.CommandEventArgs.cast(args)
             inputs = eventArgs.command.commandInputs
+            isDebug = inputs.itemById('debugInput').value
+
+            # Time each phase when debugging or when a log file is set.
+            from .Modules import instrument
+            timer = instrument.PhaseTimer() if isDebug or _timingLogFile else None
 
-            gCode = generateGCode()
+            # The program is kept as one string, which is what's uploaded.
+            stats = {}
+            buffer = io.StringIO()
+            if not generateGCode(buffer, stats, timer):
+                return False
+            gCode = buffer.getvalue()
 
             name = inputs.itemById('nameInput').value
             if name == '':
@@ -34,36 +66,74 @@ class CutSeatCommandExecuteHandler(adsk.core.CommandEventHandler):
             description = inputs.itemById('descriptionInput').value
             if description == '':
                 description = None
-            isDebug = inputs.itemById('debugInput').value
             
-            text_file = open("C:/Temp/g-codeTest.txt", "w")
-            text_file.write(gCode)
-            text_file.close()
+            if isDebug and 'rapidBefore' in stats:
+                from .Modules import simulator
+                buffer.seek(0)
+                estimate = simulator.simulate(buffer)
+                _ui.messageBox('Rapid travel: {} in. as drawn, {} in. nearest-neighbor, {} in. after ordering.\n'
+                               'Program: {:.4f} in. of rapids, {} retracts.\n'
+                               'Estimated run time: {}'.format(toInches(stats['rapidInput']), toInches(stats['rapidBefore']), toInches(stats['rapidAfter']),
+                                                               stats['programRapid'], stats['retracts'],
+                                                               simulator.format_time(estimate.total_time)))
+
+            with instrument.phase(timer, 'writing test file'):
+                text_file = open("C:/Temp/g-codeTest.txt", "w")
+                text_file.write(gCode)
+                text_file.close()
             
-            if gCode == '':
-                return False
-                
-            # Get list of tools on the network
+            # Get list of tools on the network.  They've been looked for in the background since
+            # the dialog opened, and only the first Cut Seat may have to wait for that to finish.
             from .Modules import fabmo    
             try:
-                tools = fabmo.find_tools(debug=isDebug)
+                with instrument.phase(timer, 'tool discovery'):
+                    if _toolDiscoveryTTL > 0 and not isDebug:
+                        startToolCache()
+                        tools = _toolCache.tools()
+                    else:
+                        tools = fabmo.find_tools(debug=isDebug)
             except:
                 _ui.messageBox('Unable to use the Fabmo tools.  Aborting.')
                 return False
         
-            # Make sure we have one and only one tool
+            # Make sure we have at least one tool
             if len(tools) == 0:
                 _ui.messageBox('No tools were found on the network.')
                 return
-            elif len(tools) > 1:
-                _ui.messageBox('There is more than one tool on the network.')
-                return
         
-            tool = tools[0]
-            
-            job = tool.submit_job(gCode, 'stool.nc', name, description)
-            
-            _ui.messageBox('Job submitted.')
+            if len(tools) == 1:
+                tool = tools[0]
+                try:
+                    job = tool.submit_job(gCode, 'stool.nc', name, description, timer)
+                except:
+                    # Look for the tools again next time.
+                    if _toolCache:
+                        _toolCache.drop(tool)
+                    raise
+                message = 'Job submitted.'
+            else:
+                # Send the job to the tool that's free, or the one with the least work waiting.
+                from .Modules import fleet
+                seatJob = fleet.SeatJob(gCode, 'stool.nc', name, description)
+                with instrument.phase(timer, 'tool scheduling'):
+                    toolFleet = fleet.Fleet(tools)
+                    queue = toolFleet.submit(seatJob)
+                if _toolCache:
+                    for lost in toolFleet.queues:
+                        if lost.error is not None:
+                            _toolCache.drop(lost.tool)
+                tool = queue.tool
+                message = 'Job submitted to {}.\n\n{}'.format(queue.name, toolFleet.summary())
+
+            if stats.get('tourTimedOut'):
+                message += '\n\nThe cutting order was stopped by the time limit before it was finished.'
+
+            if timer and _timingLogFile:
+                timer.write_log(_timingLogFile, name = name)
+            if isDebug:
+                _ui.messageBox(message + '\n\n' + timer.summary())
+            else:
+                _ui.messageBox(message)
             tool.show_job_manager()
             
             return True
@@ -72,6 +142,17 @@ class CutSeatCommandExecuteHandler(adsk.core.CommandEventHandler):
                 _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
                 
                 
+# Creates the cache of the tools on the network if it's used, and starts looking for them
+# in the background.  Does nothing once it's started.
+def startToolCache():
+    global _toolCache
+    if _toolDiscoveryTTL > 0:
+        from .Modules import fabmo
+        if not _toolCache:
+            _toolCache = fabmo.ToolCache(_toolDiscoveryTTL)
+        _toolCache.start()
+
+
 # Event handler for the Cut Seat command created event.
 class CutSeatCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
     def __init__(self):
@@ -79,6 +160,10 @@ class CutSeatCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
     def notify(self, args):
         try:
             eventArgs = adsk.core.CommandCreatedEventArgs.cast(args)
+
+            # Start looking for the tools in the background while the dialog is open and the
+            # g-code is made, so the first Cut Seat doesn't wait for them on the main thread.
+            startToolCache()
     
             # Connect to the execute event.
             onExecute = CutSeatCommandExecuteHandler()
@@ -118,166 +203,269 @@ class CutSeatValidateInputsHandler(adsk.core.ValidateInputsEventHandler):
 #            eventArgs.areInputsValid = False
 
 
-def generateGCode():
+# Writes the g-code for all of the "cut" sketches to the text file object out.
+# If a dictionary is passed in for stats it's filled in with information about
+# the toolpath.  timer is an optional instrument.PhaseTimer to record the time
+# of each phase in.  Returns False if the g-code couldn't be created.
+def generateGCode(out, stats = None, timer = None):
     try:
+        from .Modules import cache, instrument, toolpath
         des = adsk.fusion.Design.cast(_app.activeProduct)
+        settings = toolpathSettings()
+        with instrument.phase(timer, 'fingerprinting sketches'):
+            sketches = getCutSketches(des)
+            fingerprints = [sketchFingerprint(sk) for sk in sketches]
+        instrument.count(timer, 'cut sketches', len(sketches))
+
+        # Use the previous g-code if nothing that goes into it has changed.
+        if _gCodeCacheSize > 0:
+            gCodeCache = cache.GCodeCache(gCodeCacheFolder(), _gCodeCacheSize)
+            key = cache.make_key(fingerprints, vars(settings))
+            with instrument.phase(timer, 'g-code cache'):
+                cached = gCodeCache.get(key)
+            if cached:
+                instrument.count(timer, 'g-code cache hits')
+                (gCode, info) = cached
+                out.write(gCode)
+                if stats is not None:
+                    stats.update(info)
+                return True
 
-        ### Get all of the sketch geometry as polylines for sketches that are
-        ### based on the x-y construction plane, are visuble and have "cut" in the name.      
-        polyLines = []
-        sk = adsk.fusion.Sketch.cast(None)
-        for sk in des.rootComponent.sketches:
-            # Get the visible design sketches.
-            if sk.isVisible:
-                # Check the sketch name contains "cut"
-                if sk.name.upper().find('CUT') != -1:
-                    # Iterate over all of the curves in the sketch.
-                    curve = adsk.fusion.SketchCurve.cast(None)
-                    for curve in sk.sketchCurves:
-                        if not curve.isConstruction:
-                            # Get a line approximation of the curve.
-                            eval = adsk.core.CurveEvaluator3D.cast(curve.geometry.evaluator)
-                            (returnValue, startParameter, endParameter) = eval.getParameterExtents()
-                            (returnValue, vertexCoordinates) = eval.getStrokes(startParameter, endParameter, _strokeTol)
-                            curvePoly = polyLine(vertexCoordinates)
-    
-                            if len(polyLines) == 0:
-                                polyLines.append(curvePoly)
-                            else:
-                                # Iterate over all existing polylines to see if this connects.
-                                didConnect = False
-                                for poly in polyLines:
-                                    didConnect = poly.connect(curvePoly)
-                                    if didConnect:
-                                        break
-                                if not didConnect:
-                                    polyLines.append(curvePoly)
-
-                    ###### Iterate through all text.
-                    text = adsk.fusion.SketchText.cast(None)
-                    for text in sk.sketchTexts:
-                        textCurves = text.asCurves()
-                        for textCurve in textCurves:
-                            # Get a line approximation of the curve.
-                            eval = adsk.core.CurveEvaluator3D.cast(textCurve.evaluator)
-                            (returnValue, startParameter, endParameter) = eval.getParameterExtents()
-                            (returnValue, vertexCoordinates) = eval.getStrokes(startParameter, endParameter, _strokeTol)
-                            curvePoly = polyLine(vertexCoordinates)
-
-                            if len(polyLines) == 0:
-                                polyLines.append(curvePoly)
-                            else:
-                                # Iterate over all existing polylines to see if this connects.
-                                didConnect = False
-                                for poly in polyLines:
-                                    didConnect = poly.connect(curvePoly)
-                                    if didConnect:
-                                        break
-                                if not didConnect:
-                                    polyLines.append(curvePoly)
-
-        # Continue to try to reconnect the curves until nothing can be connected.
-        connected = True
-        while connected:
-            connected = False
-            for poly1 in polyLines:
-                index = -1
-                for poly2 in polyLines:
-                    index += 1
-                    if poly1 and poly2:
-                        if not poly1 is poly2:
-                            didConnect = poly1.connect(poly2)
-                            if didConnect:
-                                polyLines[index] = None
-                                connected = True
-                                
-        # Clean up the polyline list.
-        for i in range(len(polyLines)-1, -1, -1):
-            if not polyLines[i]:
-                polyLines.pop(i)
-                
-        # Reorder and reverse the polylines to create the optimal cutting path.
-        for i in range(0, len(polyLines)-1):
-            closestPoly = -1
-            closestDist = 500000
-            isStart = True
-            lastPoint = polyLines[i].endPoint()
-            for j in range(i+1, len(polyLines)):
-                dist = polyLines[j].startPoint().distanceTo(lastPoint)
-                if dist < closestDist:
-                    closestDist = dist
-                    closestPoly = j
-                    isStart = True
-                    
-                dist = polyLines[j].endPoint().distanceTo(lastPoint)
-                if dist < closestDist:
-                    closestDist = dist
-                    closestPoly = j
-                    isStart = False
-                    
-            if not isStart:
-                polyLines[closestPoly].reverse()
-                
-            if polyLines[closestPoly] != polyLines[i+1]:
-                tempPoly = polyLines[i+1]
-                polyLines[i+1] = polyLines[closestPoly]
-                polyLines[closestPoly] = tempPoly
-                
-        ###### Begin creating the g-code data.        
-        # Write the header.
-        gCode = ''
-        gCode += 'g20\n'        # set to inches
-        gCode += 'g1 f120\n'     # set the feed rate.
-        gCode += 'g0 z' + toInches(_retractHeight) + '\n'    # lift to safe Z
-        gCode += 'm4\n'         # spindle on
-        gCode += 'g4 p2\n'      # a pause to allow spindle to spin up   
-
-        # Do a pass for each cutting depth.        
-        for cuttingDepth in _cuttingDepths:
-            for poly in polyLines:
-                firstPoint = True
-                for point in poly.points:
-                    if firstPoint:
-                        # Move to start of polyline and then drop down.
-                        gCode += ('g0 x' + toInches(point.x) + ' y' + 
-                                 toInches(point.y) + '\n')
-                        gCode += 'g1 z' + toInches(cuttingDepth) + '\n'
-                        gCode += ('g1 x' + toInches(point.x) + ' y' + 
-                                 toInches(point.y) + '\n')
-                        firstPoint = False
-                    else:
-                        gCode += ('g1 x' + toInches(point.x) + ' y' + 
-                                 toInches(point.y) + '\n')
-                
-                # Retract to safe Z
-                gCode += 'g0 z' + toInches(_retractHeight) + '\n'
-                    
-        # Write the end of the data.
-        gCode += 'm5\n'         # turn off spindle
-        gCode += 'g0 x24 y0\n'   # Go to home.
-        gCode += 'm30\n'        # End of Program
+        # Chain, order and write out the polylines using the same pipeline
+        # as the command line toolpath compiler.  The g-code is written to the
+        # cache at the same time as it's written out.
+        # A problem with the cache, like a full disk, only means the program isn't cached.
+        polyLines = getCutPolyLines(des, sketches, fingerprints, timer)
+        entry = None
+        if _gCodeCacheSize > 0:
+            try:
+                entry = gCodeCache.writer(key, out)
+            except:
+                logCacheError(timer)
+        if entry:
+            try:
+                cutPath = toolpath.write_gcode(entry, polyLines, settings, timer)
+            except:
+                entry.discard()
+                raise
+        else:
+            cutPath = toolpath.write_gcode(out, polyLines, settings, timer)
+
+        info = {'rapidInput': cutPath.rapid_input, 'rapidBefore': cutPath.rapid_before, 'rapidAfter': cutPath.rapid_after,
+                'programRapid': cutPath.program.rapid_length, 'retracts': cutPath.program.retracts,
+                'tourTimedOut': cutPath.tour_timed_out}
+        if stats is not None:
+            stats.update(info)
+        if entry:
+            with instrument.phase(timer, 'g-code cache'):
+                try:
+                    entry.finish(info)
+                except:
+                    logCacheError(timer)
         
-        return gCode
+        return True
     except:
         if _ui:
             _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
         
-        return ''
+        return False
+
+
+# Writes the error being handled to the text commands window, for when the g-code cache
+# can't be used, and counts it in the phase timings.
+def logCacheError(timer):
+    from .Modules import instrument
+    instrument.count(timer, 'g-code cache errors')
+    try:
+        _app.log('The posted g-code could not be cached:\n{}'.format(traceback.format_exc()))
+    except:
+        pass
+
+
+# Returns the folder used to cache posted g-code.
+def gCodeCacheFolder():
+    import os, tempfile
+    return os.path.join(tempfile.gettempdir(), 'StoolDesign', 'gcode')
+
+
+# Returns the sketches that are visible and have "cut" in the name.
+def getCutSketches(des):
+    sketches = []
+    for sk in des.rootComponent.sketches:
+        if sk.isVisible and sk.name.upper().find('CUT') != -1:
+            sketches.append(sk)
+    return sketches
+
+
+# Returns a list that describes the geometry of a sketch, used to tell when it's changed
+# without having to stroke it.  Each curve is described by the data that defines it, like
+# the ends of a line or the NURBS data of a spline, and each text by the exact curves of its
+# characters, so moving, rotating or flipping it changes the description too.
+# The spec saved by a design command comes first, since it decides whether the
+# design's geometry is cut instead of the stroked sketch.
+def sketchFingerprint(sk):
+    attrib = sk.attributes.itemByName('adsk-Seat', 'DesignSpec')
+    fingerprint = [sk.name, attrib.value if attrib else None]
+    for curve in sk.sketchCurves:
+        if curve.isConstruction:
+            continue
+        fingerprint.append([curve.objectType, curveData(curve.geometry)])
+
+    for text in sk.sketchTexts:
+        fingerprint.append(['text', text.text, [curveData(textCurve) for textCurve in text.asCurves()]])
+    return fingerprint
+
+
+# Returns the values that define a Curve3D, with the points and vectors as lists of coordinates.
+def curveData(geometry):
+    def plain(values):
+        data = []
+        for value in values:
+            if isinstance(value, (adsk.core.Point3D, adsk.core.Vector3D)):
+                data.append([value.x, value.y, value.z])
+            elif isinstance(value, (list, tuple)):
+                data.append(plain(value))
+            else:
+                data.append(value)
+        return data
+
+    # The first value returned by getData is whether it succeeded.
+    return [geometry.curveType] + plain(geometry.getData()[1:])
+
+
+# Get all of the sketch geometry as polylines for sketches that are
+# based on the x-y construction plane, are visible and have "cut" in the name.
+# The sketches and their fingerprints can be passed in if they're already known.
+# Sketches drawn by the design commands use the design's geometry instead of being
+# stroked, as long as they haven't been changed since.
+# Each sketch is only stroked and chained again when its geometry has changed, and
+# the polylines returned are copies so the cached ones aren't changed.
+def getCutPolyLines(des, sketches = None, fingerprints = None, timer = None):
+    from .Modules import instrument
+
+    if sketches is None:
+        sketches = getCutSketches(des)
+    if fingerprints is None:
+        fingerprints = [sketchFingerprint(sk) for sk in sketches]
+
+    polyLines = []
+    tokens = set()
+    for (sk, fingerprint) in zip(sketches, fingerprints):
+        token = sk.entityToken
+        tokens.add(token)
+        state = [fingerprint, _strokeTol, _chainTol]
+        cached = _sketchPolyLines.get(token)
+        if cached is None or cached[0] != state:
+            with instrument.phase(timer, 'design geometry'):
+                designPolyLines = getDesignPolyLines(sk, fingerprint)
+            if designPolyLines is not None:
+                cached = (state, designPolyLines)
+                instrument.count(timer, 'design sketches')
+            else:
+                with instrument.phase(timer, 'stroking'):
+                    cached = (state, getSketchPolyLines(sk))
+                instrument.count(timer, 'stroked sketches')
+                instrument.count(timer, 'stroked points', sum(poly.pointCount() for poly in cached[1]))
+            _sketchPolyLines[token] = cached
+        polyLines.extend(poly.copy() for poly in cached[1])
+
+    # Forget the sketches that have been deleted or are no longer cut.
+    for token in list(_sketchPolyLines):
+        if token not in tokens:
+            del _sketchPolyLines[token]
+
+    return polyLines
+
+
+# Returns the chained polylines of the design a sketch was drawn from, or None if it
+# wasn't drawn by a design command or has been changed since.  Splines are always
+# stroked from the sketch since the design's splines aren't exactly the same.
+def getDesignPolyLines(sk, fingerprint):
+    from .Modules import designs
+    from .Modules.polyline import chainPolyLines
+
+    attrib = sk.attributes.itemByName('adsk-Seat', 'DesignSpec')
+    if not attrib:
+        return None
+    design = designs.Design.from_spec(attrib.value)
+    if not design or any(shape[0] == 'spline' for shape in design.geometry):
+        return None
+
+    # Compare the lines and circles in the sketch with the ones the design would draw.
+    # A line's data is its ends, and a circle's its center, normal and radius.
+    curves = []
+    for entry in fingerprint[2:]:
+        if entry[0] == adsk.fusion.SketchLine.classType():
+            curves.append(('line', entry[1][1], entry[1][2]))
+        elif entry[0] == adsk.fusion.SketchCircle.classType():
+            ((x, y, z), normal, radius) = entry[1][1:4]
+            curves.append(('circle', (x + radius, y), (x, y + radius), (x - radius, y)))
+        else:
+            return None
+    if designs.sketch_outline(curves) != designs.outline(design.geometry):
+        return None
+
+    return chainPolyLines(design.polylines(_strokeTol), _chainTol)
+
+
+# Stroke the curves and text of a sketch and chain them into polylines.
+def getSketchPolyLines(sk):
+    from .Modules.polyline import polyLine, chainPolyLines
+
+    polyLines = []
+
+    # Iterate over all of the curves in the sketch.
+    curve = adsk.fusion.SketchCurve.cast(None)
+    for curve in sk.sketchCurves:
+        if not curve.isConstruction:
+            # Get a line approximation of the curve.
+            eval = adsk.core.CurveEvaluator3D.cast(curve.geometry.evaluator)
+            (returnValue, startParameter, endParameter) = eval.getParameterExtents()
+            (returnValue, vertexCoordinates) = eval.getStrokes(startParameter, endParameter, _strokeTol)
+            poly = polyLine.fromPoint3Ds(vertexCoordinates)
+
+            # Circles and arcs can be cut directly as arcs.
+            if curve.objectType in (adsk.fusion.SketchCircle.classType(), adsk.fusion.SketchArc.classType()):
+                center = curve.geometry.center
+                poly.arcCenter = (center.x, center.y)
+            polyLines.append(poly)
+
+    ###### Iterate through all text.
+    text = adsk.fusion.SketchText.cast(None)
+    for text in sk.sketchTexts:
+        textCurves = text.asCurves()
+        for textCurve in textCurves:
+            # Get a line approximation of the curve.
+            eval = adsk.core.CurveEvaluator3D.cast(textCurve.evaluator)
+            (returnValue, startParameter, endParameter) = eval.getParameterExtents()
+            (returnValue, vertexCoordinates) = eval.getStrokes(startParameter, endParameter, _strokeTol)
+            polyLines.append(polyLine.fromPoint3Ds(vertexCoordinates))
+
+    # Chain within the sketch now so it doesn't need to be done again.  The toolpath
+    # compiler still chains the merged polylines of all the sketches.
+    return chainPolyLines(polyLines, _chainTol)
+
+
+# Returns the toolpath settings that correspond to the values used by the add-in.
+def toolpathSettings():
+    from .Modules import toolpath
+    return toolpath.ToolpathSettings(cutting_depths = _cuttingDepths, retract_height = _retractHeight,
+                                     stroke_tolerance = _strokeTol, chain_tolerance = _chainTol,
+                                     tour_time_budget = _tourTimeBudget, tour_max_passes = _tourMaxPasses, simplify_tolerance = _simplifyTol,
+                                     arc_tolerance = _arcTol, depth_strategy = _depthStrategy, ramp_entry = _rampEntry,
+                                     compact = _compactGCode, verify_compact = _compactGCode)
 
 
 def generateGCodeOld():
     try:
+        from .Modules import gcode
         des = adsk.fusion.Design.cast(_app.activeProduct)
     
         # Begin creating the g-code data.
-        gCode = ''
+        gCode = []
         
         # Write the header.
-        gCode += 'g20\n'        # set to inches
-        gCode += 'g1 f120\n'     # set the feed rate.
-        gCode += 'g0 z' + toInches(_retractHeight) + '\n'    # lift to safe Z
-        gCode += 'm4\n'         # spindle on
-        gCode += 'g4 p2\n'      # a pause to allow spindle to spin up   
+        gCode.extend(gcode.iter_header(_retractHeight))
     
         # Get the visible design sketches.
         sk = adsk.fusion.Sketch.cast(None)
@@ -294,20 +482,20 @@ def generateGCodeOld():
                                 startPnt = skLine.startSketchPoint.geometry
                                 endPnt = skLine.endSketchPoint.geometry
                                 if startPnt.isEqualTo(lastPnt):
-                                    gCode += ('g1 x' + toInches(endPnt.x) + ' y' + 
-                                             toInches(endPnt.y) + '\n')
+                                    gCode.append('g1 x' + toInches(endPnt.x) + ' y' + 
+                                                 toInches(endPnt.y) + '\n')
                                     lastPnt = endPnt
                                 else:
-                                    gCode += 'g0 z' + toInches(_retractHeight) + '\n'
-                                    gCode += ('g0 x' + toInches(startPnt.x) + ' y' + 
-                                             toInches(startPnt.y) + '\n')
-                                    gCode += 'g1 z' + toInches(cuttingDepth) + '\n'
-                                    gCode += ('g1 x' + toInches(endPnt.x) + ' y' + 
-                                             toInches(endPnt.y) + '\n')
+                                    gCode.append('g0 z' + toInches(_retractHeight) + '\n')
+                                    gCode.append('g0 x' + toInches(startPnt.x) + ' y' + 
+                                                 toInches(startPnt.y) + '\n')
+                                    gCode.append('g1 z' + toInches(cuttingDepth) + '\n')
+                                    gCode.append('g1 x' + toInches(endPnt.x) + ' y' + 
+                                                 toInches(endPnt.y) + '\n')
                                     lastPnt = endPnt
                         
                         # Retract to safe Z
-                        gCode += 'g0 z' + toInches(_retractHeight) + '\n'    
+                        gCode.append('g0 z' + toInches(_retractHeight) + '\n')
                                                 
                     #**** Iterate through all other curve types.
                     curve = adsk.fusion.SketchCurve.cast(None)
@@ -318,26 +506,27 @@ def generateGCodeOld():
                             (returnValue, startParameter, endParameter) = eval.getParameterExtents()
                             (returnValue, vertexCoordinates) = eval.getStrokes(startParameter, endParameter, _strokeTol)
                             
+                            # Format the points once for all of the cut depths.
+                            coordWords = ['x' + toInches(coord.x) + ' y' + toInches(coord.y) + '\n' for coord in vertexCoordinates]
+                            
                             # Create the cutting path at each cut depth.
                             for cuttingDepth in _cuttingDepths:
                                 firstPnt = True
-                                for coord in vertexCoordinates:
+                                for words in coordWords:
                                     # Write the point to the file.
                                     if firstPnt:
-                                        gCode += 'g0 x' + toInches(coord.x) + ' y' + toInches(coord.y) + '\n'
-                                        gCode += 'g1 z' + toInches(cuttingDepth) + '\n'
+                                        gCode.append('g0 ' + words)
+                                        gCode.append('g1 z' + toInches(cuttingDepth) + '\n')
                                         firstPnt = False
                                     else:
-                                        gCode += 'g1 x' + toInches(coord.x) + ' y' + toInches(coord.y) + '\n'
+                                        gCode.append('g1 ' + words)
                                         
-                                gCode += 'g0 z' + toInches(_retractHeight) + '\n'    # lift to safe Zs
+                                gCode.append('g0 z' + toInches(_retractHeight) + '\n')    # lift to safe Zs
     
         # Write the end of the data.
-        gCode += 'm5\n'         # turn off spindle
-        gCode += 'g0 x24 y0\n'   # Go to home.
-        gCode += 'm30\n'        # End of Program
+        gCode.extend(gcode.iter_footer())
         
-        return gCode
+        return ''.join(gCode)
     except:
         if _ui:
             _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
@@ -345,104 +534,6 @@ def generateGCodeOld():
         return ''
 
 
-class polyLine():
-    def __init__(self, points = None):
-        self.isClosed = False
-        if points:
-            self.points = list(points)
-            if self.startPoint().isEqualTo(self.endPoint()):
-                self.isClosed = True
-        else:
-            self.points = []
-
-    def startPoint(self):
-        if self.pointCount() == 0:
-            return None
-        else:
-            return self.points[0]
-        
-    def endPoint(self):
-        if self.pointCount() == 0:
-            return None
-        else:
-            return self.points[self.pointCount()-1]
-            
-    def pointCount(self):
-        return len(self.points)
-            
-    def points(self):
-        return self.points
-        
-    def asString(self):
-        result = ''
-        for point in self.points:
-            result += str(point.x) + ', ' + str(point.y) + ', ' + str(point.z) + '\n'
-        return result
-        
-    def reverse(self):
-        self.points.reverse()
-
-    def connects(self, poly):
-        if not self.isClosed:
-            thisStart = adsk.core.Point3D.cast(self.startPoint())
-            thisEnd = adsk.core.Point3D.cast(self.endPoint())
-            
-            otherStart = poly.startPoint()
-            otherEnd = poly.endPoint()
-            
-            if thisStart.isEqualTo(otherStart):
-                return True
-            elif thisStart.isEqualTo(otherEnd):
-                return True
-            elif thisEnd.isEqualTo(otherStart):
-                return True
-            elif thisEnd.isEqualTo(otherEnd):
-                return True
-        return False                
-       
-    def connect(self, poly):
-        isConnected = False            
-        if not self.isClosed:
-            thisStart = adsk.core.Point3D.cast(self.startPoint())
-            thisEnd = adsk.core.Point3D.cast(self.endPoint())
-            
-            otherStart = poly.startPoint()
-            otherEnd = poly.endPoint()
-
-            if thisStart.isEqualTo(otherStart):
-                # Reverse the other polyline and add it to the front of the existing polyline.
-                tempList = list(poly.points)
-                tempList.pop(0)
-                tempList.reverse()
-                self.points = tempList + self.points
-                isConnected = True
-            elif thisStart.isEqualTo(otherEnd):
-                # Add the other polyline to the front of this one maintaining
-                # the same point order of the other polyline.
-                tempList = list(poly.points)
-                tempList.pop(len(tempList)-1)
-                self.points = tempList + self.points
-                isConnected = True
-            elif thisEnd.isEqualTo(otherStart):
-                tempList = list(poly.points)
-                tempList.pop(0)
-                self.points.extend(tempList)
-                isConnected = True
-            elif thisEnd.isEqualTo(otherEnd):
-                tempList = list(poly.points)
-                tempList.pop(len(tempList)-1)
-                tempList.reverse()
-                self.points.extend(tempList)
-                isConnected = True
-
-        # Check to see if the polyline is closed.
-        if isConnected:
-            if self.startPoint().isEqualTo(self.endPoint()):
-                self.isClosed = True
-
-        return isConnected
-        
-
 def toInches(centimeterValue):
     return '{0:.4f}'.format(centimeterValue / 2.54)
 
@@ -460,8 +551,134 @@ class NewSeatCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
         impOptions = _app.importManager.createFusionArchiveImportOptions(modelFile)
         newDoc = _app.documents.add(adsk.core.DocumentTypes.FusionDesignDocumentType)
         des = newDoc.products.itemByProductType('DesignProductType')
-        _app.importManager.importToTarget(impOptions, des.rootComponent)            
-        
+        _app.importManager.importToTarget(impOptions, des.rootComponent)
+
+
+
+#******************* Design previews ******************************************
+
+# Connect the preview and execute handlers of a design command, and the input changed
+# handler of its Randomize button.  Called when the dialog is created, which picks a new
+# seed.  The seed then stays the same until Randomize is clicked so the same values always
+# give the same design while the dialog is open.
+def connectDesignCommand(cmd, handlerClass):
+    from .Modules import designs
+
+    onExecutePreview = handlerClass(True)
+    cmd.executePreview.add(onExecutePreview)
+    _handlers.append(onExecutePreview)
+
+    # Previews skipped while dragging a slider aren't valid results, so OK needs to create the design.
+    onExecute = handlerClass(False)
+    cmd.execute.add(onExecute)
+    _handlers.append(onExecute)
+
+    onInputChanged = DesignInputChangedHandler()
+    cmd.inputChanged.add(onInputChanged)
+    _handlers.append(onInputChanged)
+
+    onDestroy = DesignCommandDestroyHandler()
+    cmd.destroy.add(onDestroy)
+    _handlers.append(onDestroy)
+
+    _designSeeds[cmd.parentCommandDefinition.id] = designs.new_seed()
+
+
+# Returns the designs.Design for the values in the dialog, or None if the preview is
+# skipped because a slider is being dragged.  A skipped preview is drawn by the custom
+# event once the slider stops, and until then the previous preview is left alone.
+def getDesign(eventArgs, isPreview, name, **params):
+    global _pendingPreview
+    from .Modules import designs
+
+    cmd = eventArgs.command
+    if isPreview and _previewThrottle and not _previewThrottle.ready():
+        # Only one custom event is waiting at a time, and it fires itself again until the slider stops.
+        if not _pendingPreview:
+            _app.fireCustomEvent(_previewEventId, '')
+        _pendingPreview = cmd
+        return None
+
+    eventArgs.isValidResult = True
+    return designs.Design(name, _designSeeds[cmd.parentCommandDefinition.id], params)
+
+
+# Add the shapes of a design to the sketch.  Connected lines share their end points.
+# The design's spec is saved with the sketch so Cut Seat can use the geometry directly
+# instead of stroking the sketch.
+def drawDesign(sk, design):
+    sk.attributes.add('adsk-Seat', 'DesignSpec', design.spec())
+    lines = sk.sketchCurves.sketchLines
+    for shape in design.geometry:
+        kind = shape[0]
+        if kind == 'polyline':
+            (points, closed) = (shape[1], shape[2])
+            startLine = None
+            lastLine = None
+            for (x, y) in points[1:]:
+                if not lastLine:
+                    lastLine = lines.addByTwoPoints(adsk.core.Point3D.create(points[0][0], points[0][1], 0), adsk.core.Point3D.create(x, y, 0))
+                    startLine = lastLine
+                else:
+                    lastLine = lines.addByTwoPoints(lastLine.endSketchPoint, adsk.core.Point3D.create(x, y, 0))
+            if closed and lastLine:
+                lines.addByTwoPoints(lastLine.endSketchPoint, startLine.startSketchPoint)
+        elif kind == 'rectangle':
+            lines.addTwoPointRectangle(adsk.core.Point3D.create(shape[1][0], shape[1][1], 0), adsk.core.Point3D.create(shape[2][0], shape[2][1], 0))
+        elif kind == 'circle':
+            sk.sketchCurves.sketchCircles.addByCenterRadius(adsk.core.Point3D.create(shape[1][0], shape[1][1], 0), shape[2])
+        elif kind == 'spline':
+            pnts = adsk.core.ObjectCollection.create()
+            for (x, y) in shape[1]:
+                pnts.add(adsk.core.Point3D.create(x, y, 0))
+            spline = sk.sketchCurves.sketchFittedSplines.add(pnts)
+            if shape[2]:
+                spline.isClosed = True
+
+
+# Event handler for the input changed event of the design commands.
+class DesignInputChangedHandler(adsk.core.InputChangedEventHandler):
+    def __init__(self):
+        super().__init__()
+    def notify(self, args):
+        from .Modules import designs
+        eventArgs = adsk.core.InputChangedEventArgs.cast(args)
+        if eventArgs.input.id == 'regen':
+            _designSeeds[eventArgs.input.parentCommand.parentCommandDefinition.id] = designs.new_seed()
+
+
+# Event handler for the custom event fired when a preview is skipped.  It's fired again
+# until the slider has stopped, and then the skipped preview is drawn.  Everything happens
+# on the main thread, in between the events of the dialog.
+class DesignPreviewEventHandler(adsk.core.CustomEventHandler):
+    def __init__(self):
+        super().__init__()
+    def notify(self, args):
+        global _pendingPreview
+        cmd = _pendingPreview
+        if not cmd or not _previewThrottle:
+            return
+        if not _previewThrottle.due():
+            _app.fireCustomEvent(_previewEventId, '')
+            return
+        _pendingPreview = None
+        try:
+            cmd.doExecutePreview()
+        except:
+            # The dialog was closed before the preview was drawn.
+            pass
+
+
+# Event handler for the destroy event of the design commands, which forgets the
+# preview waiting to be drawn so the closed dialog isn't kept.
+class DesignCommandDestroyHandler(adsk.core.CommandEventHandler):
+    def __init__(self):
+        super().__init__()
+    def notify(self, args):
+        global _pendingPreview
+        _pendingPreview = None
+        if _previewThrottle:
+            _previewThrottle.cancel()
 
 
 #******************* Sin Curve ***********************************************
@@ -476,9 +693,7 @@ class SinCurveDesignCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
             cmd = eventArgs.command
             
             # Connect to the execute preview event.
-            onExecutePreview = SinCurveDesignCommandExecutePreviewHandler()
-            cmd.executePreview.add(onExecutePreview)
-            _handlers.append(onExecutePreview)
+            connectDesignCommand(cmd, SinCurveDesignCommandExecutePreviewHandler)
     
             # Create the command inputs.        
             inputs = cmd.commandInputs
@@ -499,12 +714,12 @@ class SinCurveDesignCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
 # Event handler for the execute preview event.
 #def sinCurve(sketch, amplitude, frequency, yOffset):
 class SinCurveDesignCommandExecutePreviewHandler(adsk.core.CommandEventHandler):
-    def __init__(self):
+    def __init__(self, isPreview = True):
         super().__init__()
+        self.isPreview = isPreview
     def notify(self, args):
         try:
             eventArgs = adsk.core.CommandEventArgs.cast(args)
-            eventArgs.isValidResult = True
     
             # Get the current values from the dialog.
             inputs = eventArgs.command.commandInputs
@@ -514,28 +729,17 @@ class SinCurveDesignCommandExecutePreviewHandler(adsk.core.CommandEventHandler):
             amplitude = amplitude * (_seatWidth * 0.5)
             yOffset = (inputs.itemById('yOffset').valueOne * 0.01) * _seatWidth 
     
+            design = getDesign(eventArgs, self.isPreview, 'sin_curve', frequency = frequency, amplitude = amplitude, offset = yOffset,
+                               width = _seatWidth, height = _seatHeight)
+            if design is None:
+                return
+
             des = adsk.fusion.Design.cast(_app.activeProduct)
             sk = des.rootComponent.sketches.add(des.rootComponent.xYConstructionPlane)
             sk.areProfilesShown = False
             sk.name = 'Sin Curve (Cut)'
             
-            x = 0
-            angle = 0
-            pntsPerFrequency = 4
-            pnts = adsk.core.ObjectCollection.create()
-            for i in range(0, frequency):
-                for j in range(0, pntsPerFrequency):
-                    y = math.sin(angle)
-                    y = (y * amplitude) + yOffset
-                    angle += math.pi/(pntsPerFrequency/2)
-                    pnts.add(adsk.core.Point3D.create(y,x,0))
-                    x += _seatHeight / (frequency * pntsPerFrequency)
-        
-            y = math.sin(angle)
-            y = (y * amplitude) + yOffset
-            pnts.add(adsk.core.Point3D.create(y,x,0))
-                    
-            sk.sketchCurves.sketchFittedSplines.add(pnts) 
+            drawDesign(sk, design)
         except:
             if _ui:
                 _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
@@ -699,9 +903,7 @@ class MeshDesignCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
         cmd = eventArgs.command
         
         # Connect to the execute preview event.
-        onExecutePreview = MeshDesignCommandExecutePreviewHandler()
-        cmd.executePreview.add(onExecutePreview)
-        _handlers.append(onExecutePreview)
+        connectDesignCommand(cmd, MeshDesignCommandExecutePreviewHandler)
 
         # Create the command inputs.        
         inputs = cmd.commandInputs
@@ -731,11 +933,11 @@ class MeshDesignCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
         
 # Event handler for the execute preview event.
 class MeshDesignCommandExecutePreviewHandler(adsk.core.CommandEventHandler):
-    def __init__(self):
+    def __init__(self, isPreview = True):
         super().__init__()
+        self.isPreview = isPreview
     def notify(self, args):
         eventArgs = adsk.core.CommandEventArgs.cast(args)
-        eventArgs.isValidResult = True
 
         # Get the current values from the dialog.
         inputs = eventArgs.command.commandInputs
@@ -747,6 +949,11 @@ class MeshDesignCommandExecutePreviewHandler(adsk.core.CommandEventHandler):
         maintainEdges = inputs.itemById('maintainEdges').value
         isRandom = inputs.itemById('isRandom').value
     
+        design = getDesign(eventArgs, self.isPreview, 'mesh', x_num = xNum, y_num = yNum, width = _seatWidth, height = _seatHeight,
+                           border = borderSize, is_random = isRandom, maintain_edges = maintainEdges)
+        if design is None:
+            return
+
         # Create a new sketch.
         des = adsk.fusion.Design.cast(_app.activeProduct)
         sk = des.rootComponent.sketches.add(des.rootComponent.xYConstructionPlane)
@@ -755,72 +962,8 @@ class MeshDesignCommandExecutePreviewHandler(adsk.core.CommandEventHandler):
         sk.attributes.add('adsk-Seat', 'SeatSketch', '')
         sk.isComputeDeferred = True
 
-        random.seed()
-        widthSize = (_seatWidth - (borderSize * 2))/xNum 
-        heightSize = (_seatHeight - (borderSize * 2))/yNum 
-    
-        points = [[0 for x in range(xNum+1)] for x in range(yNum+1)] 
-        for yPnt in range(0, yNum+1):
-            for xPnt in range(0, xNum+1):
-                x = xPnt * widthSize
-                y = yPnt * heightSize
-                if isRandom:
-                    x =  x + (random.random() * (widthSize * (2/3))) - (widthSize * (1/3)) + borderSize
-                    y =  y + (random.random() * (heightSize * (2/3))) - (heightSize * (1/3)) + borderSize
-                points[yPnt][xPnt] = adsk.core.Point3D.create(x,y,0)
-    
-        # Fix the edge points, if needed.
-        if maintainEdges:
-            for xPnt in range(0, xNum+1):
-                points[0][xPnt].y = borderSize - 0.5
-    
-            for xPnt in range(0, xNum+1):
-                points[yNum][xPnt].y = _seatHeight - borderSize + 0.5
-    
-            for yPnt in range(0, yNum+1):
-                points[yPnt][0].x = borderSize - 0.5
-    
-            for yPnt in range(0, yNum+1):
-                points[yPnt][xNum].x = _seatWidth - borderSize + 0.5 
- 
-        stepInc = -1
-        lines = sk.sketchCurves.sketchLines
-        for yIndex in range(1, yNum):
-            stepInc = -stepInc
-            lastPnt = None
-            
-            if stepInc == 1:
-                startVal = 0
-                endVal = xNum+1
-            else:
-                startVal = xNum
-                endVal = -1
-                
-            for xIndex in range(startVal, endVal, stepInc):
-                if not lastPnt:
-                    lastPnt = points[yIndex][xIndex]
-                else:
-                    newLine = lines.addByTwoPoints(lastPnt, points[yIndex][xIndex])
-                    lastPnt = newLine.endSketchPoint
-
-        stepInc = -1
-        for xIndex in range(1, xNum):
-            stepInc = -stepInc
-            lastPnt = None
-            
-            if stepInc == 1:
-                startVal = 0
-                endVal = yNum+1
-            else:
-                startVal = yNum
-                endVal = -1
-                
-            for yIndex in range(startVal, endVal, stepInc):
-                if not lastPnt:
-                    lastPnt = points[yIndex][xIndex]
-                else:
-                    newLine = lines.addByTwoPoints(lastPnt, points[yIndex][xIndex])
-                    lastPnt = newLine.endSketchPoint
+        drawDesign(sk, design)
+        sk.isComputeDeferred = False
                     
                        
 #        for yPnt in range(0, heightNum):
@@ -846,9 +989,7 @@ class FlowerDesignCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
         cmd = eventArgs.command
 
         # Connect to the execute preview event.
-        onExecutePreview = FlowerDesignCommandExecutePreviewHandler()
-        cmd.executePreview.add(onExecutePreview)
-        _handlers.append(onExecutePreview)
+        connectDesignCommand(cmd, FlowerDesignCommandExecutePreviewHandler)
         
         # Connect to the input changed event.
         onInputChanged = FlowerDesignInputChangedHandler()
@@ -933,44 +1074,28 @@ class FlowerDesignInputChangedHandler(adsk.core.InputChangedEventHandler):
 
 # Event handler for the execute preview event.
 class FlowerDesignCommandExecutePreviewHandler(adsk.core.CommandEventHandler):
-    def __init__(self):
+    def __init__(self, isPreview = True):
         super().__init__()
+        self.isPreview = isPreview
     def notify(self, args):
         try:
             eventArgs = adsk.core.CommandEventArgs.cast(args)
-            eventArgs.isValidResult = True
             
             inputs = eventArgs.command.commandInputs
     
             petalSides = inputs.itemById('petalSides').valueOne
-            
             petalSizeRatio = inputs.itemById('petalSize').valueOne * 0.01
-            maxSize = _seatWidth * 0.4
-            minSize = 2
-            petalSize = (maxSize - minSize) * petalSizeRatio + minSize
-            petalSize = petalSize / 2.0
-    
             petalYCenterRatio = inputs.itemById('petalHeightCenter').valueOne * 0.01
-            minOffset = -petalSize
-            maxOffset = petalSize
-            yPetalCenterOffset = (maxOffset - minOffset) * petalYCenterRatio + minOffset
-    
             petalXCenterRatio = inputs.itemById('petalWidthCenter').valueOne * 0.01
-            minOffset = -petalSize
-            maxOffset = petalSize
-            xPetalCenterOffset = (maxOffset - minOffset) * petalXCenterRatio + minOffset
-            
             petalCount = inputs.itemById('petalCount').valueOne
-            
-            maxXPos = _seatWidth - (petalSize * 2.5)
-            minXPos = petalSize * 2.5
             petalXPosRatio = inputs.itemById('petalHeightPosition').valueOne * 0.01
-            xOffset = (maxXPos - minXPos) * petalXPosRatio + minXPos
-            
-            maxYPos = _seatHeight - (petalSize * 2.5)
-            minYPos = petalSize * 2.5
             petalYPosRatio = inputs.itemById('petalWidthPosition').valueOne * 0.01
-            yOffset = (maxYPos - minYPos) * petalYPosRatio + minYPos
+
+            design = getDesign(eventArgs, self.isPreview, 'flower', petal_sides = petalSides, petal_size = petalSizeRatio, petal_count = petalCount,
+                               center_x = petalXCenterRatio, center_y = petalYCenterRatio, position_x = petalXPosRatio, position_y = petalYPosRatio,
+                               width = _seatWidth, height = _seatHeight)
+            if design is None:
+                return
             
             # Create a new sketch.
             des = adsk.fusion.Design.cast(_app.activeProduct)
@@ -983,52 +1108,8 @@ class FlowerDesignCommandExecutePreviewHandler(adsk.core.CommandEventHandler):
             values = {'petalSides': str(petalSides), 'petalSize': str(int(petalSizeRatio * 100)), 'petalYPos' : str(int(petalXCenterRatio * 100)) , 'petalXPos' : str(int(petalYCenterRatio * 100)), 'petalCount' : str(petalCount), 'petalXOffset' : str(int(petalXPosRatio * 100)), 'petalYOffset' : str(int(petalYPosRatio * 100))}
             des.attributes.add('adsk-Stool', 'FlowerDefaults', str(values))
          
-             # Create the initial polygon where the starting "point" is at (0,0).
-            polys = []
-            poly = []
-            for i in range(0, petalSides):
-                angle = i * ((math.pi*2)/petalSides)
-                x = (petalSize * math.cos(angle)) - petalSize + yPetalCenterOffset
-                y = (petalSize * math.sin(angle)) + xPetalCenterOffset
-                poly.append(adsk.core.Point3D.create(x, y, 0))
-            polys.append(poly)
-            
-            # Create the rotated copies.
-            for i in range(1, petalCount):
-                angle = i * ((math.pi*2)/petalCount)
-                mat = adsk.core.Matrix3D.create()
-                mat.setToRotation(angle, adsk.core.Vector3D.create(0,0,1), adsk.core.Point3D.create(0,0,0))
-                poly = []        
-                for j in range(0, petalSides):
-                    pnt = adsk.core.Point3D.cast(polys[0][j]).copy()
-                    pnt.transformBy(mat)
-                    pnt.x += xOffset
-                    pnt.y += yOffset
-                    poly.append(pnt)
-                    
-                polys.append(poly)
-    
-            # Reposition the initial polygon.
-            for i in range(0, petalSides):
-                polys[0][i].x += xOffset
-                polys[0][i].y += yOffset
-        
-            lines = adsk.fusion.SketchLines.cast(sk.sketchCurves.sketchLines)
-            for i in range(0, petalCount):
-                poly = polys[i]
-        
-                startLine = None
-                lastLine = None
-                for j in range(1, petalSides):
-                    if not lastLine:
-                        lastLine = lines.addByTwoPoints(poly[j-1], poly[j])
-                    else:
-                        lastLine = lines.addByTwoPoints(lastLine.endSketchPoint, poly[j])
-                        
-                    if not startLine:
-                        startLine = lastLine
-                        
-                lines.addByTwoPoints(lastLine.endSketchPoint, startLine.startSketchPoint)
+            drawDesign(sk, design)
+            sk.isComputeDeferred = False
         except:
             if _ui:
                 _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
@@ -1046,14 +1127,12 @@ class CirclesDesignCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
             cmd = eventArgs.command
     
             # Connect to the execute preview event.
-            onExecutePreview = CirclesDesignCommandExecutePreviewHandler()
-            cmd.executePreview.add(onExecutePreview)
-            _handlers.append(onExecutePreview)        
+            connectDesignCommand(cmd, CirclesDesignCommandExecutePreviewHandler)
     
             # Create the command inputs.        
             inputs = cmd.commandInputs
             
-            numCirclesIntSliderInput = inputs.addIntegerSliderCommandInput('numCircles', 'Max number', 1, 30, False)
+            numCirclesIntSliderInput = inputs.addIntegerSliderCommandInput('numCircles', 'Max number', 1, _maxCircles, False)
             numCirclesIntSliderInput.valueOne = 10
 
             des = adsk.fusion.Design.cast(_app.activeProduct)
@@ -1071,6 +1150,8 @@ class CirclesDesignCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
             overlap = inputs.addBoolValueInput('allowOverlap', 'Allow overlap', True, '', False)
             
             regen = inputs.addBoolValueInput('regen', 'Randomize', False, 'resources/regen', False)
+
+            placed = inputs.addTextBoxCommandInput('placed', 'Placed', '', 1, True)
         except:
             if _ui:
                 _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
@@ -1078,13 +1159,13 @@ class CirclesDesignCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
         
 # Event handler for the execute preview event.
 class CirclesDesignCommandExecutePreviewHandler(adsk.core.CommandEventHandler):
-    def __init__(self):
+    def __init__(self, isPreview = True):
         super().__init__()
+        self.isPreview = isPreview
     def notify(self, args):
         sk = None
         try:
             eventArgs = adsk.core.CommandEventArgs.cast(args)
-            eventArgs.isValidResult = True
             
             # Get the current values from the dialog.
             inputs = eventArgs.command.commandInputs
@@ -1100,6 +1181,12 @@ class CirclesDesignCommandExecutePreviewHandler(adsk.core.CommandEventHandler):
             borderWidth = inputs.itemById('borderSize').value
             
             allowOverlap = inputs.itemById('allowOverlap').value
+
+            # The circles are placed using a grid so it stays fast with hundreds of circles.
+            design = getDesign(eventArgs, self.isPreview, 'circles', count = numCircles, max_diameter = maxDia, min_diameter = _minSize,
+                               width = _seatWidth, height = _seatHeight, border = borderWidth, allow_overlap = allowOverlap)
+            if design is None:
+                return
         
             # Create a new sketch.
             des = adsk.fusion.Design.cast(_app.activeProduct)
@@ -1111,43 +1198,8 @@ class CirclesDesignCommandExecutePreviewHandler(adsk.core.CommandEventHandler):
             # Save the width to use as the default for all stool commands.
             des.attributes.add('adsk-Stool', 'BorderWidth', str(borderWidth))
             
-            circs = sk.sketchCurves.sketchCircles
-    
-            random.seed()
-        
-            circles = []
-            for i in range(0, numCircles):
-                isOk = False
-                tryCount = 0
-                while not isOk:
-                    if tryCount > 50:
-                        isOk = True
-                    else:
-                        tryCount += 1
-                        newDia = random.random() * (maxDia - _minSize) + _minSize
-                
-                        x = (random.random() * (_seatWidth - newDia - (borderWidth*2))) + borderWidth + (newDia/2.0)
-                        y = (random.random() * (_seatHeight - newDia - (borderWidth*2))) + borderWidth + (newDia/2.0)
-                    
-                        if not allowOverlap:
-                            center = adsk.core.Point3D.create(x,y,0)
-                            
-                            overlap = False
-                            for circ in circles:
-                                if circ.center.distanceTo(center) <= circ.radius + (newDia/2) + borderWidth:
-                                    overlap = True
-                                    break
-                                    
-                            if not overlap:
-                                isOk = True
-                        else:
-                            isOk = True
-        
-                if tryCount <= 50:
-                    skCircle = circs.addByCenterRadius(adsk.core.Point3D.create(x,y,0), newDia/2)
-                    circles.append(skCircle.geometry)
-                else:
-                    break                       
+            drawDesign(sk, design)
+            inputs.itemById('placed').text = '{} of {}'.format(len(design.geometry), numCircles)
             sk.isComputeDeferred = False
         except:
             if sk:
@@ -1168,14 +1220,12 @@ class RectanglesDesignCommandCreatedHandler(adsk.core.CommandCreatedEventHandler
             cmd = eventArgs.command
     
             # Connect to the execute preview event.
-            onExecutePreview = RectanglesDesignCommandExecutePreviewHandler()
-            cmd.executePreview.add(onExecutePreview)
-            _handlers.append(onExecutePreview)        
+            connectDesignCommand(cmd, RectanglesDesignCommandExecutePreviewHandler)
     
             # Create the command inputs.        
             inputs = cmd.commandInputs
             
-            numCirclesIntSliderInput = inputs.addIntegerSliderCommandInput('numRectangles', 'Max number', 1, 20, False)
+            numCirclesIntSliderInput = inputs.addIntegerSliderCommandInput('numRectangles', 'Max number', 1, _maxRectangles, False)
             numCirclesIntSliderInput.valueOne = 10
             
             des = adsk.fusion.Design.cast(_app.activeProduct)
@@ -1189,6 +1239,8 @@ class RectanglesDesignCommandCreatedHandler(adsk.core.CommandCreatedEventHandler
             overlap = inputs.addBoolValueInput('allowOverlap', 'Allow overlap', True, '', False)
            
             regen = inputs.addBoolValueInput('regen', 'Randomize', False, 'resources/regen', False)
+
+            placed = inputs.addTextBoxCommandInput('placed', 'Placed', '', 1, True)
         except:
             if _ui:
                 _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
@@ -1196,13 +1248,13 @@ class RectanglesDesignCommandCreatedHandler(adsk.core.CommandCreatedEventHandler
         
 # Event handler for the execute preview event.
 class RectanglesDesignCommandExecutePreviewHandler(adsk.core.CommandEventHandler):
-    def __init__(self):
+    def __init__(self, isPreview = True):
         super().__init__()
+        self.isPreview = isPreview
     def notify(self, args):
         sk = None
         try:
             eventArgs = adsk.core.CommandEventArgs.cast(args)
-            eventArgs.isValidResult = True
             
             # Get the current values from the dialog.
             inputs = eventArgs.command.commandInputs
@@ -1212,6 +1264,13 @@ class RectanglesDesignCommandExecutePreviewHandler(adsk.core.CommandEventHandler
             borderWidth = inputs.itemById('borderSize').value
 
             allowOverlap = inputs.itemById('allowOverlap').value
+
+            # The rectangles are placed using a grid.  This always finishes, even when
+            # there isn't room for all of them.
+            design = getDesign(eventArgs, self.isPreview, 'rectangles', count = numRectangles, min_size = _minSize, max_width = _seatWidth / 4,
+                               max_height = _seatHeight / 2, width = _seatWidth, height = _seatHeight, border = borderWidth, allow_overlap = allowOverlap)
+            if design is None:
+                return
         
             # Create a new sketch.
             des = adsk.fusion.Design.cast(_app.activeProduct)
@@ -1223,41 +1282,8 @@ class RectanglesDesignCommandExecutePreviewHandler(adsk.core.CommandEventHandler
             # Save the width to use as the default for all stool commands.
             des.attributes.add('adsk-Stool', 'BorderWidth', str(borderWidth))
             
-            lines = sk.sketchCurves.sketchLines
-    
-            random.seed()
-    
-            rects = []
-            for i in range(0, numRectangles):
-                isOk = False
-                while not isOk:
-                    newWidth = random.random() * (_seatWidth / 4)
-                    if newWidth < _minSize:
-                        newWidth = _minSize
-                            
-                    newHeight = random.random() * (_seatHeight / 2)
-                    if newHeight < _minSize:
-                        newHeight = _minSize
-        
-                    x = (random.random() * (_seatWidth - newWidth - (borderWidth*2))) + borderWidth
-                    y = (random.random() * (_seatHeight - newHeight - (borderWidth*2))) + borderWidth
-        
-                    if not allowOverlap:
-                        newRect = adsk.core.BoundingBox2D.create(adsk.core.Point2D.create(x,y), adsk.core.Point2D.create(x+newWidth, y+newHeight))
-                        
-                        overlap = False
-                        for rect in rects:
-                            if newRect.intersects(rect):
-                                overlap = True
-                                break
-                                
-                        if not overlap:
-                            rects.append(newRect)
-                            isOk = True
-                    else:
-                        isOk = True
-                    
-                lines.addTwoPointRectangle(adsk.core.Point3D.create(x,y,0), adsk.core.Point3D.create(x+newWidth, y+newHeight, 0))
+            drawDesign(sk, design)
+            inputs.itemById('placed').text = '{} of {}'.format(len(design.geometry), numRectangles)
 
             sk.isComputeDeferred = False
         except:
@@ -1270,7 +1296,20 @@ class RectanglesDesignCommandExecutePreviewHandler(adsk.core.CommandEventHandler
 #***************** Main add-in functionality **********************************
 
 def run(context):
+    global _previewThrottle
     try:
+        if _profileAdsk:
+            startProfiling()
+
+        # Redraw the previews that were skipped while a slider was dragged.
+        if _previewInterval > 0:
+            from .Modules import designs
+            _previewThrottle = designs.PreviewThrottle(_previewInterval)
+            previewEvent = _app.registerCustomEvent(_previewEventId)
+            onPreviewEvent = DesignPreviewEventHandler()
+            previewEvent.add(onPreviewEvent)
+            _handlers.append(onPreviewEvent)
+
         # Create the command definitions and connect to the command created event.
         newSeatCmdDef = _ui.commandDefinitions.addButtonDefinition('adsk-NewSeat', 'New Seat', 'Create a new seat design.', 'resources/NewSeat')
         newSeatCmdDef.toolClipFilename = 'resources/newStoolToolclip.png'
@@ -1352,6 +1391,7 @@ def run(context):
 
 
 def stop(context):
+    global _previewThrottle, _pendingPreview, _toolCache
     try:
         # Clean up the UI.
         seatPanel = _ui.allToolbarPanels.itemById('adsk-SeatPanel')
@@ -1389,6 +1429,39 @@ def stop(context):
 #        patternedPolygonDesignCmdDef = _ui.commandDefinitions.itemById('adsk-PatternedPolygonDesign')
 #        if patternedPolygonDesignCmdDef:
 #            patternedPolygonDesignCmdDef.deleteMe()
+
+        if _previewThrottle:
+            _previewThrottle.cancel()
+            _previewThrottle = None
+            _pendingPreview = None
+            _app.unregisterCustomEvent(_previewEventId)
+
+        if _toolCache:
+            _toolCache.stop()
+            _toolCache = None
+
+        if _profiler:
+            stopProfiling()
     except:
         if _ui:
             _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+
+
+# Replace adsk, _app and _ui with proxies that count and time every Fusion API
+# call, attributed to the handler that made it.  The report is rewritten in the
+# temp folder each time a handler finishes.
+def startProfiling():
+    global _profiler
+    import os, tempfile
+    from .Modules import adskprofile
+
+    handlerClasses = [value for (name, value) in list(globals().items()) if name.endswith('Handler') and isinstance(value, type)]
+    _profiler = adskprofile.Profiler(os.path.join(tempfile.gettempdir(), 'StoolDesign', 'adsk-profile.txt'))
+    _profiler.install(globals(), handlerClasses)
+
+
+# Put back the real adsk objects and write the final report.
+def stopProfiling():
+    global _profiler
+    _profiler.uninstall()
+    _profiler = None
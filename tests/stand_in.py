@@ -0,0 +1,149 @@
+'''
+A stand-in FabMo tool served by asyncio, for the tests of Modules.fabmo and Modules.fabmo_async.
+The asyncio client can serve it in its own event loop, and ServedTool serves it on a thread
+for the blocking client.
+'''
+import asyncio
+import json
+import threading
+
+class StandInTool:
+    '''
+    Answers the FabMo requests the client makes.  Every request is kept in requests as
+    (method, path, headers, body).  A job is pending for its first polls polls.  When drop_next
+    is set, the next request is read and its connection closed without an answer.  When
+    close_idle is set, the connection is closed after each answer without telling the client,
+    like a tool closing idle connections.  When cut_body is set, the next request's connection
+    is closed once its headers and part of its body have been read, and its body is kept as None.
+    '''
+    def __init__(self, status_delay=0.0, polls=2, tools=()):
+        self.status_delay = status_delay
+        self.polls = polls
+        self.tools = tools
+        self.requests = []
+        self.jobs = {}
+        self.connections = 0
+        self.drop_next = False
+        self.close_idle = False
+        self.cut_body = False
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.serve, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def serve(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                (method, path, version) = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode('latin-1').strip()
+                    if not line:
+                        break
+                    (name, value) = line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+                if self.cut_body:
+                    # Close the connection partway through the body, which resets it.
+                    self.cut_body = False
+                    await reader.read(1024)
+                    self.requests.append((method, path, headers, None))
+                    break
+                body = await self.read_body(reader, headers)
+                self.requests.append((method, path, headers, body))
+                if self.drop_next:
+                    # Close the connection after getting the request, without answering it.
+                    self.drop_next = False
+                    break
+                (status, extra, data) = await self.answer(method, path, body)
+                head = ['HTTP/1.1 {} OK'.format(status)] + ['{}: {}'.format(name, value) for (name, value) in extra]
+                if data is not None and ('Connection', 'close') not in extra:
+                    head.append('Content-Length: {}'.format(len(data)))
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + (data or b''))
+                await writer.drain()
+                if ('Connection', 'close') in extra or self.close_idle:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_body(self, reader, headers):
+        if headers.get('transfer-encoding') == 'chunked':
+            parts = []
+            while True:
+                size = int((await reader.readline()).strip(), 16)
+                if size == 0:
+                    await reader.readline()
+                    return b''.join(parts)
+                parts.append(await reader.readexactly(size))
+                await reader.readline()
+        return await reader.readexactly(int(headers.get('content-length', 0)))
+
+    async def answer(self, method, path, body):
+        if path == '/where_is_my_tool':
+            return (200, [], _json(list(self.tools)))
+        if path == '/status':
+            await asyncio.sleep(self.status_delay)
+            return (200, [], _json({'status': 'success', 'data': {'status': {'state': 'idle'}}}))
+        if path == '/empty':
+            return (204, [], None)
+        if path == '/closing':
+            return (200, [('Connection', 'close')], b'"closed"')
+        if method == 'POST' and path == '/job':
+            if body.startswith(b'{'):
+                return (200, [], _json({'status': 'success', 'data': {'key': 'upload-key'}}))
+            job_id = len(self.jobs) + 1
+            self.jobs[job_id] = 0
+            return (200, [], _json({'status': 'success', 'data': {'data': {'jobs': [{'_id': job_id, 'state': 'pending'}]}}}))
+        if method == 'GET' and path.startswith('/job/'):
+            job_id = int(path.split('/')[-1])
+            self.jobs[job_id] += 1
+            state = 'finished' if self.jobs[job_id] > self.polls else 'pending'
+            return (200, [], _json({'status': 'success', 'data': {'job': {'_id': job_id, 'state': state}}}))
+        return (404, [], _json({'status': 'error', 'message': 'Not found'}))
+
+    def uploads(self):
+        return [body for (method, path, headers, body) in self.requests if method == 'POST' and body and not body.startswith(b'{')]
+
+    def count(self, method, path=None):
+        return len([request for request in self.requests if request[0] == method and path in (None, request[1])])
+
+class ServedTool:
+    '''
+    A StandInTool served by an event loop on its own thread, for blocking clients.
+    '''
+    def __init__(self, **options):
+        self.tool = StandInTool(**options)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.port = self.call(self.tool.start())
+
+    def call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def stop(self):
+        self.call(self._shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    async def _shutdown(self):
+        # Connections still being answered are cancelled so they close before the loop does.
+        await self.tool.stop()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def _json(value):
+    return json.dumps(value).encode('utf-8')
@@ -0,0 +1,114 @@
+'''
+Tests for Modules.arcfit, checking the fitted moves against the points they replace and
+the arcs the reference interpreter reads back from the g-code.
+'''
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules import arcfit, gcode, interpreter
+
+ARC_TOLERANCE = 0.00254
+STROKE_TOLERANCE = 0.005
+
+def stroke_arc(center, radius, start_angle, end_angle, tolerance=STROKE_TOLERANCE):
+    # Points along an arc, as close together as stroking it within tolerance would put them.
+    step = 2 * math.acos(1 - tolerance / radius)
+    count = max(int(math.ceil(abs(end_angle - start_angle) / step)), 1)
+    return [(center[0] + radius * math.cos(start_angle + (end_angle - start_angle) * index / count),
+             center[1] + radius * math.sin(start_angle + (end_angle - start_angle) * index / count)) for index in range(count + 1)]
+
+def sweep(start, end, center, ccw):
+    # The angle an arc turns through from start to end, in its direction.
+    angle = math.atan2(end[1] - center[1], end[0] - center[0]) - math.atan2(start[1] - center[1], start[0] - center[0])
+    return (angle if ccw else -angle) % (2 * math.pi)
+
+def segment_distance(point, a, b):
+    (dx, dy) = (b[0] - a[0], b[1] - a[1])
+    length = dx * dx + dy * dy
+    t = 0.0 if length == 0 else max(0.0, min(1.0, ((point[0] - a[0]) * dx + (point[1] - a[1]) * dy) / length))
+    return math.hypot(point[0] - (a[0] + t * dx), point[1] - (a[1] + t * dy))
+
+def assert_points_on_moves(points, moves, tolerance):
+    # Each move ends on one of the points, and the points in between are within tolerance of it.
+    assert moves[0] == points[0]
+    index = 0
+    start = points[0]
+    for move in moves[1:]:
+        end = index + 1
+        while points[end][:2] != move[:2]:
+            end += 1
+        for point in points[index+1:end]:
+            if len(move) == 2:
+                assert segment_distance(point, start, move) <= tolerance
+            else:
+                center = (start[0] + move[2], start[1] + move[3])
+                radius = math.hypot(move[2], move[3])
+                assert abs(math.hypot(point[0] - center[0], point[1] - center[1]) - radius) <= tolerance
+                assert sweep(start, point, center, move[4]) <= sweep(start, move, center, move[4])
+        (index, start) = (end, points[end])
+    assert index == len(points) - 1
+
+def test_stroked_arc_becomes_one_arc():
+    points = stroke_arc((3.0, 4.0), 2.0, 0.1, 2.5)
+    moves = arcfit.fit_arcs(points, ARC_TOLERANCE, STROKE_TOLERANCE)
+    assert len(moves) == 2
+    (x, y, i, j, ccw) = moves[1]
+    assert ccw
+    assert (x, y) == points[-1]
+    # I and J are the center relative to the start of the arc, not to the origin.
+    assert math.hypot(points[0][0] + i - 3.0, points[0][1] + j - 4.0) < ARC_TOLERANCE
+    assert_points_on_moves(points, moves, ARC_TOLERANCE)
+
+def test_clockwise_arc():
+    points = stroke_arc((-1.0, 2.0), 5.0, 1.5, -1.0)
+    moves = arcfit.fit_arcs(points, ARC_TOLERANCE, STROKE_TOLERANCE)
+    assert len(moves) == 2
+    assert not moves[1][4]
+    assert_points_on_moves(points, moves, ARC_TOLERANCE)
+
+def test_lines_and_arcs():
+    # A slot: two straight sides joined by half circles, with extra points along the sides.
+    points = [(float(x), 0.0) for x in range(5)]
+    points += stroke_arc((4.0, 1.0), 1.0, -math.pi / 2, math.pi / 2)[1:]
+    points += [(float(x), 2.0) for x in range(3, -1, -1)]
+    points += stroke_arc((0.0, 1.0), 1.0, math.pi / 2, 3 * math.pi / 2)[1:]
+    moves = arcfit.fit_arcs(points, ARC_TOLERANCE, STROKE_TOLERANCE)
+    assert [len(move) for move in moves].count(5) == 2
+    assert len(moves) == 1 + 4 + 1 + 4 + 1
+    assert_points_on_moves(points, moves, ARC_TOLERANCE)
+
+def test_points_off_the_arc_are_kept():
+    points = stroke_arc((0.0, 0.0), 2.0, 0.0, 1.5)
+    middle = len(points) // 2
+    points[middle] = (points[middle][0] * 1.01, points[middle][1] * 1.01)
+    moves = arcfit.fit_arcs(points, ARC_TOLERANCE, STROKE_TOLERANCE)
+    assert points[middle] in moves
+    assert_points_on_moves(points, moves, ARC_TOLERANCE)
+
+def test_polygon_corners_on_a_circle_stay_lines():
+    hexagon = [(math.cos(index * math.pi / 3), math.sin(index * math.pi / 3)) for index in range(7)]
+    assert arcfit.fit_arcs(hexagon, ARC_TOLERANCE, STROKE_TOLERANCE) == hexagon
+
+def test_full_circle_is_two_half_circles():
+    points = stroke_arc((1.0, 1.0), 0.5, 0.0, 2 * math.pi)
+    moves = arcfit.circle_moves(points, (1.0, 1.0))
+    assert moves[0] == points[0]
+    assert [move[:2] for move in moves[1:]] == [(0.5, 1.0), points[0]]
+    for (start, move) in zip(moves, moves[1:]):
+        assert math.isclose(start[0] + move[2], 1.0) and math.isclose(start[1] + move[3], 1.0)
+        assert move[4]
+
+def test_gcode_arcs_have_the_fitted_centers():
+    # The interpreter adds I and J to the start of each arc, which has to give the real center.
+    points = stroke_arc((3.0, 4.0), 2.0, 0.1, 2.5) + stroke_arc((3.0, 8.0), 2.0, -0.1, -2.5)
+    points = [(round(x, 6), round(y, 6)) for (x, y) in points]
+    moves = arcfit.fit_arcs(points, ARC_TOLERANCE, STROKE_TOLERANCE)
+    arcs = [move for move in interpreter.Interpreter().run(gcode.iter_program([moves], [-0.1], 0.5)) if isinstance(move, interpreter.Move) and move.center]
+    assert [move.mode for move in arcs] == [3, 2]
+    for (move, center) in zip(arcs, [(3.0, 4.0), (3.0, 8.0)]):
+        assert math.hypot(move.center[0] * 2.54 - center[0], move.center[1] * 2.54 - center[1]) < ARC_TOLERANCE
+        radius = math.hypot(move.start[0] - move.center[0], move.start[1] - move.center[1])
+        assert abs(math.hypot(move.end[0] - move.center[0], move.end[1] - move.center[1]) - radius) < 0.0002
@@ -0,0 +1,78 @@
+'''
+Tests for Modules.cache, including what happens when an entry can't be written.
+'''
+import errno
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules import cache
+
+class FullDisk(io.StringIO):
+    # A temporary file that fails once limit characters have been written to it.
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+
+    def write(self, text):
+        if self.tell() + len(text) > self.limit:
+            raise OSError(errno.ENOSPC, 'No space left on device')
+        return super().write(text)
+
+def test_entry_is_stored_and_read(tmp_path):
+    gcode_cache = cache.GCodeCache(str(tmp_path / 'gcode'))
+    out = io.StringIO()
+    entry = gcode_cache.writer('key', out)
+    entry.write('G0 X1\n')
+    entry.write('G1 Z-0.1\n')
+    entry.finish({'retracts': 1})
+    assert out.getvalue() == 'G0 X1\nG1 Z-0.1\n'
+    assert gcode_cache.get('key') == ('G0 X1\nG1 Z-0.1\n', {'retracts': 1})
+    assert sorted(os.listdir(str(tmp_path / 'gcode'))) == ['key.json', 'key.nc']
+
+def test_least_recently_used_entries_are_removed(tmp_path):
+    gcode_cache = cache.GCodeCache(str(tmp_path), max_entries=3)
+    for (key, when) in [('a', 100), ('b', 300), ('c', 200)]:
+        gcode_cache.put(key, key)
+        os.utime(str(tmp_path / (key + '.json')), (when, when))
+    gcode_cache.get('a')
+    gcode_cache.put('d', 'd')
+    assert gcode_cache.get('c') is None
+    assert [gcode_cache.get(key)[0] for key in 'abd'] == ['a', 'b', 'd']
+
+def test_full_disk_still_writes_out(tmp_path):
+    gcode_cache = cache.GCodeCache(str(tmp_path))
+    out = io.StringIO()
+    entry = gcode_cache.writer('key', out)
+    entry.fp.close()
+    entry.fp = FullDisk(10)
+    for line in ['G0 X1\n', 'G1 Z-0.1\n', 'G1 X2\n']:
+        assert entry.write(line) == len(line)
+    assert out.getvalue() == 'G0 X1\nG1 Z-0.1\nG1 X2\n'
+    with pytest.raises(OSError) as raised:
+        entry.finish({})
+    assert raised.value.errno == errno.ENOSPC
+    assert os.listdir(str(tmp_path)) == []
+    assert gcode_cache.get('key') is None
+
+def test_failed_finish_leaves_nothing(tmp_path, monkeypatch):
+    gcode_cache = cache.GCodeCache(str(tmp_path))
+    entry = gcode_cache.writer('key')
+    entry.write('G0 X1\n')
+    def unwritable(value, fp):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+    monkeypatch.setattr(cache.json, 'dump', unwritable)
+    with pytest.raises(OSError):
+        entry.finish({})
+    assert os.listdir(str(tmp_path)) == []
+    entry.discard()
+
+def test_key_changes_with_each_part():
+    key = cache.make_key([['cut', None]], {'depth': 0.1})
+    assert key == cache.make_key([['cut', None]], {'depth': 0.1})
+    assert key != cache.make_key([['cut', None]], {'depth': 0.2})
+    assert key != cache.make_key([['cut', 'spec']], {'depth': 0.1})
@@ -0,0 +1,247 @@
+'''
+Tests for Modules.fabmo against the stand-in FabMo tool of stand_in.py, served on a thread.
+'''
+import http.client
+import io
+import json
+import os
+import socket
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules import fabmo
+
+from stand_in import ServedTool
+
+@pytest.fixture
+def served():
+    # A factory, so each test can give the stand-in tool its options.
+    tools = []
+    def serve(**options):
+        tools.append(ServedTool(**options))
+        return tools[-1]
+    yield serve
+    for tool in tools:
+        tool.stop()
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5.0
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_idle_connection_is_kept(served):
+    stand_in = served()
+    pool = fabmo.ConnectionPool('127.0.0.1', stand_in.port)
+    for index in range(3):
+        (status, data) = pool.request('GET', '/status')
+        assert status == 200
+    assert stand_in.tool.connections == 1
+    assert len(pool._idle) == 1
+    pool.close()
+
+def test_connection_closed_by_the_tool_is_not_used(served):
+    stand_in = served()
+    pool = fabmo.ConnectionPool('127.0.0.1', stand_in.port)
+    stand_in.tool.close_idle = True
+    pool.request('GET', '/status')
+    assert wait_for(lambda: fabmo.select.select([pool._idle[0].sock], [], [], 0)[0])
+
+    # The closed connection is seen before the request is sent, so even a POST goes through once.
+    stand_in.tool.close_idle = False
+    (status, data) = pool.request('POST', '/job', b'{}')
+    assert status == 200
+    assert stand_in.tool.count('POST') == 1
+    assert stand_in.tool.connections == 2
+    pool.close()
+
+def test_post_on_a_connection_closed_unseen_is_not_sent_again(served, monkeypatch):
+    # Without the check the POST goes out on the closed connection, and isn't sent again.
+    stand_in = served()
+    pool = fabmo.ConnectionPool('127.0.0.1', stand_in.port)
+    stand_in.tool.close_idle = True
+    pool.request('GET', '/status')
+    assert wait_for(lambda: fabmo.select.select([pool._idle[0].sock], [], [], 0)[0])
+    monkeypatch.setattr(fabmo.select, 'select', lambda read, write, error, timeout: ([], [], []))
+    with pytest.raises((http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)):
+        pool.request('POST', '/job', b'{}')
+    assert stand_in.tool.count('POST') == 0
+    assert stand_in.tool.connections == 1
+    pool.close()
+
+def test_only_idempotent_requests_are_sent_again(served):
+    stand_in = served()
+    pool = fabmo.ConnectionPool('127.0.0.1', stand_in.port)
+    pool.request('GET', '/status')
+    stand_in.tool.drop_next = True
+    (status, data) = pool.request('GET', '/status')
+    assert status == 200
+    assert stand_in.tool.count('GET', '/status') == 3
+
+    stand_in.tool.drop_next = True
+    with pytest.raises((http.client.RemoteDisconnected, ConnectionResetError)):
+        pool.request('POST', '/job', b'{}')
+    assert stand_in.tool.count('POST') == 1
+    pool.close()
+
+def test_post_is_not_sent_again_after_part_of_it_was_sent(served):
+    # The tool resets the connection partway through a large body.
+    stand_in = served()
+    pool = fabmo.ConnectionPool('127.0.0.1', stand_in.port)
+    pool.request('GET', '/status')
+    stand_in.tool.cut_body = True
+    with pytest.raises((ConnectionResetError, BrokenPipeError)):
+        pool.request('POST', '/job', b'G0 X1 Y2\n' * 4000000)
+    assert stand_in.tool.count('POST') == 1
+    assert stand_in.tool.requests[-1][3] is None
+    assert stand_in.tool.connections == 1
+    pool.close()
+
+def test_get_is_sent_again_after_part_of_it_was_sent(served):
+    stand_in = served()
+    pool = fabmo.ConnectionPool('127.0.0.1', stand_in.port)
+    pool.request('GET', '/status')
+    stand_in.tool.cut_body = True
+    (status, data) = pool.request('GET', '/status', b'x' * 32000000)
+    assert status == 200
+    assert stand_in.tool.count('GET', '/status') == 3
+    pool.close()
+
+def test_iterator_goes_on_a_new_connection(served):
+    stand_in = served()
+    pool = fabmo.ConnectionPool('127.0.0.1', stand_in.port)
+    pool.request('GET', '/status')
+    (status, data) = pool.request('POST', '/job', iter([b'G0 X1\n'] * 10))
+    assert status == 200
+    assert stand_in.tool.connections == 2
+    assert stand_in.tool.requests[-1][2]['transfer-encoding'] == 'chunked'
+    assert stand_in.tool.requests[-1][3] == b'G0 X1\n' * 10
+    pool.close()
+
+def test_read_timeout(served):
+    stand_in = served(status_delay=1.0)
+    tool = fabmo.FabMoTool('127.0.0.1', stand_in.port, read_timeout=0.1)
+    start = time.perf_counter()
+    with pytest.raises(Exception, match='did not answer in time'):
+        tool.get_status()
+    assert time.perf_counter() - start < 0.5
+    tool.close()
+
+def test_connect_timeout(monkeypatch):
+    timeouts = []
+    def never_connects(address, timeout=None, source_address=None):
+        timeouts.append(timeout)
+        raise socket.timeout('timed out')
+    monkeypatch.setattr(fabmo.http.client.socket, 'create_connection', never_connects)
+    tool = fabmo.FabMoTool('127.0.0.1', 9, connect_timeout=0.1)
+    with pytest.raises(Exception, match='did not answer in time'):
+        tool.get_status()
+    assert timeouts == [0.1]
+
+def test_kept_connection_waits_at_most_read_timeout(served):
+    stand_in = served()
+    pool = fabmo.ConnectionPool('127.0.0.1', stand_in.port, connect_timeout=5.0, read_timeout=0.1)
+    pool.request('GET', '/status')
+    assert pool._idle[0].sock.gettimeout() == 0.1
+    stand_in.tool.status_delay = 1.0
+    with pytest.raises(socket.timeout):
+        pool.request('GET', '/status')
+    pool.close()
+
+def test_submit_job(served):
+    stand_in = served()
+    tool = fabmo.FabMoTool('127.0.0.1', stand_in.port)
+    job = tool.submit_job('G0 X1 Y2\n' * 1000, 'seat.nc', 'Seat')
+    assert job == {'_id': 1, 'state': 'pending'}
+    assert json.loads(stand_in.tool.requests[0][3].decode('utf-8'))['files'][0]['name'] == 'Seat'
+    (method, path, headers, body) = stand_in.tool.requests[1]
+    assert int(headers['content-length']) == len(body)
+    assert stand_in.tool.connections == 1
+    tool.close()
+
+FIELDS = [('key', 'upload-key'), ('index', 0)]
+PROGRAM = 'G0 X1 Y2\nG1 Z-0.25 F30\n' * 500
+
+def streamed(encoder, source, chunk_size=64):
+    (content_type, length, body) = encoder.stream(FIELDS, [('file', 'seat.nc', source)], chunk_size)
+    assert content_type == encoder.content_type
+    return (length, body)
+
+@pytest.mark.parametrize('source', [PROGRAM, PROGRAM + 'M0 (Höhe 5 mm, 座)\n', PROGRAM.encode('utf-8')])
+def test_stream_matches_encode(source):
+    encoder = fabmo.MultipartFormdataEncoder()
+    (length, body) = streamed(encoder, source)
+    data = b''.join(body)
+    assert data == encoder.encode(FIELDS, [('file', 'seat.nc', source)])[1]
+    assert length == len(data)
+    # The body is read again each time it's iterated.
+    assert b''.join(body) == data
+
+@pytest.mark.parametrize('mode', ['r', 'rb'])
+def test_stream_of_a_file_matches_encode(tmp_path, mode):
+    path = tmp_path / 'seat.nc'
+    path.write_text(PROGRAM + 'M0 (Höhe 5 mm, 座)\n', encoding='utf-8')
+    encoder = fabmo.MultipartFormdataEncoder()
+    with open(path, mode, **({'encoding': 'utf-8'} if mode == 'r' else {})) as fp:
+        fp.read(9)
+        (length, body) = streamed(encoder, fp)
+        data = b''.join(body)
+        assert b''.join(body) == data
+    # The file is sent from where it was when the body was made.
+    with open(path, mode, **({'encoding': 'utf-8'} if mode == 'r' else {})) as fp:
+        fp.read(9)
+        assert data == encoder.encode(FIELDS, [('file', 'seat.nc', fp)])[1]
+    assert length == len(data)
+
+def test_stream_of_bytes_io_matches_encode():
+    encoder = fabmo.MultipartFormdataEncoder()
+    (length, body) = streamed(encoder, io.BytesIO(PROGRAM.encode('utf-8')))
+    data = b''.join(body)
+    assert b''.join(body) == data
+    assert data == encoder.encode(FIELDS, [('file', 'seat.nc', io.BytesIO(PROGRAM.encode('utf-8')))])[1]
+    assert length == len(data)
+
+def test_stream_of_an_iterator_has_no_length():
+    encoder = fabmo.MultipartFormdataEncoder()
+    lines = PROGRAM.splitlines(keepends=True)
+    (length, body) = streamed(encoder, iter(lines))
+    assert length is None
+    assert b''.join(body) == encoder.encode(FIELDS, [('file', 'seat.nc', lines)])[1]
+
+def test_stream_of_a_list_matches_encode():
+    encoder = fabmo.MultipartFormdataEncoder()
+    lines = PROGRAM.splitlines(keepends=True)
+    (length, body) = streamed(encoder, lines)
+    data = b''.join(body)
+    assert data == encoder.encode(FIELDS, [('file', 'seat.nc', lines)])[1]
+    assert length == len(data)
+
+@pytest.mark.parametrize('kind', ['str', 'bytes', 'file', 'bytes io'])
+def test_upload_length_is_the_bytes_sent(served, tmp_path, kind):
+    text = PROGRAM + 'M0 (Höhe 5 mm)\n'
+    path = tmp_path / 'seat.nc'
+    path.write_text(text, encoding='utf-8')
+    stand_in = served()
+    tool = fabmo.FabMoTool('127.0.0.1', stand_in.port)
+    with open(path, encoding='utf-8') as fp:
+        source = {'str': text, 'bytes': text.encode('utf-8'), 'file': fp, 'bytes io': io.BytesIO(text.encode('utf-8'))}[kind]
+        tool.submit_job(source, 'seat.nc')
+    (method, path, headers, body) = stand_in.tool.requests[1]
+    assert 'transfer-encoding' not in headers
+    assert int(headers['content-length']) == len(body)
+    assert text.encode('utf-8') in body
+    tool.close()
+
+def test_upload_of_an_iterator_is_chunked(served):
+    stand_in = served()
+    tool = fabmo.FabMoTool('127.0.0.1', stand_in.port)
+    tool.submit_job(iter(PROGRAM.splitlines(keepends=True)), 'seat.nc')
+    (method, path, headers, body) = stand_in.tool.requests[1]
+    assert headers['transfer-encoding'] == 'chunked'
+    assert 'content-length' not in headers
+    assert PROGRAM.encode('utf-8') in body
+    tool.close()
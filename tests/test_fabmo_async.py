@@ -0,0 +1,228 @@
+'''
+Tests for Modules.fabmo_async against a stand-in FabMo tool served by asyncio in the same
+event loop.  Run them from the add-in folder with
+    python -m pytest tests
+'''
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules import fabmo_async
+
+from stand_in import StandInTool
+
+CODES = 'G0 X1 Y2\n' * 20000 + '(done)\n'
+
+def run(test):
+    # Run a coroutine that takes a started stand-in tool and its port.
+    async def main():
+        tool = StandInTool(**test.options) if hasattr(test, 'options') else StandInTool()
+        port = await tool.start()
+        try:
+            await test(tool, port)
+        finally:
+            await tool.stop()
+    asyncio.run(main())
+
+def options(**values):
+    def wrap(test):
+        test.options = values
+        return test
+    return wrap
+
+def test_find_tools(monkeypatch):
+    @options(tools=[{'network': [{'ip_address': '127.0.0.1'}], 'server_port': 9000 + index, 'hostname': 'tool{}'.format(index)} for index in range(3)])
+    async def test(tool, port):
+        monkeypatch.setattr(fabmo_async, 'TOOL_MINDER', ('127.0.0.1', port))
+        tools = await fabmo_async.find_tools()
+        assert [(found.hostname, found.ip, found.port) for found in tools] == [('tool{}'.format(index), '127.0.0.1', 9000 + index) for index in range(3)]
+        assert all(isinstance(found, fabmo_async.AsyncFabMoTool) for found in tools)
+    run(test)
+
+def test_find_tools_without_tool_minder(monkeypatch):
+    async def test(tool, port):
+        await tool.stop()
+        monkeypatch.setattr(fabmo_async, 'TOOL_MINDER', ('127.0.0.1', port))
+        with pytest.raises(ConnectionRefusedError):
+            await fabmo_async.find_tools()
+        await tool.start()
+    run(test)
+
+def test_get_statuses_at_the_same_time():
+    @options(status_delay=0.2)
+    async def test(tool, port):
+        tools = [fabmo_async.AsyncFabMoTool('127.0.0.1', port) for index in range(8)]
+        start = time.perf_counter()
+        statuses = await fabmo_async.get_statuses(tools)
+        assert statuses == [{'state': 'idle'}] * 8
+        assert time.perf_counter() - start < 0.2 * 4
+        for client in tools:
+            await client.close()
+    run(test)
+
+def test_get_statuses_of_tool_not_answering():
+    async def test(tool, port):
+        await tool.stop()
+        statuses = await fabmo_async.get_statuses([fabmo_async.AsyncFabMoTool('127.0.0.1', port)])
+        assert isinstance(statuses[0], OSError)
+        await tool.start()
+    run(test)
+
+def test_connection_is_kept():
+    async def test(tool, port):
+        client = fabmo_async.AsyncFabMoTool('127.0.0.1', port)
+        for index in range(3):
+            await client.get_status()
+        assert tool.connections == 1
+        await client.close()
+    run(test)
+
+def test_submit_job_with_content_length():
+    async def test(tool, port):
+        client = fabmo_async.AsyncFabMoTool('127.0.0.1', port)
+        job = await client.submit_job(CODES, 'seat.nc', 'Seat', 'A test seat')
+        assert job == {'_id': 1, 'state': 'pending'}
+
+        metadata = json.loads(tool.requests[0][3].decode('utf-8'))
+        assert metadata['files'] == [{'filename': 'seat.nc', 'name': 'Seat', 'description': 'A test seat'}]
+        (method, path, headers, body) = tool.requests[1]
+        assert 'transfer-encoding' not in headers
+        assert int(headers['content-length']) == len(body)
+        assert b'name="key"\r\n\r\nupload-key\r\n' in body
+        assert CODES.encode('utf-8') in body
+        await client.close()
+    run(test)
+
+def test_submit_job_from_file():
+    async def test(tool, port):
+        client = fabmo_async.AsyncFabMoTool('127.0.0.1', port)
+        await client.submit_job(io.BytesIO(CODES.encode('utf-8')), 'seat.nc')
+        assert CODES.encode('utf-8') in tool.uploads()[0]
+        assert 'content-length' in tool.requests[1][2]
+        await client.close()
+    run(test)
+
+def test_submit_job_chunked():
+    async def test(tool, port):
+        client = fabmo_async.AsyncFabMoTool('127.0.0.1', port)
+        job = await client.submit_job(iter(CODES.splitlines(True)), 'seat.nc')
+        assert job['_id'] == 1
+        (method, path, headers, body) = tool.requests[1]
+        assert headers['transfer-encoding'] == 'chunked'
+        assert 'content-length' not in headers
+        assert CODES.encode('utf-8') in body
+        await client.close()
+    run(test)
+
+def test_submit_to_several_tools_at_once():
+    async def test(tool, port):
+        tools = [fabmo_async.AsyncFabMoTool('127.0.0.1', port) for index in range(3)]
+        jobs = await asyncio.gather(*[client.submit_job(CODES, 'seat.nc') for client in tools])
+        assert sorted(job['_id'] for job in jobs) == [1, 2, 3]
+        assert all(CODES.encode('utf-8') in body for body in tool.uploads())
+        for client in tools:
+            await client.close()
+    run(test)
+
+def test_wait_for_job():
+    @options(polls=2)
+    async def test(tool, port):
+        client = fabmo_async.AsyncFabMoTool('127.0.0.1', port)
+        job = await client.submit_job(CODES, 'seat.nc')
+        finished = await client.wait_for_job(job['_id'], interval=0.01)
+        assert finished == {'_id': job['_id'], 'state': 'finished'}
+        assert tool.jobs[job['_id']] == 3
+        await client.close()
+    run(test)
+
+def test_wait_for_job_timeout():
+    @options(polls=1000)
+    async def test(tool, port):
+        client = fabmo_async.AsyncFabMoTool('127.0.0.1', port)
+        job = await client.submit_job(CODES, 'seat.nc')
+        with pytest.raises(asyncio.TimeoutError):
+            await client.wait_for_job(job['_id'], interval=0.01, timeout=0.1)
+        await client.close()
+    run(test)
+
+def test_read_timeout():
+    @options(status_delay=1.0)
+    async def test(tool, port):
+        client = fabmo_async.AsyncFabMoTool('127.0.0.1', port, read_timeout=0.1)
+        start = time.perf_counter()
+        with pytest.raises(Exception, match='did not answer in time'):
+            await client.get_status()
+        assert time.perf_counter() - start < 0.5
+        await client.close()
+    run(test)
+
+def test_connect_timeout(monkeypatch):
+    async def never_connects(host, port):
+        await asyncio.sleep(10)
+    monkeypatch.setattr(fabmo_async.asyncio, 'open_connection', never_connects)
+    async def test():
+        client = fabmo_async.AsyncFabMoTool('127.0.0.1', 9, connect_timeout=0.1)
+        start = time.perf_counter()
+        with pytest.raises(Exception, match='did not answer in time'):
+            await client.get_status()
+        assert time.perf_counter() - start < 0.5
+    asyncio.run(test())
+
+def test_response_without_body_on_kept_connection():
+    async def test(tool, port):
+        pool = fabmo_async.AsyncConnectionPool('127.0.0.1', port, read_timeout=1.0)
+        start = time.perf_counter()
+        assert await pool.request('GET', '/empty') == (204, b'')
+        assert await pool.request('GET', '/closing') == (200, b'"closed"')
+        assert time.perf_counter() - start < 0.5
+        await pool.close()
+    run(test)
+
+def test_only_idempotent_requests_are_sent_again():
+    async def test(tool, port):
+        pool = fabmo_async.AsyncConnectionPool('127.0.0.1', port)
+        await pool.request('GET', '/status')
+        tool.drop_next = True
+        (status, data) = await pool.request('GET', '/status')
+        assert status == 200
+        assert [path for (method, path, headers, body) in tool.requests].count('/status') == 3
+
+        await pool.request('GET', '/status')
+        tool.drop_next = True
+        with pytest.raises(asyncio.IncompleteReadError):
+            await pool.request('POST', '/job', b'{}')
+        assert [method for (method, path, headers, body) in tool.requests].count('POST') == 1
+        await pool.close()
+    run(test)
+
+def test_error_status():
+    async def test(tool, port):
+        client = fabmo_async.AsyncFabMoTool('127.0.0.1', port)
+        with pytest.raises(Exception, match='Not found'):
+            await client.request('GET', '/missing')
+        await client.close()
+    run(test)
+
+def test_wait_for_job_timeout_when_a_request_ignores_cancelling():
+    # Before Python 3.12 a request finishing just as wait_for cancels it can swallow the cancel.
+    async def get_job(job_id):
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            pass
+        return {'_id': job_id, 'state': 'pending'}
+    async def test():
+        client = fabmo_async.AsyncFabMoTool('127.0.0.1', 9)
+        client.get_job = get_job
+        start = time.perf_counter()
+        with pytest.raises(asyncio.TimeoutError):
+            await client.wait_for_job(1, interval=0.01, timeout=0.1)
+        assert time.perf_counter() - start < 0.5
+    asyncio.run(test())
@@ -0,0 +1,58 @@
+'''
+Tests for Modules.fleet with stand-in tools that answer in memory.
+'''
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules import fleet
+
+class StandInTool:
+    '''
+    Takes every job it's sent, unless rejects is set, and always reports it's idle.
+    '''
+    def __init__(self, hostname, rejects=False):
+        self.hostname = hostname
+        self.rejects = rejects
+        self.jobs = []
+
+    def get_status(self):
+        return {'state': 'idle'}
+
+    def get_job(self, job_id):
+        return {'_id': job_id, 'state': 'finished'}
+
+    def submit_job(self, codes, filename=None, name=None, description=None):
+        if self.rejects:
+            raise Exception('The upload failed.')
+        self.jobs.append(codes)
+        return {'_id': len(self.jobs), 'state': 'pending'}
+
+def jobs(count):
+    return [fleet.SeatJob('seat {}'.format(index), estimated_seconds=count - index) for index in range(count)]
+
+def test_run_moves_jobs_a_tool_fails_to_take():
+    (rejecting, working) = (StandInTool('rejecting', rejects=True), StandInTool('working'))
+    tools = fleet.Fleet([rejecting, working])
+    tools.run(jobs(4), interval=0)
+    assert sorted(working.jobs) == ['seat 0', 'seat 1', 'seat 2', 'seat 3']
+    assert tools.pending() == 0
+
+def test_run_stops_when_every_tool_fails():
+    tools = fleet.Fleet([StandInTool('a', rejects=True), StandInTool('b', rejects=True)])
+    with pytest.raises(Exception, match='would take'):
+        tools.run(jobs(2), interval=0)
+    assert tools.pending() == 2
+
+def test_submit_falls_back_to_the_next_tool():
+    (rejecting, working) = (StandInTool('rejecting', rejects=True), StandInTool('working'))
+    queue = fleet.Fleet([rejecting, working]).submit(fleet.SeatJob('seat'))
+    assert queue.tool is working
+    assert working.jobs == ['seat']
+
+def test_submit_raises_when_every_tool_fails():
+    with pytest.raises(Exception, match='upload failed'):
+        fleet.Fleet([StandInTool('a', rejects=True)]).submit(fleet.SeatJob('seat'))
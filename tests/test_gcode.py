@@ -0,0 +1,145 @@
+'''
+Tests for Modules.gcode, comparing programs by the motion the reference interpreter reads
+from them rather than by their text.
+'''
+import collections
+import math
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules import gcode, interpreter
+
+DEPTHS = [-0.09, -0.1, -0.2]
+
+def square(x, y, size=1.0):
+    return [(x, y), (x + size, y), (x + size, y + size), (x, y + size), (x, y)]
+
+def circle(x, y, radius=0.5):
+    # A full circle as two half circles, the way arcfit.circle_moves writes it.
+    return [(x + radius, y), (x - radius, y, -radius, 0.0, True), (x + radius, y, radius, 0.0, True)]
+
+def paths():
+    # Closed squares and circles, open paths with repeated points, and an open path ending in an arc.
+    return [square(0, 0), circle(3, 0), [(5, 0), (6, 0), (6, 0), (6, 1), (7, 1)],
+            square(0, 3, 2), [(3, 3), (4, 3), (5, 4, 0.0, 1.0, True)], circle(6, 3, 1.0)]
+
+def programs():
+    yield ('layer', list(gcode.iter_program(paths(), DEPTHS, 0.5)))
+    yield ('contour', list(gcode.iter_program(paths(), DEPTHS, 0.5, depth_strategy='contour')))
+    yield ('ramp', list(gcode.iter_program(paths(), DEPTHS, 0.5, depth_strategy='contour', ramp=True)))
+
+@pytest.mark.parametrize('name,lines', list(programs()))
+def test_compacted_program_moves_the_same(name, lines):
+    compacted = list(gcode.iter_compact(lines))
+    assert interpreter.same_motion(lines, compacted)
+    assert len(''.join(compacted)) < len(''.join(lines))
+    # verify checks each line against the interpreter as it goes.
+    assert list(gcode.iter_compact(lines, verify=True)) == compacted
+
+@pytest.mark.parametrize('name,lines', list(programs()))
+def test_compacted_program_has_the_same_statistics(name, lines):
+    (original, compacted) = (interpreter.ProgramStats(), interpreter.ProgramStats())
+    list(interpreter.measure(lines, original))
+    list(interpreter.measure(gcode.iter_compact(lines), compacted))
+    assert (original.retracts, original.plunges, original.moves) == (compacted.retracts, compacted.plunges, compacted.moves)
+    assert math.isclose(original.cut_length, compacted.cut_length)
+    assert math.isclose(original.rapid_length, compacted.rapid_length)
+
+def test_repeated_words_are_dropped():
+    lines = ['g20\n', 'g1 f120\n', 'g0 z0.5\n', 'g0 x1.0000 y2.0000\n', 'g1 z-0.1\n', 'g1 x1.0000 y2.0000\n',
+             'g1 x1.0000 y3.0000\n', 'g1 x2.0000 y3.0000\n', 'g0 z0.5\n', 'g0 z0.5\n']
+    assert list(gcode.iter_compact(lines)) == ['g20\n', 'g1 f120\n', 'g0 z0.5\n', 'x1.0000 y2.0000\n', 'g1 z-0.1\n',
+                                              'y3.0000\n', 'x2.0000\n', 'g0 z0.5\n']
+
+def test_arcs_keep_their_words():
+    lines = ['g20\n', 'g1 f120\n', 'g0 x1 y0 z0.5\n', 'g1 z-0.1\n', 'g3 x-1 y0 i-1 j0\n', 'g3 x1 y0 i1 j0\n']
+    compacted = list(gcode.iter_compact(lines))
+    assert compacted[-2:] == ['g3 x-1 y0 i-1 j0\n', 'x1 y0 i1 j0\n']
+    assert interpreter.same_motion(lines, compacted)
+
+def test_lines_after_incremental_mode_are_kept():
+    lines = ['g20\n', 'g0 x1 y1 z0.5\n', 'g91\n', 'g0 x1 y1\n', 'g0 x1 y1\n', 'g90\n', 'g0 x3 y3\n']
+    compacted = list(gcode.iter_compact(lines))
+    assert compacted.count('g0 x1 y1\n') == 2
+    assert interpreter.same_motion(lines, compacted)
+
+def start():
+    return ['g20\n', 'g1 f120\n', 'g0 x1 y1 z0.5\n', 'g1 z-0.1\n', 'g1 x2 y1\n']
+
+def test_same_motion_finds_a_dropped_rapid():
+    # Without its g0 the move is cut at the feed rate, since g1 is still in effect.
+    assert not interpreter.same_motion(start() + ['g0 x3 y3\n'], start() + ['x3 y3\n'])
+
+def test_same_motion_finds_a_changed_feed():
+    assert not interpreter.same_motion(start() + ['g1 x3 y3\n'], start() + ['g1 x3 y3 f60\n'])
+
+def test_same_motion_finds_a_missing_z():
+    assert not interpreter.same_motion(start() + ['g0 z0.5\n', 'g0 x3 y3\n'], start() + ['g0 x3 y3\n'])
+
+def test_same_motion_finds_a_changed_arc_center():
+    assert not interpreter.same_motion(start() + ['g2 x3 y1 i0.5 j0\n'], start() + ['g2 x3 y1 i0.5 j0.5\n'])
+
+def test_same_motion_finds_a_missing_line():
+    assert not interpreter.same_motion(start() + ['m5\n'], start())
+    assert not interpreter.same_motion(start(), start() + ['g1 x2 y2\n'])
+
+def test_same_motion_ignores_moves_that_go_nowhere():
+    assert interpreter.same_motion(start() + ['g1 x2 y1\n', 'm5\n'], start() + ['m5\n'])
+
+def test_verify_finds_a_change_in_the_motion(monkeypatch):
+    # A compaction that doesn't see feed words drops them, which is caught at the first feed move.
+    monkeypatch.setattr(gcode, '_TOKEN', re.compile(r'([a-eg-zA-EG-Z])\s*([-+]?(?:\d+\.?\d*|\.\d+))'))
+    with pytest.raises(ValueError, match='line 4 changed the motion'):
+        list(gcode.iter_compact(start() + ['g1 x3 y3 f60\n'], verify=True))
+
+def grid_paths(count=120):
+    # A seat's worth of squares, circles and open paths on a grid.
+    shapes = []
+    for index in range(count):
+        (x, y) = (index % 12 * 1.5, index // 12 * 1.5)
+        shape = (square(x, y), circle(x + 0.5, y + 0.5), [(x, y), (x + 1, y + 0.5), (x, y + 1)])[index % 3]
+        shapes.append(shape)
+    return shapes
+
+def cuts(lines):
+    # The feed moves across the material at each depth, whichever way round they're cut.
+    found = []
+    for move in interpreter.Interpreter().run(lines):
+        if isinstance(move, interpreter.Move) and move.mode != 0 and move.start[:2] != move.end[:2]:
+            found.append((move.end[2], move.center or ()) + tuple(sorted([move.start[:2], move.end[:2]])))
+    return sorted(found)
+
+def program_stats(lines):
+    stats = interpreter.ProgramStats()
+    list(interpreter.measure(lines, stats))
+    return stats
+
+def test_contour_cuts_the_same_paths_with_fewer_rapids_and_retracts():
+    layer = list(gcode.iter_program(grid_paths(), DEPTHS, 0.5))
+    contour = list(gcode.iter_program(grid_paths(), DEPTHS, 0.5, depth_strategy='contour'))
+    assert cuts(layer) == cuts(contour)
+
+    (layer_stats, contour_stats) = (program_stats(layer), program_stats(contour))
+    assert layer_stats.retracts == 120 * len(DEPTHS)
+    assert contour_stats.retracts == 120
+    assert layer_stats.plunges == contour_stats.plunges == 120 * len(DEPTHS)
+    assert contour_stats.rapid_length < layer_stats.rapid_length / 2
+
+def test_ramp_only_plunges_open_paths():
+    ramp = list(gcode.iter_program(grid_paths(), DEPTHS, 0.5, depth_strategy='contour', ramp=True))
+    stats = program_stats(ramp)
+    assert stats.retracts == 120
+    # Closed paths feed down to the top of the material once and then ramp, open paths plunge at every depth.
+    assert stats.plunges == 80 + 40 * len(DEPTHS)
+    # Every path still ends with a full pass at the final depth.
+    flat = collections.Counter(cuts(list(gcode.iter_program(grid_paths(), DEPTHS[-1:], 0.5))))
+    assert not flat - collections.Counter(cuts(ramp))
+
+def test_unknown_depth_strategy():
+    with pytest.raises(ValueError, match='Unknown depth strategy'):
+        list(gcode.iter_program(paths(), DEPTHS, 0.5, depth_strategy='spiral'))
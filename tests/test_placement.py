@@ -0,0 +1,95 @@
+'''
+Tests for Modules.placement on the add-in's seat size and slider limits.
+'''
+import itertools
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules import placement
+
+# The seat and slider limits of StoolDesign.py.
+(WIDTH, HEIGHT) = (21, 41)
+MIN_SIZE = 2.54
+MAX_COUNT = 300
+
+def assert_circles_fit(circles, min_diameter, max_diameter, border):
+    for (x, y, radius) in circles:
+        assert min_diameter / 2 - 1e-9 <= radius <= max_diameter / 2
+        assert x - radius >= border - 1e-9 and x + radius <= WIDTH - border + 1e-9
+        assert y - radius >= border - 1e-9 and y + radius <= HEIGHT - border + 1e-9
+    for ((x1, y1, r1), (x2, y2, r2)) in itertools.combinations(circles, 2):
+        assert math.hypot(x1 - x2, y1 - y2) > r1 + r2 + border
+
+def assert_rectangles_fit(rectangles, min_size, max_width, max_height, border, spacing=0.0):
+    for (x0, y0, x1, y1) in rectangles:
+        assert min_size - 1e-9 <= x1 - x0 <= max(max_width, min_size)
+        assert min_size - 1e-9 <= y1 - y0 <= max(max_height, min_size)
+        assert x0 >= border - 1e-9 and x1 <= WIDTH - border + 1e-9
+        assert y0 >= border - 1e-9 and y1 <= HEIGHT - border + 1e-9
+    for (a, b) in itertools.combinations(rectangles, 2):
+        apart = a[2] + spacing < b[0] or b[2] + spacing < a[0] or a[3] + spacing < b[1] or b[3] + spacing < a[1]
+        assert apart, (a, b)
+
+def test_circles_do_not_overlap():
+    for (seed, border) in ((1, 0.0), (2, 0.5), (3, 1.0)):
+        circles = placement.place_circles(MAX_COUNT, MIN_SIZE, WIDTH * 0.8, WIDTH, HEIGHT, border, seed=seed)
+        assert circles
+        assert_circles_fit(circles, MIN_SIZE, WIDTH * 0.8, border)
+
+def test_small_circles_reach_the_slider_maximum():
+    circles = placement.place_circles(MAX_COUNT, 0.5, 1.0, WIDTH, HEIGHT, 0.2, seed=1)
+    assert len(circles) == MAX_COUNT
+    assert_circles_fit(circles, 0.5, 1.0, 0.2)
+
+def test_crowded_circles_fill_the_seat_in_bounded_time():
+    # Only about 70 circles of the smallest size fit, so placing stops before the count.
+    start = time.perf_counter()
+    circles = placement.place_circles(MAX_COUNT, MIN_SIZE, MIN_SIZE, WIDTH, HEIGHT, 0.2, seed=1)
+    assert time.perf_counter() - start < 2.0
+    assert 50 < len(circles) < MAX_COUNT
+    assert_circles_fit(circles, MIN_SIZE, MIN_SIZE, 0.2)
+
+def test_overlapping_circles():
+    circles = placement.place_circles(MAX_COUNT, MIN_SIZE, WIDTH * 0.8, WIDTH, HEIGHT, 0.5, allow_overlap=True, seed=1)
+    assert len(circles) == MAX_COUNT
+    for (x, y, radius) in circles:
+        assert 0.5 <= x - radius and x + radius <= WIDTH - 0.5
+        assert 0.5 <= y - radius and y + radius <= HEIGHT - 0.5
+
+def test_circles_that_cannot_fit():
+    assert placement.place_circles(10, MIN_SIZE, MIN_SIZE, WIDTH, HEIGHT, WIDTH / 2) == []
+
+def test_rectangles_do_not_overlap():
+    for (seed, border, spacing) in ((1, 0.0, 0.0), (2, 0.5, 0.0), (3, 0.5, 0.3)):
+        rectangles = placement.place_rectangles(MAX_COUNT, MIN_SIZE, WIDTH / 4, HEIGHT / 2, WIDTH, HEIGHT, border, seed=seed, spacing=spacing)
+        assert rectangles
+        assert_rectangles_fit(rectangles, MIN_SIZE, WIDTH / 4, HEIGHT / 2, border, spacing)
+
+def test_small_rectangles_reach_the_slider_maximum():
+    rectangles = placement.place_rectangles(MAX_COUNT, 0.5, 1.0, 1.0, WIDTH, HEIGHT, 0.2, seed=1)
+    assert len(rectangles) == MAX_COUNT
+    assert_rectangles_fit(rectangles, 0.5, 1.0, 1.0, 0.2)
+
+def test_crowded_rectangles_stop_in_bounded_time():
+    start = time.perf_counter()
+    rectangles = placement.place_rectangles(MAX_COUNT, MIN_SIZE, WIDTH / 4, HEIGHT / 2, WIDTH, HEIGHT, 0.5, seed=1, attempts=1000)
+    assert time.perf_counter() - start < 2.0
+    assert len(rectangles) < MAX_COUNT
+
+def test_overlapping_rectangles():
+    rectangles = placement.place_rectangles(MAX_COUNT, MIN_SIZE, WIDTH / 4, HEIGHT / 2, WIDTH, HEIGHT, 0.5, allow_overlap=True, seed=1)
+    assert len(rectangles) == MAX_COUNT
+    for (x0, y0, x1, y1) in rectangles:
+        assert 0.5 <= x0 < x1 <= WIDTH - 0.5 + 1e-9 and 0.5 <= y0 < y1 <= HEIGHT - 0.5 + 1e-9
+
+def test_same_seed_gives_the_same_placement():
+    args = (MAX_COUNT, MIN_SIZE, WIDTH * 0.8, WIDTH, HEIGHT, 0.5)
+    assert placement.place_circles(*args, seed=7) == placement.place_circles(*args, seed=7)
+    assert placement.place_circles(*args, seed=7) != placement.place_circles(*args, seed=8)
+    args = (MAX_COUNT, MIN_SIZE, WIDTH / 4, HEIGHT / 2, WIDTH, HEIGHT, 0.5)
+    assert placement.place_rectangles(*args, seed=7) == placement.place_rectangles(*args, seed=7)
+    assert placement.place_rectangles(*args, seed=7) != placement.place_rectangles(*args, seed=8)
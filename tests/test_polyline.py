@@ -0,0 +1,106 @@
+'''
+Tests for Modules.polyline.chainPolyLines against the chaining StoolDesign used to do, which
+joined each stroked curve to the first polyline it connected to and then compared every pair
+of polylines until nothing more connected.
+'''
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules.polyline import polyLine, chainPolyLines, pointTolerance
+
+def pairwise_chain(fragments, tolerance=pointTolerance):
+    polyLines = []
+    for curvePoly in fragments:
+        for poly in polyLines:
+            if poly.connect(curvePoly, tolerance):
+                break
+        else:
+            polyLines.append(curvePoly)
+
+    connected = True
+    while connected:
+        connected = False
+        for poly1 in polyLines:
+            for (index, poly2) in enumerate(polyLines):
+                if poly1 and poly2 and poly1 is not poly2:
+                    if poly1.connect(poly2, tolerance):
+                        polyLines[index] = None
+                        connected = True
+    return [poly for poly in polyLines if poly]
+
+def path(poly):
+    # The points and closed flag of a polyline, the same whichever way round it runs and,
+    # when it's closed, wherever it starts.
+    points = [tuple(round(value, 9) for value in point) for point in poly.points()]
+    if poly.isClosed:
+        ring = points[:-1]
+        return (True, min(tuple(order[start:] + order[:start]) for order in (ring, ring[::-1]) for start in range(len(ring))))
+    return (False, min(tuple(points), tuple(points[::-1])))
+
+def paths(polyLines):
+    return sorted(path(poly) for poly in polyLines)
+
+def segments(points):
+    return [[points[index], points[index + 1]] for index in range(len(points) - 1)]
+
+def fragments():
+    # A closed square, an open path with a branch off its middle, and three curves meeting at a point.
+    square = [(0, 0), (1, 0), (2, 0), (2, 1), (2, 2), (1, 2), (0, 2), (0, 1), (0, 0)]
+    branched = segments([(5, 0), (6, 0), (7, 1), (8, 1), (9, 0)]) + segments([(6, 0), (6, 1), (6, 2)])
+    meeting = [[(10, 0), (11, 0)], [(11, 0), (12, 0)], [(11, 0), (11, 1)]]
+    return segments(square) + branched + meeting
+
+def shuffled(points, seed):
+    rnd = random.Random(seed)
+    points = list(points)
+    rnd.shuffle(points)
+    return [polyLine(fragment[::-1] if rnd.random() < 0.5 else fragment) for fragment in points]
+
+def test_same_paths_as_pairwise_chaining():
+    for seed in range(200):
+        expected = paths(pairwise_chain(shuffled(fragments(), seed)))
+        assert paths(chainPolyLines(shuffled(fragments(), seed))) == expected, seed
+
+def test_same_paths_as_pairwise_chaining_on_a_grid():
+    for seed in range(100):
+        rnd = random.Random(seed)
+        lines = set()
+        for index in range(rnd.randint(3, 40)):
+            (x, y) = (rnd.randint(0, 5), rnd.randint(0, 5))
+            (dx, dy) = rnd.choice([(1, 0), (0, 1), (1, 1)])
+            lines.add(((x, y), (x + dx, y + dy)))
+        lines = sorted(list(line) for line in lines)
+        expected = paths(pairwise_chain(shuffled(lines, seed)))
+        assert paths(chainPolyLines(shuffled(lines, seed))) == expected, seed
+
+def test_closed_loop():
+    square = [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)]
+    chains = chainPolyLines(shuffled(segments(square), 1))
+    assert len(chains) == 1
+    assert chains[0].isClosed
+    assert chains[0].pointCount() == 5
+
+def test_ends_within_tolerance_connect():
+    gap = pointTolerance / 2
+    chains = chainPolyLines([polyLine([(0, 0), (1, 0)]), polyLine([(1 + gap, 0), (2, 0)])])
+    assert len(chains) == 1
+    assert chains[0].pointCount() == 3
+    assert paths(chains) == paths(pairwise_chain([polyLine([(0, 0), (1, 0)]), polyLine([(1 + gap, 0), (2, 0)])]))
+
+def test_ends_outside_tolerance_do_not_connect():
+    gap = pointTolerance * 2
+    chains = chainPolyLines([polyLine([(0, 0), (1, 0)]), polyLine([(1 + gap, 0), (2, 0)])])
+    assert len(chains) == 2
+
+def test_loop_closes_within_tolerance():
+    gap = pointTolerance / 2
+    chains = chainPolyLines([polyLine(fragment) for fragment in segments([(0, 0), (1, 0), (1, 1), (gap, 0)])])
+    assert len(chains) == 1
+    assert chains[0].isClosed
+
+def test_larger_tolerance():
+    chains = chainPolyLines([polyLine([(0, 0), (1, 0)]), polyLine([(1.004, 0), (2, 0)])], 0.005)
+    assert len(chains) == 1
@@ -0,0 +1,60 @@
+'''
+Tests for designs.PreviewThrottle with a clock that only moves when it's told to.
+'''
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules import designs
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    stand_in = Clock()
+    monkeypatch.setattr(designs.time, 'perf_counter', stand_in)
+    return stand_in
+
+def test_previews_are_drawn_at_most_every_interval(clock):
+    throttle = designs.PreviewThrottle(0.25)
+    drawn = []
+    for step in range(10):
+        if throttle.ready():
+            drawn.append(step)
+        clock.now += 0.125
+    assert drawn == [0, 2, 4, 6, 8]
+
+def test_skipped_preview_is_due_once_the_slider_stops(clock):
+    throttle = designs.PreviewThrottle(0.25)
+    assert throttle.ready()
+    assert not throttle.due()
+    clock.now += 0.125
+    assert not throttle.ready()
+    clock.now += 0.0625
+    assert not throttle.due()
+    # Another value while dragging puts it off again.
+    assert not throttle.ready()
+    clock.now += 0.125
+    assert not throttle.due()
+    clock.now += 0.125
+    assert throttle.due()
+    # Drawing it clears it.
+    assert throttle.ready()
+    assert not throttle.due()
+
+def test_cancel_forgets_the_skipped_preview(clock):
+    throttle = designs.PreviewThrottle(0.25)
+    throttle.ready()
+    clock.now += 0.125
+    assert not throttle.ready()
+    throttle.cancel()
+    clock.now += 1.0
+    assert not throttle.due()
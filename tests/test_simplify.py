@@ -0,0 +1,86 @@
+'''
+Tests for Modules.simplify.  The NumPy tests are skipped when NumPy isn't installed.
+'''
+import math
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules import simplify
+from Modules.polyline import polyLine
+
+TOLERANCE = 0.000254
+
+def wavy(count, seed=1, noise=TOLERANCE):
+    # Points along a sine curve with some noise, spaced farther apart than the tolerance.
+    rnd = random.Random(seed)
+    xs = [index * 0.01 for index in range(count)]
+    ys = [math.sin(x) + rnd.uniform(-noise, noise) for x in xs]
+    return (xs, ys)
+
+def segment_distance(x, y, ax, ay, bx, by):
+    (dx, dy) = (bx - ax, by - ay)
+    length = dx * dx + dy * dy
+    t = 0.0 if length == 0 else max(0.0, min(1.0, ((x - ax) * dx + (y - ay) * dy) / length))
+    return math.hypot(x - (ax + t * dx), y - (ay + t * dy))
+
+def assert_within_tolerance(xs, ys, keep, tolerance):
+    # Every point left out is within tolerance of the kept segment it was replaced by.
+    for (start, end) in zip(keep, keep[1:]):
+        for index in range(start + 1, end):
+            assert segment_distance(xs[index], ys[index], xs[start], ys[start], xs[end], ys[end]) <= tolerance + 1e-12
+
+def test_removed_points_are_within_tolerance():
+    (xs, ys) = wavy(500)
+    keep = simplify.simplify_indices(xs, ys, TOLERANCE)
+    assert keep[0] == 0 and keep[-1] == len(xs) - 1
+    assert keep == sorted(set(keep))
+    assert len(keep) < len(xs) / 2
+    assert_within_tolerance(xs, ys, keep, TOLERANCE)
+
+def test_larger_tolerance_keeps_fewer_points():
+    (xs, ys) = wavy(500)
+    counts = [len(simplify.simplify_indices(xs, ys, tolerance)) for tolerance in (0.0001, 0.001, 0.01)]
+    assert counts[0] > counts[1] > counts[2]
+    for tolerance in (0.0001, 0.001, 0.01):
+        assert_within_tolerance(xs, ys, simplify.simplify_indices(xs, ys, tolerance), tolerance)
+
+def test_straight_line_keeps_its_ends():
+    xs = [index * 0.1 for index in range(100)]
+    assert simplify.simplify_indices(xs, [2 * x for x in xs], TOLERANCE) == [0, 99]
+
+def test_duplicate_points_are_dropped():
+    (xs, ys) = ([0.0, 1.0, 1.0, 1.00001, 2.0, 2.0], [0.0, 0.0, 0.0, 0.0, 1.0, 1.0])
+    assert simplify.dedupe_indices(xs, ys, TOLERANCE) == [0, 1, 5]
+
+def test_closed_polyline_stays_closed():
+    points = [(math.cos(index * math.pi / 100), math.sin(index * math.pi / 100)) for index in range(200)] + [(1.0, 0.0)]
+    poly = polyLine(points)
+    assert poly.isClosed
+    simplified = simplify.simplify_polyline(poly, 0.001)
+    assert simplified.isClosed
+    assert simplified.startPoint() == poly.startPoint()
+    assert simplified.endPoint() == poly.endPoint()
+    assert 3 < simplified.pointCount() < poly.pointCount()
+
+def test_polyline_keeps_z_and_arc_center():
+    poly = polyLine([(0.0, 0.0, -0.1), (1.0, 0.0, -0.1), (2.0, 0.0, -0.1)])
+    poly.arcCenter = (5.0, 5.0)
+    simplified = simplify.simplify_polyline(poly, TOLERANCE)
+    assert simplified.points() == [(0.0, 0.0, -0.1), (2.0, 0.0, -0.1)]
+    assert simplified.arcCenter == (5.0, 5.0)
+
+def test_numpy_gives_the_same_points(monkeypatch):
+    numpy = pytest.importorskip('numpy')
+    for seed in range(10):
+        (xs, ys) = wavy(2000, seed, noise=0.001)
+        with_numpy = simplify.simplify_indices(xs, ys, TOLERANCE)
+        monkeypatch.setattr(simplify, 'numpy', None)
+        without_numpy = simplify.simplify_indices(xs, ys, TOLERANCE)
+        monkeypatch.setattr(simplify, 'numpy', numpy)
+        assert with_numpy == without_numpy
+        assert_within_tolerance(xs, ys, with_numpy, TOLERANCE)
@@ -0,0 +1,63 @@
+'''
+Tests for Modules.simulator against speed profiles worked out by hand.
+'''
+import math
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules import simulator
+
+# 120 in./min is 2 in./s and the rapid rate of 180 in./min is 3 in./s.
+LIMITS = simulator.MachineLimits(rapid_rate=180.0, acceleration=10.0, junction_deviation=0.001)
+
+def run(*lines):
+    return simulator.simulate(['g20\n', 'g1 f120\n', 'g0 x0 y0 z0\n'] + [line + '\n' for line in lines], LIMITS)
+
+def test_trapezoid():
+    # Speeding up to 2 in./s takes 0.2 s over 0.2 in. and so does stopping, leaving 9.6 in. at full speed.
+    result = run('g1 x10')
+    assert result.cut_time == pytest.approx(0.2 + 9.6 / 2 + 0.2)
+    assert result.rapid_time == 0.0
+    assert result.stats.cut_length == pytest.approx(10.0)
+
+def test_triangle():
+    # 0.1 in. is too short to reach the feed rate: it peaks at sqrt(10 * 0.1) = 1 in./s halfway.
+    assert run('g1 x0.1').cut_time == pytest.approx(0.1 + 0.1)
+
+def test_rapid():
+    # Speeding up to 3 in./s takes 0.3 s over 0.45 in., and the same to stop.
+    result = run('g0 x10')
+    assert result.rapid_time == pytest.approx(0.3 + 9.1 / 3 + 0.3)
+    assert result.stats.rapid_length == pytest.approx(10.0)
+
+def test_straight_moves_run_together():
+    assert run('g1 x4', 'g1 x10').cut_time == pytest.approx(run('g1 x10').cut_time)
+
+def test_corner():
+    # The junction deviation model gives sqrt(a * d * sin(45) / (1 - sin(45))) through a right angle.
+    sin_half = math.sqrt(0.5)
+    corner = math.sqrt(10.0 * 0.001 * sin_half / (1 - sin_half))
+    one_side = 0.2 + (2 - corner) / 10 + (10 - 0.2 - (4 - corner * corner) / 20) / 2
+    assert run('g1 x10', 'g1 y10').cut_time == pytest.approx(2 * one_side)
+
+def test_stop_for_commands_and_dwell():
+    # The spindle command stops the machine between the moves, and the dwell adds its time.
+    result = run('g1 x4', 'm5', 'g4 p2', 'g1 x10')
+    stopped = (0.2 + 3.6 / 2 + 0.2) + (0.2 + 5.6 / 2 + 0.2)
+    assert result.cut_time == pytest.approx(stopped)
+    assert result.dwell_time == pytest.approx(2.0)
+    assert result.total_time == pytest.approx(stopped + 2.0)
+
+def test_arc_speed_is_limited_by_its_radius():
+    # Half a circle of radius 0.1 in. from a stop: sqrt(10 * 0.1) = 1 in./s keeps the centripetal
+    # acceleration at 10, which takes 0.1 s over 0.05 in. to reach and to stop from.
+    result = run('g0 x0.1', 'm4', 'g3 x-0.1 y0 i-0.1 j0')
+    assert result.cut_time == pytest.approx(0.1 + (math.pi * 0.1 - 0.1) / 1.0 + 0.1)
+
+def test_millimeters():
+    result = simulator.simulate(['g21\n', 'g1 f3048\n', 'g0 x0 y0 z0\n', 'g1 x254\n'], LIMITS)
+    assert result.cut_time == pytest.approx(0.2 + 9.6 / 2 + 0.2)
@@ -0,0 +1,104 @@
+'''
+Tests for fabmo.ToolCache with find_tools replaced by stand-in tools that answer in memory.
+'''
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules import fabmo
+
+class StandInTool:
+    def __init__(self, port, answers=True):
+        self.ip = '127.0.0.1'
+        self.port = port
+        self.answers = answers
+        self.closed = False
+
+    def get_status(self):
+        if not self.answers:
+            raise Exception('The tool at 127.0.0.1:{} did not answer in time.'.format(self.port))
+        return {'state': 'idle'}
+
+    def close(self):
+        self.closed = True
+
+class StandInNetwork:
+    '''
+    Replaces find_tools, counting the calls.  The tools found are made from ports, and
+    each discovery waits for release when it's set.
+    '''
+    def __init__(self, ports):
+        self.ports = ports
+        self.calls = 0
+        self.release = None
+        self.found = []
+
+    def find_tools(self, debug=False):
+        self.calls += 1
+        if self.release is not None:
+            self.release.wait()
+        tools = [StandInTool(port, answers=port > 0) for port in self.ports]
+        self.found.extend(tools)
+        return tools
+
+def network(monkeypatch, ports):
+    stand_in = StandInNetwork(ports)
+    monkeypatch.setattr(fabmo, 'find_tools', stand_in.find_tools)
+    return stand_in
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5.0
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+def test_tools_are_found_once_within_ttl(monkeypatch):
+    stand_in = network(monkeypatch, [1, 2])
+    cache = fabmo.ToolCache(ttl=60.0)
+    first = cache.tools()
+    assert [tool.port for tool in first] == [1, 2]
+    assert cache.tools() == first
+    assert stand_in.calls == 1
+
+def test_tools_not_answering_are_dropped(monkeypatch):
+    stand_in = network(monkeypatch, [1, -2, 3])
+    cache = fabmo.ToolCache(ttl=60.0)
+    assert [tool.port for tool in cache.tools()] == [1, 3]
+    assert [tool.closed for tool in stand_in.found] == [False, True, False]
+
+def test_stale_tools_are_refreshed_in_the_background(monkeypatch):
+    stand_in = network(monkeypatch, [1, 2])
+    cache = fabmo.ToolCache(ttl=0.0)
+    first = cache.tools()
+    stand_in.ports = [2]
+    assert cache.tools() == first
+    assert wait_for(lambda: [tool.port for tool in cache.tools()] == [2])
+    # The tool that's still there keeps its connections.
+    assert cache.tools()[0] is first[1]
+    assert first[0].closed
+
+def test_refresh_finishing_after_stop_keeps_nothing(monkeypatch):
+    stand_in = network(monkeypatch, [1, 2])
+    cache = fabmo.ToolCache(ttl=0.0)
+    cache.tools()
+    stand_in.release = threading.Event()
+    cache.refresh_later()
+    assert wait_for(lambda: stand_in.calls == 2)
+    cache.stop()
+    stand_in.release.set()
+    assert wait_for(lambda: all(tool.closed for tool in stand_in.found))
+    assert cache._tools == []
+
+def test_tools_wait_for_the_search_already_running(monkeypatch):
+    stand_in = network(monkeypatch, [1, 2])
+    cache = fabmo.ToolCache(ttl=60.0)
+    stand_in.release = threading.Event()
+    cache.start()
+    assert wait_for(lambda: stand_in.calls == 1)
+    threading.Timer(0.1, stand_in.release.set).start()
+    assert [tool.port for tool in cache.tools()] == [1, 2]
+    assert stand_in.calls == 1
+    cache.stop()
@@ -0,0 +1,136 @@
+'''
+Tests for Modules.tour on seeded random paths.
+'''
+import math
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Modules import tour
+
+def random_paths(seed, count=60, loops=0.3):
+    # Open paths of a few segments and closed squares, scattered over a 40 x 40 area.
+    rnd = random.Random(seed)
+    (paths, closed) = ([], [])
+    for index in range(count):
+        (x, y) = (rnd.uniform(0, 40), rnd.uniform(0, 40))
+        if rnd.random() < loops:
+            size = rnd.uniform(0.5, 2)
+            paths.append([(x, y), (x + size, y), (x + size, y + size), (x, y + size), (x, y)])
+            closed.append(True)
+        else:
+            path = [(x, y)]
+            for segment in range(rnd.randint(1, 4)):
+                path.append((path[-1][0] + rnd.uniform(-2, 2), path[-1][1] + rnd.uniform(-2, 2)))
+            paths.append(path)
+            closed.append(False)
+    return (paths, closed)
+
+def travel(paths, closed, result, origin=(0.0, 0.0)):
+    # The rapid travel of a Tour, worked out from its order, directions and entries.
+    total = 0.0
+    last = origin
+    for (node, reverse, entry) in zip(result.order, result.reversed, result.entries):
+        path = paths[node]
+        if closed[node]:
+            (start, end) = (path[entry], path[entry])
+        else:
+            (start, end) = (path[-1], path[0]) if reverse else (path[0], path[-1])
+        total += math.hypot(start[0] - last[0], start[1] - last[1])
+        last = end
+    return total
+
+def test_every_path_is_cut_once():
+    (paths, closed) = random_paths(1)
+    result = tour.optimize_tour(paths, closed)
+    assert sorted(result.order) == list(range(len(paths)))
+    assert math.isclose(travel(paths, closed, result), result.rapid_after, abs_tol=1e-9)
+
+def test_improvement_never_lengthens_the_nearest_neighbor_tour():
+    for seed in range(20):
+        (paths, closed) = random_paths(seed)
+        greedy = tour.optimize_tour(paths, closed, max_passes=0)
+        result = tour.optimize_tour(paths, closed)
+        assert result.rapid_before == greedy.rapid_before
+        assert result.rapid_after <= result.rapid_before + 1e-9
+        assert result.rapid_after <= greedy.rapid_after + 1e-9
+
+def test_each_pass_never_lengthens_the_tour():
+    (paths, closed) = random_paths(3, count=150)
+    lengths = [tour.optimize_tour(paths, closed, max_passes=passes).rapid_after for passes in range(6)]
+    assert all(later <= earlier + 1e-9 for (earlier, later) in zip(lengths, lengths[1:]))
+
+def test_rapid_before_is_the_nearest_neighbor_tour():
+    (paths, closed) = random_paths(4)
+    result = tour.optimize_tour(paths, closed)
+    state = tour._TourState(paths, closed, (0.0, 0.0))
+    assert math.isclose(result.rapid_input, state.length())
+    state.nearest_neighbor()
+    assert math.isclose(result.rapid_before, state.length())
+    assert result.rapid_before < result.rapid_input
+
+def test_max_passes():
+    (paths, closed) = random_paths(5, count=200)
+    assert tour.optimize_tour(paths, closed, max_passes=0).passes == 0
+    assert tour.optimize_tour(paths, closed, max_passes=1).passes == 1
+    result = tour.optimize_tour(paths, closed, max_passes=tour.MAX_PASSES)
+    assert 1 <= result.passes <= tour.MAX_PASSES
+    assert not result.timed_out
+
+def test_same_paths_give_the_same_order():
+    (paths, closed) = random_paths(6, count=200)
+    first = tour.optimize_tour(paths, closed)
+    second = tour.optimize_tour(paths, closed)
+    assert (first.order, first.reversed, first.entries, first.passes) == (second.order, second.reversed, second.entries, second.passes)
+
+def test_time_budget():
+    (paths, closed) = random_paths(7, count=200)
+    result = tour.optimize_tour(paths, closed, time_budget=0.0)
+    assert result.timed_out
+    assert result.passes <= 1
+    assert sorted(result.order) == list(range(len(paths)))
+    assert not tour.optimize_tour(paths, closed, time_budget=60.0).timed_out
+
+def test_run_can_be_moved_to_the_front():
+    # The second path starts at the origin, so cutting it first saves the trip back.
+    paths = [[(5.0, 0.0), (6.0, 0.0)], [(0.0, 0.0), (1.0, 0.0)]]
+    state = tour._TourState(paths, [False, False], (0.0, 0.0))
+    pos = [0, 1]
+    assert state.move_run(1, 1, pos, lambda point: [0, 1])
+    assert state.order == [1, 0]
+    assert pos == [1, 0]
+    assert math.isclose(state.length(), 4.0)
+
+def test_loops_are_entered_at_the_best_vertex():
+    # Squares in a row, where the entry of each depends on the entry of the next.
+    paths = []
+    for index in range(4):
+        x = index * 3.0
+        paths.append([(x, 0.0), (x + 1, 0.0), (x + 1, 1.0), (x, 1.0), (x, 0.0)])
+    paths.append([(12.0, 1.0), (13.0, 1.0)])
+    closed = [True] * 4 + [False]
+    result = tour.optimize_tour(paths, closed)
+    assert math.isclose(travel(paths, closed, result), result.rapid_after)
+
+    # No loop can be entered at another vertex to shorten the tour.
+    for (index, node) in enumerate(result.order):
+        if not closed[node]:
+            continue
+        for vertex in range(4):
+            entries = list(result.entries)
+            entries[index] = vertex
+            moved = tour.Tour(result.order, result.reversed, entries, 0.0, 0.0)
+            assert travel(paths, closed, moved) >= result.rapid_after - 1e-9
+
+def test_loop_entry_uses_the_rotated_entry_of_the_next_loop():
+    # The second loop moves its entry from (2, 5) to (1, 5), after which the first loop is
+    # better entered at (-1, 2) than at (-1, 1).
+    paths = [[(-2.0, 1.0), (-1.0, 1.0), (-1.0, 2.0), (-2.0, 2.0), (-2.0, 1.0)],
+             [(1.0, 5.0), (2.0, 5.0), (2.0, 6.0), (1.0, 6.0), (1.0, 5.0)]]
+    state = tour._TourState(paths, [True, True], (0.0, 0.0))
+    state.entry = [1, 1]
+    state.rotate_loops()
+    assert state.entry == [2, 0]
+    assert math.isclose(state.length(), math.sqrt(5) + math.sqrt(13))